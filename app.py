@@ -15,7 +15,10 @@ Sgtk Application for handling Quicktime generation and review submission
 import sgtk
 import sgtk.templatekey
 import copy
+import hashlib
 import os
+import shutil
+import tempfile
 
 class MultiReviewSubmissionApp(sgtk.platform.Application):
     """
@@ -29,7 +32,8 @@ class MultiReviewSubmissionApp(sgtk.platform.Application):
         Note, this app doesn't register any commands at the moment as all it's functionality is
         provided through it's API.
         """
-        pass
+        # threads carrying on with submissions after the API call returned
+        self._background_threads = []
 
     @property
     def context_change_allowed(self):
@@ -89,7 +93,25 @@ class MultiReviewSubmissionApp(sgtk.platform.Application):
 
         :returns:               List of processed paths that have been rendered by the nuke hook.
         """
+        return self._render(path_to_frames, fields, first_frame, last_frame, comment, progress_cb, color_space)
 
+    def _render(self, path_to_frames, fields, first_frame, last_frame, comment, progress_cb, color_space=None,
+                movie_upload=None, thumbnail_folder=None):
+        """
+        Render and return the paths that are processed by the nuke hook.
+
+        :param path_to_frames:  The path where frames should be found.
+        :param fields:          Dictionary of fields to be used to fill out the template with.
+        :param first_frame:     The first frame of the sequence of frames.
+        :param last_frame:      The last frame of the sequence of frames.
+        :param comment:         A description to add to the Version in Shotgun.
+        :param progress_cb:     A callback to report progress with.
+        :param color_space:     The colorspace of the rendered frames
+        :param movie_upload:    A StreamingUpload to upload the movie with while it is being rendered.
+        :param thumbnail_folder: A folder to render a thumbnail and a filmstrip to along with the movie.
+
+        :returns:               List of processed paths that have been rendered by the nuke hook.
+        """
         tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
 
         progress_cb(10, "Preparing...")
@@ -111,11 +133,49 @@ class MultiReviewSubmissionApp(sgtk.platform.Application):
 
         fields["description"] = comment
 
+        # Render to local scratch if required, the movie is published once the render has succeeded
+        upload_only = not self.get_setting("store_on_disk")
+        output_stage = tk_multi_reviewsubmission.MovieOutputStage()
+        render_path = output_stage.get_render_path(output_path, upload_only)
+
         # Render and Submit
         renderer = tk_multi_reviewsubmission.Renderer()
-        processed_paths = renderer.render_in_nuke(path_to_frames, output_path, extra_write_node_mapping, width, height,
-                                                  first_frame, last_frame, fields.get("version", 0),
-                                                  fields.get("name", "Unnamed"), color_space, fields, progress_cb)
+        # one movie per view may be rendered
+        movie_paths = zip(renderer.get_movie_paths(render_path), renderer.get_movie_paths(output_path))
+        if movie_upload:
+            movie_upload.start(movie_paths[0][0])
+        try:
+            processed_paths = renderer.render_in_nuke(path_to_frames, render_path, extra_write_node_mapping, width,
+                                                      height, first_frame, last_frame, fields.get("version", 0),
+                                                      fields.get("name", "Unnamed"), color_space, fields, progress_cb,
+                                                      thumbnail_folder=thumbnail_folder,
+                                                      thumbnail_sizes=self.get_setting("thumbnail_sizes"),
+                                                      published_movie_path=output_path)
+        except Exception:
+            for render_movie_path, output_movie_path in movie_paths:
+                output_stage.discard(render_movie_path, output_movie_path)
+            if movie_upload:
+                movie_upload.abort()
+            raise
+        finally:
+            if movie_upload:
+                movie_upload.stop()
+
+        if render_path != output_path:
+            published_paths = {}
+            for render_movie_path, output_movie_path in movie_paths:
+                # the nuke subprocess reports paths with forward slashes
+                published_paths[render_movie_path.replace(os.sep, "/")] = output_stage.publish(
+                    render_movie_path, output_movie_path, upload_only)
+            processed_paths = [published_paths.get(path, path) for path in processed_paths]
+
+        # the extra thumbnail sizes are kept next to the movie, the submitter attaches them to
+        # the version when the movie is only uploaded
+        if thumbnail_folder and not upload_only:
+            movie_root = os.path.splitext(movie_paths[0][1])[0]
+            for key, thumbnail_path in renderer.get_thumbnail_paths(thumbnail_folder).iteritems():
+                if key.startswith("thumbnail_"):
+                    shutil.copy(thumbnail_path, "%s_%s.jpg" % (movie_root, key))
 
         return processed_paths
 
@@ -196,6 +256,11 @@ class MultiReviewSubmissionApp(sgtk.platform.Application):
         :param progress_cb:     A callback to report progress with.
         :param color_space:     The colorspace of the rendered frames
 
+        Submitting frames again with resume=True, or with the submission_key_field setting
+        configured, only redoes the steps of a failed attempt which didn't complete. Once a
+        submission is complete, submitting the same frames again creates a new version,
+        unless resume=True is passed to get the existing one.
+
         :returns:               The Version Shotgun entity dictionary that was created.
         """
         tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
@@ -216,10 +281,286 @@ class MultiReviewSubmissionApp(sgtk.platform.Application):
         if version_template:
             version_name = version_template.apply_fields(fields)
 
-        # get processed path
-        progress_cb(20, "Rendering Movie...")
-        processed_paths = self.render(path_to_frames, fields, first_frame, last_frame, sg_publishes, sg_task,
-                                      comment, thumbnail_path, progress_cb, color_space, *args, **kwargs)
+        # retrying a submission only redoes the steps which didn't complete, the frames are
+        # only fingerprinted to identify the submission when it can be resumed
+        submitter = tk_multi_reviewsubmission.Submitter()
+        submission_key = None
+        if kwargs.get("resume") or submitter.has_submission_key_field():
+            submission_key = tk_multi_reviewsubmission.get_submission_key(version_name, self.context.entity,
+                                                                          path_to_frames, first_frame, last_frame)
+        submission = tk_multi_reviewsubmission.SubmissionManifest(submission_key)
+        if submission.get("complete") or kwargs.get("resume"):
+            sg_version = submitter.find_submitted_version(submission, complete=True)
+            if sg_version and kwargs.get("resume"):
+                self.log_info("These frames have already been submitted as version %s" % sg_version["code"])
+                return sg_version
+            if sg_version:
+                self.log_info("These frames have already been submitted as version %s, submitting them again "
+                              "as a new version. Pass resume=True to get the existing version instead."
+                              % sg_version["code"])
+            if submission.get("complete"):
+                submission.restart()
+
+        # quick look submissions upload a cheap preview first and the full quality movie later
+        if kwargs.get("quick_look", self.get_setting("quick_look")) and upload_to_shotgun:
+            return self._submit_quick_look(path_to_frames, fields, first_frame, last_frame, sg_publishes, sg_task,
+                                           comment, thumbnail_path, progress_cb, color_space, version_name,
+                                           submission)
+
+        # upload the movie while it is being rendered if required
+        movie_upload = None
+        movie_paths = submission.get_movies()
+        if upload_to_shotgun and self.get_setting("stream_upload") and not movie_paths:
+            movie_upload = tk_multi_reviewsubmission.StreamingUpload()
+
+        # the progress of the render and of the upload follow how long they are expected to take
+        estimates = self.estimate_submission(first_frame, last_frame)
+        render_start, upload_start, submission_end = tk_multi_reviewsubmission.get_progress_steps(estimates)
+
+        # render the thumbnails in the same pass as the movie if required, they are kept
+        # with the submission so that a retry reusing the movies still uploads them
+        thumbnail_folder = None
+        if self.get_setting("render_thumbnails"):
+            thumbnail_folder = submission.get_thumbnail_folder()
+
+        try:
+            if movie_paths:
+                self.log_info("Reusing the movies rendered by an earlier attempt of this submission")
+            else:
+                # get processed paths
+                progress_cb(render_start, "Rendering Movie, about %s..."
+                            % tk_multi_reviewsubmission.format_duration(estimates["render"]))
+                if thumbnail_folder:
+                    shutil.rmtree(thumbnail_folder, ignore_errors=True)
+                    os.makedirs(thumbnail_folder)
+                movie_paths = self._render_movies(path_to_frames, fields, first_frame, last_frame, comment,
+                                                  tk_multi_reviewsubmission.scale_progress(progress_cb, render_start,
+                                                                                           upload_start),
+                                                  color_space, movie_upload, thumbnail_folder)
+                submission.set_movies(movie_paths)
+
+            rendered_thumbnails = None
+            if thumbnail_folder:
+                rendered_thumbnails = tk_multi_reviewsubmission.Renderer.get_thumbnail_paths(thumbnail_folder)
+
+            # Submit Version
+            upload_seconds = 0
+            if upload_to_shotgun:
+                upload_seconds = tk_multi_reviewsubmission.get_throughput_model().estimate_upload(
+                    sum(os.path.getsize(movie_path) for movie_path in movie_paths))
+            progress_cb(upload_start, "Creating Shotgun Version and uploading movie, about %s..."
+                        % tk_multi_reviewsubmission.format_duration(upload_seconds))
+            sg_version = submitter.submit_version(path_to_frames, movie_paths[0], thumbnail_path,
+                                                  sg_publishes, sg_task, comment,
+                                                  store_on_disk, first_frame, last_frame, upload_to_shotgun,
+                                                  version_name, movie_upload, movie_paths[1:], rendered_thumbnails,
+                                                  submission)
+            submitter.complete_submission(sg_version, submission)
+            if thumbnail_folder:
+                shutil.rmtree(thumbnail_folder, ignore_errors=True)
+        finally:
+            if movie_upload:
+                # gives the connection of the upload back if it was never linked
+                movie_upload.abort()
+            
+        # Remove from filesystem if required
+        for movie_path in movie_paths:
+            if not store_on_disk and os.path.exists(movie_path):
+                progress_cb(submission_end, "Deleting rendered movie")
+                os.unlink(movie_path)
+
+        # log metrics for this app's usage
+        try:
+            self.log_metric("Render & Submit Version", log_version=True)
+        except:
+            # ignore any errors. ex: metrics logging not supported
+            pass
+
+        return sg_version
+
+    def estimate_submission(self, first_frame, last_frame):
+        """
+        Estimate how long a submission will take on this host, from the speeds measured
+        during the previous submissions of the show.
+
+        :param first_frame:     The first frame of the sequence of frames.
+        :param last_frame:      The last frame of the sequence of frames.
+
+        :returns:               Dictionary with the "render" and "upload" estimates, in seconds.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
+
+        # views packed into a single movie make its frames wider or taller
+        renderer = tk_multi_reviewsubmission.Renderer()
+        width, height = renderer.get_output_size(self.get_setting("movie_width"), self.get_setting("movie_height"))
+        upload_only = not self.get_setting("store_on_disk")
+        codec_profile = renderer.get_codec_profile(last_frame - first_frame + 1, width, height, upload_only)
+
+        # the slate is rendered too, once per movie
+        frame_count = last_frame - first_frame + 2
+        views = renderer.get_view_settings()
+        if views and views['packing'] == 'separate':
+            frame_count *= len(views['names'])
+
+        model = tk_multi_reviewsubmission.get_throughput_model()
+        estimates = {"render": model.estimate_render(frame_count, width, height, codec_profile), "upload": 0.0}
+        if self.get_setting("upload_to_shotgun"):
+            estimates["upload"] = model.estimate_upload(model.estimate_movie_size(frame_count, width, height,
+                                                                                  codec_profile))
+        return estimates
+
+    def order_submissions(self, submissions):
+        """
+        Order the submissions of a batch so that the longest ones start first, which keeps
+        the whole batch as short as possible when submissions run concurrently.
+
+        :param submissions:     List of dictionaries with at least the "first_frame" and "last_frame"
+                                of each submission, e.g. the arguments of render_and_submit_path().
+
+        :returns:               New list of the submissions, the longest one first.
+        """
+        def _estimate(submission):
+            return sum(self.estimate_submission(submission["first_frame"], submission["last_frame"]).values())
+
+        return sorted(submissions, key=_estimate, reverse=True)
+
+    def benchmark_codec_profiles(self, path_to_frames, first_frame, last_frame, color_space=None):
+        """
+        Encode a short sequence with every codec profile of the codec_settings_hook and save
+        how fast each one is on this host, so that profiles are selected according to it.
+
+        :param path_to_frames:  The path where frames should be found.
+        :param first_frame:     The first frame of the sequence of frames.
+        :param last_frame:      The last frame of the sequence of frames.
+        :param color_space:     The colorspace of the frames
+
+        :returns:               Dictionary of profile names and their measured encode speed.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
+
+        def _log_progress(percent=None, msg=None, **kwargs):
+            if msg:
+                self.log_debug("Codec benchmark: %s" % msg)
+
+        renderer = tk_multi_reviewsubmission.Renderer()
+        width, height = renderer.get_output_size(self.get_setting("movie_width"), self.get_setting("movie_height"))
+
+        benchmark_folder = tempfile.mkdtemp(dir=tk_multi_reviewsubmission.get_scratch_folder("codec_profiles"))
+        calibration = {}
+        try:
+            for codec_profile in sorted(renderer.get_codec_profiles()):
+                movie_path = os.path.join(benchmark_folder, "%s.mov" % codec_profile)
+                renderer.render_in_nuke(path_to_frames, movie_path, {}, self.get_setting("movie_width"),
+                                        self.get_setting("movie_height"), first_frame, last_frame, 0,
+                                        "benchmark", color_space, {}, _log_progress, codec_profile=codec_profile)
+                # only the frames are timed, from the first frame written to the last one, so
+                # that the startup of Nuke doesn't count towards the encode speed
+                timing = renderer.get_last_render_timing()
+                if not timing or timing[1] <= 0:
+                    self.log_warning("Codec profile '%s' rendered too few frames to be timed" % codec_profile)
+                    continue
+                frame_count, seconds = timing
+                movie_size = sum(os.path.getsize(path) for path in renderer.get_movie_paths(movie_path)
+                                 if os.path.isfile(path))
+                calibration[codec_profile] = {
+                    "seconds": seconds,
+                    "frames_per_second": frame_count / seconds,
+                    "pixels_per_second": frame_count * width * height / seconds,
+                    "bytes_per_frame": movie_size / (last_frame - first_frame + 1),
+                }
+                self.log_info("Codec profile '%s': %.1f frames/s, %.0fKB/frame"
+                              % (codec_profile, frame_count / seconds,
+                                 movie_size / (last_frame - first_frame + 1) / 1024.0))
+        finally:
+            shutil.rmtree(benchmark_folder, ignore_errors=True)
+
+        renderer.save_codec_calibration(calibration)
+        return calibration
+
+    def build_dailies_reel(self, items, path_to_reel, sg_task, comment, progress_cb, codec_profile=None,
+                           thumbnail_path=None):
+        """
+        Assemble a dailies reel from review movies which have already been rendered, copying
+        their streams instead of re-encoding them, and submit it as its own Version. Only the
+        slate cards shown before each movie are rendered.
+
+        :param items:           List of Version entity dictionaries and movie paths, in reel order.
+                                Versions must have their movie stored on disk.
+        :param path_to_reel:    The path where the reel should be written to.
+        :param sg_task:         A Shotgun task object to link against. Can be None.
+        :param comment:         A description to add to the Version in Shotgun.
+        :param progress_cb:     A callback to report progress with.
+        :param codec_profile:   Codec profile the movies were encoded with, None to use the
+                                codec_profile setting. Required if the setting is auto, as the
+                                profile selected for each movie isn't known anymore.
+        :param thumbnail_path:  The path to a thumbnail to use for the version when the reel isn't
+                                being uploaded to Shotgun.
+
+        :returns:               The Version Shotgun entity dictionary that was created.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
+
+        if not codec_profile:
+            codec_profile = self.get_setting("codec_profile")
+            if codec_profile == "auto":
+                # the slate cards must be encoded like the movies, guessing could make them differ
+                raise Exception("The codec_profile setting is auto, pass the codec profile the movies of the reel "
+                                "were encoded with!")
+
+        progress_cb(10, "Assembling dailies reel")
+        reel_builder = tk_multi_reviewsubmission.ReelBuilder()
+        frame_count = reel_builder.build(items, path_to_reel, codec_profile, self.get_setting("reel_slate_frames"))
+        self.log_info("Assembled %s from %d movies, %d frames" % (path_to_reel, len(items), frame_count))
+
+        progress_cb(50, "Creating Shotgun Version and uploading reel")
+        submitter = tk_multi_reviewsubmission.Submitter()
+        store_on_disk = self.get_setting("store_on_disk")
+        sg_version = submitter.submit_version(None, path_to_reel, thumbnail_path, [], sg_task, comment,
+                                              store_on_disk, 1, frame_count, self.get_setting("upload_to_shotgun"))
+
+        # Remove from filesystem if required
+        if not store_on_disk and os.path.exists(path_to_reel):
+            progress_cb(90, "Deleting assembled reel")
+            os.unlink(path_to_reel)
+
+        progress_cb(100, "Submitted dailies reel")
+        return sg_version
+
+    def wait_for_background_submissions(self):
+        """
+        Blocks until the work carried on in the background by earlier submissions, e.g.
+        the full quality phase of quick look submissions, is done.
+
+        :returns:               List of errors reported by the background work.
+        """
+        errors = []
+        while self._background_threads:
+            thread = self._background_threads.pop(0)
+            thread.wait()
+            errors.extend(thread.get_errors())
+        return errors
+
+    def _render_movies(self, path_to_frames, fields, first_frame, last_frame, comment, progress_cb, color_space=None,
+                       movie_upload=None, thumbnail_folder=None):
+        """
+        Render the movies and return their paths, making sure all expected movies have been rendered.
+
+        :param path_to_frames:  The path where frames should be found.
+        :param fields:          Dictionary of fields to be used to fill out the template with.
+        :param first_frame:     The first frame of the sequence of frames.
+        :param last_frame:      The last frame of the sequence of frames.
+        :param comment:         A description to add to the Version in Shotgun.
+        :param progress_cb:     A callback to report progress with.
+        :param color_space:     The colorspace of the rendered frames
+        :param movie_upload:    A StreamingUpload to upload the movie with while it is being rendered.
+        :param thumbnail_folder: A folder to render a thumbnail and a filmstrip to along with the movie.
+
+        :returns:               List of movie paths, with the movie of the first view first.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
+
+        processed_paths = self._render(path_to_frames, fields, first_frame, last_frame, comment, progress_cb,
+                                       color_space, movie_upload, thumbnail_folder)
 
         # Make sure we don't overwrite the caller's fields
         fields = copy.copy(fields)
@@ -234,32 +575,188 @@ class MultiReviewSubmissionApp(sgtk.platform.Application):
         output_path_template = self.get_template("movie_path_template")
         output_path = output_path_template.apply_fields(fields)
 
-        if output_path not in processed_paths:
+        # the movies stay in local scratch if they are only rendered to be uploaded,
+        # there is one movie per view unless the views are packed into a single one
+        output_stage = tk_multi_reviewsubmission.MovieOutputStage()
+        renderer = tk_multi_reviewsubmission.Renderer()
+        store_on_disk = self.get_setting("store_on_disk")
+        movie_paths = [output_stage.get_movie_path(movie_path, not store_on_disk)
+                       for movie_path in renderer.get_movie_paths(output_path)]
+
+        if [movie_path for movie_path in movie_paths if movie_path not in processed_paths]:
             # this case should never happen since the templates are setup by TDs
             # But if it does, this is just a safety net.
             raise Exception("tk-multi-reviewsubmission is not configured to render a movie! Please contact your TD.")
 
-        # Submit Version
-        progress_cb(50, "Creating Shotgun Version and uploading movie")
+        return movie_paths
+
+    def _submit_quick_look(self, path_to_frames, fields, first_frame, last_frame, sg_publishes, sg_task, comment,
+                           thumbnail_path, progress_cb, color_space, version_name, submission):
+        """
+        Submit a Version with a cheap, reduced resolution preview movie so that reviews can
+        start right away, and replace it with the full quality movie in the background.
+        Retries reuse the preview movie and the Version of an earlier attempt, and go
+        straight to the full quality movie if the preview has already been submitted.
+
+        The current phase is stored in the "review_phase" key of the returned Version
+        and in the field defined by the review_phase_field setting.
+
+        :param path_to_frames:  The path where frames should be found.
+        :param fields:          Dictionary of fields to be used to fill out the template with.
+        :param first_frame:     The first frame of the sequence of frames.
+        :param last_frame:      The last frame of the sequence of frames.
+        :param sg_publishes:    A list of shotgun published file objects to link the publish against.
+        :param sg_task:         A Shotgun task object to link against. Can be None.
+        :param comment:         A description to add to the Version in Shotgun.
+        :param thumbnail_path:  The path to a thumbnail to use for the version when the movie isn't
+                                being uploaded to Shotgun (this is set in the config)
+        :param progress_cb:     A callback to report progress with.
+        :param color_space:     The colorspace of the rendered frames
+        :param version_name:    The name of the Version entity, None to derive it from the movie name.
+        :param submission:      The SubmissionManifest tracking the steps of the submission.
+
+        :returns:               The Version Shotgun entity dictionary that was created.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
         submitter = tk_multi_reviewsubmission.Submitter()
-        sg_version = submitter.submit_version(path_to_frames, output_path, thumbnail_path,
-                                              sg_publishes, sg_task, comment,
-                                              store_on_disk, first_frame, last_frame, upload_to_shotgun, version_name)
-            
-        # Remove from filesystem if required
-        if not store_on_disk and os.path.exists(output_path):
-            progress_cb(90, "Deleting rendered movie")
-            os.unlink(output_path)
 
-        # log metrics for this app's usage
-        try:
-            self.log_metric("Render & Submit Version", log_version=True)
-        except:
-            # ignore any errors. ex: metrics logging not supported
-            pass
+        sg_version = None
+        if submission.get("quick_look_complete"):
+            sg_version = submitter.find_submitted_version(submission)
+        if sg_version:
+            self.log_info("The quick look movie has already been submitted as version %s" % sg_version["code"])
+        else:
+            sg_version = self._submit_quick_look_movie(path_to_frames, fields, first_frame, last_frame, sg_publishes,
+                                                       sg_task, comment, thumbnail_path, progress_cb, color_space,
+                                                       version_name, submission)
+        submitter.set_review_phase(sg_version, "quick_look")
+
+        # Render and upload the full quality movie in the background
+        progress_cb(90, "Rendering full quality movie in the background")
+        thread = tk_multi_reviewsubmission.BackgroundSubmissionThread(
+            self, "Full quality submission of %s" % sg_version["code"], self._submit_full_quality, sg_version,
+            path_to_frames, fields, first_frame, last_frame, comment, color_space, submission)
+        self._background_threads.append(thread)
+        thread.start()
 
         return sg_version
 
+    def _submit_quick_look_movie(self, path_to_frames, fields, first_frame, last_frame, sg_publishes, sg_task,
+                                 comment, thumbnail_path, progress_cb, color_space, version_name, submission):
+        """
+        Render the preview movie of a quick look submission and submit the Version with it,
+        see _submit_quick_look().
+
+        :returns:               The Version Shotgun entity dictionary that was created.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
+
+        # Reduced resolution, kept even for the sake of the codecs
+        scale = self.get_setting("quick_look_scale")
+        width = max(2, int(self.get_setting("movie_width") * scale) / 2 * 2)
+        height = max(2, int(self.get_setting("movie_height") * scale) / 2 * 2)
+
+        # The preview gets the name of the final movie
+        movie_fields = copy.copy(fields)
+        movie_fields["width"] = self.get_setting("movie_width")
+        movie_fields["height"] = self.get_setting("movie_height")
+        output_path = self.get_template("movie_path_template").apply_fields(movie_fields)
+        quick_look_folder = tk_multi_reviewsubmission.get_scratch_folder(
+            "quick_look", hashlib.sha1(output_path).hexdigest()[:12])
+        quick_look_path = os.path.join(quick_look_folder, os.path.basename(output_path))
+
+        # The thumbnails rendered with the preview make the Version browsable right away,
+        # the full quality movie is rendered with thumbnails of its own
+        thumbnail_folder = None
+        if self.get_setting("render_thumbnails"):
+            thumbnail_folder = os.path.join(quick_look_folder, "thumbnails")
+
+        renderer = tk_multi_reviewsubmission.Renderer()
+        quick_look_paths = submission.get_movies("quick_look_movies")
+        if quick_look_paths:
+            self.log_info("Reusing the quick look movie rendered by an earlier attempt of this submission")
+        else:
+            progress_cb(20, "Rendering quick look movie...")
+            if thumbnail_folder:
+                shutil.rmtree(thumbnail_folder, ignore_errors=True)
+            renderer.render_in_nuke(path_to_frames, quick_look_path, {}, width, height, first_frame, last_frame,
+                                    fields.get("version", 0), fields.get("name", "Unnamed"), color_space,
+                                    copy.copy(fields), tk_multi_reviewsubmission.scale_progress(progress_cb, 20, 50),
+                                    frame_step=self.get_setting("quick_look_frame_step"),
+                                    thumbnail_folder=thumbnail_folder, codec_profile="speed")
+            quick_look_paths = renderer.get_movie_paths(quick_look_path)[:1]
+            submission.set_movies(quick_look_paths, "quick_look_movies")
+
+        rendered_thumbnails = None
+        if thumbnail_folder:
+            rendered_thumbnails = renderer.get_thumbnail_paths(thumbnail_folder)
+
+        # The quick look version never points at the preview on disk
+        progress_cb(50, "Creating Shotgun Version and uploading quick look movie")
+        submitter = tk_multi_reviewsubmission.Submitter()
+        sg_version = submitter.submit_version(path_to_frames, quick_look_paths[0], thumbnail_path, sg_publishes,
+                                              sg_task, comment, False, first_frame, last_frame, True, version_name,
+                                              rendered_thumbnails=rendered_thumbnails, submission=submission)
+        submission.set("quick_look_complete", True)
+        shutil.rmtree(quick_look_folder, ignore_errors=True)
+        return sg_version
+
+    def _submit_full_quality(self, sg_version, path_to_frames, fields, first_frame, last_frame, comment,
+                             color_space, submission):
+        """
+        Render the full quality movie of a quick look submission and replace the preview
+        movie of its Version with it. Runs in a background thread.
+
+        :param sg_version:      The Version created with the quick look movie.
+        :param path_to_frames:  The path where frames should be found.
+        :param fields:          Dictionary of fields to be used to fill out the template with.
+        :param first_frame:     The first frame of the sequence of frames.
+        :param last_frame:      The last frame of the sequence of frames.
+        :param comment:         A description to add to the Version in Shotgun.
+        :param color_space:     The colorspace of the rendered frames
+        :param submission:      The SubmissionManifest tracking the steps of the submission.
+        """
+        tk_multi_reviewsubmission = self.import_module("tk_multi_reviewsubmission")
+
+        def _log_progress(percent=None, msg=None, **kwargs):
+            # the caller's progress callback belongs to the UI thread
+            if msg:
+                self.log_debug("%s: %s" % (sg_version["code"], msg))
+
+        store_on_disk = self.get_setting("store_on_disk")
+        thumbnail_folder = None
+        if self.get_setting("render_thumbnails"):
+            thumbnail_folder = submission.get_thumbnail_folder()
+
+        movie_paths = submission.get_movies()
+        if movie_paths:
+            self.log_info("Reusing the full quality movies rendered by an earlier attempt of %s"
+                          % sg_version["code"])
+        else:
+            if thumbnail_folder:
+                shutil.rmtree(thumbnail_folder, ignore_errors=True)
+                os.makedirs(thumbnail_folder)
+            movie_paths = self._render_movies(path_to_frames, fields, first_frame, last_frame, comment,
+                                              _log_progress, color_space, thumbnail_folder=thumbnail_folder)
+            submission.set_movies(movie_paths)
+
+        rendered_thumbnails = None
+        if thumbnail_folder:
+            rendered_thumbnails = tk_multi_reviewsubmission.Renderer.get_thumbnail_paths(thumbnail_folder)
+
+        submitter = tk_multi_reviewsubmission.Submitter()
+        submitter.replace_movie(sg_version, movie_paths[0], store_on_disk, movie_paths[1:], rendered_thumbnails)
+        submitter.set_review_phase(sg_version, "full")
+        submitter.complete_submission(sg_version, submission)
+        if thumbnail_folder:
+            shutil.rmtree(thumbnail_folder, ignore_errors=True)
+
+        for movie_path in movie_paths:
+            if not store_on_disk and os.path.exists(movie_path):
+                os.unlink(movie_path)
+
+        self.log_info("Replaced the quick look movie of %s with the full quality movie." % sg_version["code"])
+
     def render_and_submit_version(self, template, fields, first_frame, last_frame, sg_publishes, sg_task,
                                   comment, thumbnail_path, progress_cb, color_space=None, *args, **kwargs):
         """
@@ -12,24 +12,99 @@
 Hook that controls various codec settings when submitting items for review
 """
 import sgtk
+import multiprocessing
 import os
 import sys
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
+# Number of cores of the host, the speed profile leaves half of them to other renders
+_CPU_COUNT = multiprocessing.cpu_count()
+
+# Codec profiles, from the fastest to encode to the best looking. The quality range is
+# the quantizer range of the jpeg codec, lower is better, the encoder picks the quantizer
+# per frame within it. All profiles use the same codec and pixel format, so that movies
+# encoded with different profiles can still be concatenated into a reel. Threads is the
+# number of threads Nuke renders and encodes with, 0 to let Nuke use all the cores.
+CODEC_PROFILES = {
+    "speed": {
+        "description": "Fastest encode, for movies which are only uploaded to Shotgun. Quick look "
+                       "previews use it while the full quality movie of an earlier submission "
+                       "may be rendering in the background, so it only takes half of the cores.",
+        "quality_min": "4",
+        "quality_max": "8",
+        "threads": max(1, _CPU_COUNT / 2),
+    },
+    "balanced": {
+        "description": "Default quality, the movie every review submission used to get.",
+        "quality_min": "2",
+        "quality_max": "3",
+        "threads": 0,
+    },
+    "archival": {
+        "description": "Best quality, for movies kept on disk when the encode is cheap enough. "
+                       "Every frame gets the finest quantizer.",
+        "quality_min": "1",
+        "quality_max": "1",
+        "threads": 0,
+    },
+}
+
+# renders of up to this many pixels, e.g. 48 HD frames, always get the archival profile
+SHORT_RENDER_PIXELS = 48 * 1920 * 1080
+
+# extra encode time the archival profile may cost over the balanced one, in seconds
+ARCHIVAL_EXTRA_SECONDS = 30
+
+
 class CodecSettings(HookBaseClass):
 
-    def get_quicktime_settings(self, **kwargs):
+    def get_codec_profiles(self, **kwargs):
+        """
+        Returns the codec profiles the movies can be encoded with, as a dictionary of
+        profile names and settings. The "threads" key of the settings sets the number
+        of threads of the Nuke subprocess.
+        """
+        return CODEC_PROFILES
+
+    def select_codec_profile(self, frame_count, width, height, upload_only, calibration=None, **kwargs):
+        """
+        Returns the name of the codec profile to encode a movie with.
+
+        :param frame_count: Number of frames of the movie
+        :param width:       Movie width
+        :param height:      Movie height
+        :param upload_only: True if the movie is only rendered to be uploaded to Shotgun
+        :param calibration: Encode speeds measured on this host by benchmark_codec_profiles(), if any,
+                            as a dictionary of profile names and "pixels_per_second"
+        """
+        if upload_only:
+            # Shotgun transcodes uploaded movies anyway, spend as little as possible on them
+            return "speed"
+
+        pixel_count = frame_count * width * height
+        if calibration and "balanced" in calibration and "archival" in calibration:
+            extra_seconds = (pixel_count / calibration["archival"]["pixels_per_second"] -
+                             pixel_count / calibration["balanced"]["pixels_per_second"])
+            return "archival" if extra_seconds <= ARCHIVAL_EXTRA_SECONDS else "balanced"
+
+        return "archival" if pixel_count <= SHORT_RENDER_PIXELS else "balanced"
+
+    def get_quicktime_settings(self, profile="balanced", **kwargs):
         """
         Allows modifying default codec settings for Quicktime generation.
         Returns a dictionary of settings to be used for the Write Node that generates
         the Quicktime in Nuke.
+
+        :param profile: Name of the codec profile to encode the movie with
         """
         # This hook file gets loaded even if overriden in sgtk_config.
         # import causes error if not launched from nuke.
         # Therefore, moving the import into the function.
         import nuke
 
+        codec_profile = CODEC_PROFILES.get(profile, CODEC_PROFILES["balanced"])
+
         settings = {}
         if sys.platform in ["darwin", "win32"]:
             settings["file_type"] = "mov"
@@ -37,7 +112,8 @@ class CodecSettings(HookBaseClass):
                 # Nuke 9.0v1 changed the codec knob name to meta_codec and added an encoder knob
                 # (which defaults to the new mov64 encoder/decoder).                  
                 settings["meta_codec"] = "jpeg"
-                settings["mov64_quality_max"] = "3"
+                settings["mov64_quality_min"] = codec_profile["quality_min"]
+                settings["mov64_quality_max"] = codec_profile["quality_max"]
             else:
                 settings["codec"] = "jpeg"
 
@@ -47,7 +123,8 @@ class CodecSettings(HookBaseClass):
                 # http://help.thefoundry.co.uk/nuke/9.0/#appendices/appendixc/supported_file_formats.html
                 settings["file_type"] = "mov64"
                 settings["mov64_codec"] = "jpeg"
-                settings["mov64_quality_max"] = "3"
+                settings["mov64_quality_min"] = codec_profile["quality_min"]
+                settings["mov64_quality_max"] = codec_profile["quality_max"]
             else:
                 # the 'codec' knob name was changed to 'format' in Nuke 7.0
                 settings["file_type"] = "ffmpeg"
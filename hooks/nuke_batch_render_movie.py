@@ -1,6 +1,11 @@
+import hashlib
+import imp
+import json
 import os
 import pickle
+import shutil
 import sys
+import time
 import traceback
 import getopt
 
@@ -9,6 +14,22 @@ from sgtk.util.filesystem import ensure_folder_exists
 
 import nuke
 
+# seconds to wait for the app to stage a frame before copying it from the network ourselves
+STAGED_FRAME_TIMEOUT = 30
+
+# number of pixels of the test pattern compared when measuring the accuracy of a baked LUT
+LUT_ACCURACY_SAMPLES = 4096
+
+# scene linear ranges the accuracy of a baked LUT is measured over, the cineon shaper
+# in front of the LUT covers linear values up to about 13.5
+LUT_ACCURACY_RANGES = (1.0, 8.0)
+
+# width of each frame of a filmstrip thumbnail, as expected by Shotgun
+FILMSTRIP_FRAME_WIDTH = 240
+
+# frame specifier helpers of the app, loaded from the path given in the render info
+_framespec = None
+
 
 def __create_scale_node(width, height):
     """
@@ -59,6 +80,392 @@ def __create_output_node(path, codec_settings, logger=None):
     return node
 
 
+def __expand_frame_path(path, frame):
+    """
+    Resolve the frame specifiers of a sequence path for the given frame, the same way
+    the app does.
+    """
+    return _framespec.expand_frame_path(path, frame)
+
+
+def __get_source_frame(frame, held_frames):
+    """
+    Returns the frame read for the given frame, the first frame of its hold if it is held.
+    """
+    for start, end, source_frame in held_frames:
+        if start <= frame <= end:
+            return source_frame
+    return frame
+
+
+def __create_held_frame_expression(held_frames):
+    """
+    Returns a Read node frame expression reading the first frame of each hold for
+    all its held frames. The terms are summed rather than nested, so that the
+    expression stays flat however many holds there are.
+    """
+    terms = ["(frame>=%d&&frame<=%d)*(frame-%d)" % (start, end, source_frame)
+             for start, end, source_frame in held_frames]
+    return "frame-%s" % "-".join(terms)
+
+
+def __wait_for_staged_frame(staged_frames_path, staging, held_frames, read_name):
+    """
+    Before frame render callback making sure the frame about to be read has been
+    staged to local scratch. Frames the app hasn't staged in time are copied from
+    the network here, so the render never reads a partial or missing frame. Frames
+    which can't be staged at all are read from the network.
+    """
+    # frames outside the range (e.g. the slate) are held on the first/last frame by the Read node
+    frame = min(max(int(nuke.frame()), staging['first_frame']), staging['last_frame'])
+    frame = __get_source_frame(frame, held_frames)
+    staged_path = __expand_frame_path(staged_frames_path, frame)
+    source_path = __expand_frame_path(staging['source_path'], frame)
+
+    if not __stage_frame(staged_path, source_path, staging):
+        __set_read_path(read_name, staging['source_path'])
+    else:
+        __set_read_path(read_name, staged_frames_path)
+
+
+def __stage_frame(staged_path, source_path, staging):
+    """
+    Waits for a frame to be staged, copying it from the network if the app doesn't in time.
+
+    :return: False if the frame must be read from the network
+    """
+    deadline = time.time() + STAGED_FRAME_TIMEOUT
+    while not os.path.isfile(staged_path):
+        if not os.path.isfile(source_path):
+            # missing on the network too, let the Read node handle it
+            return True
+        if os.path.exists(staged_path + staging['failed_suffix']):
+            # the app couldn't stage it, e.g. the scratch disk is full
+            return False
+        if time.time() > deadline:
+            temp_path = "%s.%d.tmp" % (staged_path, os.getpid())
+            try:
+                shutil.copy2(source_path, temp_path)
+                os.rename(temp_path, staged_path)
+            except (IOError, OSError):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return False
+            return True
+        time.sleep(0.1)
+    return True
+
+
+def __set_read_path(read_name, frames_path):
+    """
+    Points the Read node at the staged frames or at the frames on the network.
+    """
+    read = nuke.toNode(read_name)
+    if read["file"].value() != frames_path:
+        read["file"].setValue(frames_path)
+
+
+def __report_frame_rendered(node_name):
+    """
+    After frame render callback telling the app a frame of the movie has been written,
+    for it to estimate the time left.
+    """
+    if nuke.thisNode().name() == node_name:
+        sys.stderr.write("[FRAME_RENDERED] %d\n" % int(nuke.frame()))
+        sys.stderr.flush()
+
+
+def __get_color_config_key():
+    """
+    Identify the color configuration used to convert colorspaces in this session.
+    """
+    root_node = nuke.root()
+    config_path = os.environ.get("OCIO", "")
+    if root_node.knob("customOCIOConfigPath") and root_node["customOCIOConfigPath"].value():
+        config_path = root_node["customOCIOConfigPath"].value()
+
+    config_key = [nuke.NUKE_VERSION_STRING, config_path]
+    if root_node.knob("OCIO_config"):
+        config_key.append(root_node["OCIO_config"].value())
+    if config_path and os.path.isfile(config_path):
+        config_key.append(str(os.path.getmtime(config_path)))
+    return config_key
+
+
+def __create_lut_shaper_node(input_node, operation):
+    """
+    Create the cineon log shaper which the baked LUT lattice is laid out in, so that
+    scene linear values above 1.0 reach the LUT instead of being clipped to its domain.
+
+    :param operation: "lin2log" in front of the LUT, "log2lin" when baking it
+    """
+    shaper = nuke.nodes.Log2Lin(operation=operation)
+    shaper.setInput(0, input_node)
+    return shaper
+
+
+def __measure_lut_accuracy(color_space, display, lut_path, cube_size):
+    """
+    Compare a baked LUT with the exact colorspace transform on a test pattern
+    denser than the LUT lattice, scaled to each of the linear ranges of
+    LUT_ACCURACY_RANGES so that values above 1.0 are measured as well.
+
+    :return: Dictionary with the maximum and mean absolute difference, overall
+             and for the samples above 1.0
+    """
+    max_delta = 0.0
+    max_delta_above_one = 0.0
+    total_delta = 0.0
+    sample_count = 0
+    for linear_range in LUT_ACCURACY_RANGES:
+        pattern = nuke.nodes.CMSTestPattern()
+        pattern["cube_size"].setValue(min(cube_size * 2, 64))
+        scaled = nuke.nodes.Multiply(value=linear_range)
+        scaled.setInput(0, pattern)
+
+        exact = nuke.nodes.OCIOColorSpace(in_colorspace=str(color_space), out_colorspace=str(display))
+        exact.setInput(0, scaled)
+
+        shaper = __create_lut_shaper_node(scaled, "lin2log")
+        baked = nuke.nodes.Vectorfield(vfield_file=lut_path)
+        baked.setInput(0, shaper)
+
+        try:
+            width = pattern.width()
+            height = pattern.height()
+            step = max(1, int(((width * height) / float(LUT_ACCURACY_SAMPLES)) ** 0.5))
+
+            for y in range(0, height, step):
+                for x in range(0, width, step):
+                    above_one = False
+                    for channel in ("rgba.red", "rgba.green", "rgba.blue"):
+                        above_one = above_one or scaled.sample(channel, x + 0.5, y + 0.5) > 1.0
+                    for channel in ("rgba.red", "rgba.green", "rgba.blue"):
+                        delta = abs(exact.sample(channel, x + 0.5, y + 0.5) - baked.sample(channel, x + 0.5, y + 0.5))
+                        max_delta = max(max_delta, delta)
+                        if above_one:
+                            max_delta_above_one = max(max_delta_above_one, delta)
+                        total_delta += delta
+                        sample_count += 1
+        finally:
+            for node in (baked, shaper, exact, scaled, pattern):
+                nuke.delete(node)
+
+    return {'max_delta': max_delta, 'mean_delta': total_delta / max(sample_count, 1),
+            'max_delta_above_one': max_delta_above_one}
+
+
+def __get_baked_lut(color_space, lut_info):
+    """
+    Get a 3D LUT baking the conversion from the colorspace of the source frames to the
+    review display colorspace, generating it if it isn't in the LUT cache yet.
+
+    :param color_space: Colorspace of the input frames
+    :param lut_info:    LUT cache folder, display colorspace and LUT size
+    :return:            Dictionary with the path to the LUT and its accuracy
+    """
+    display = lut_info['display']
+    cube_size = lut_info['cube_size']
+    lut_key = __get_color_config_key() + [str(color_space), str(display), str(cube_size), "cineon_shaper"]
+    lut_name = hashlib.sha1("\n".join(lut_key)).hexdigest()
+    lut_path = os.path.join(lut_info['cache_dir'], lut_name + ".cube").replace(os.sep, "/")
+    accuracy_path = os.path.join(lut_info['cache_dir'], lut_name + ".json")
+
+    if os.path.isfile(lut_path) and os.path.isfile(accuracy_path):
+        with open(accuracy_path) as accuracy_file:
+            lut = json.load(accuracy_file)
+        lut['cached'] = True
+        return lut
+
+    ensure_folder_exists(lut_info['cache_dir'])
+    # bake to a temporary file so that concurrent renders never read a partial LUT
+    temp_path = "%s.%d.cube" % (lut_path[:-len(".cube")], os.getpid())
+
+    # the lattice covers the log encoded range, expanded back to linear before the transform
+    pattern = nuke.nodes.CMSTestPattern()
+    pattern["cube_size"].setValue(cube_size)
+    shaper = __create_lut_shaper_node(pattern, "log2lin")
+    transform = nuke.nodes.OCIOColorSpace(in_colorspace=str(color_space), out_colorspace=str(display))
+    transform.setInput(0, shaper)
+    generate = nuke.nodes.GenerateLUT(file=temp_path, file_type=".cube")
+    generate.setInput(0, transform)
+    try:
+        nuke.execute(generate, 1, 1)
+    finally:
+        for node in (generate, transform, shaper, pattern):
+            nuke.delete(node)
+    os.rename(temp_path, lut_path)
+
+    lut = {'path': lut_path, 'color_space': color_space, 'display': display, 'cube_size': cube_size}
+    lut.update(__measure_lut_accuracy(color_space, display, lut_path, cube_size))
+    with open(accuracy_path + ".tmp%d" % os.getpid(), "w") as accuracy_file:
+        json.dump(lut, accuracy_file)
+    os.rename(accuracy_path + ".tmp%d" % os.getpid(), accuracy_path)
+
+    lut['cached'] = False
+    return lut
+
+
+def __create_view_packing_node(input_node, view_names, packing, width, height):
+    """
+    Create the nodes packing all the views into a single image, side by side or over under.
+    """
+    sheet = nuke.nodes.ContactSheet()
+    for index, view_name in enumerate(view_names):
+        one_view = nuke.nodes.OneView(view=view_name)
+        one_view.setInput(0, input_node)
+        sheet.setInput(index, one_view)
+
+    if packing == "side_by_side":
+        sheet["rows"].setValue(1)
+        sheet["columns"].setValue(len(view_names))
+        sheet["width"].setValue(width * len(view_names))
+        sheet["height"].setValue(height)
+    else:
+        sheet["rows"].setValue(len(view_names))
+        sheet["columns"].setValue(1)
+        sheet["width"].setValue(width)
+        sheet["height"].setValue(height * len(view_names))
+    sheet["roworder"].setValue("TopBottom")
+    sheet["gap"].setValue(0)
+    return sheet
+
+
+def __get_thumbnail_frames(first_frame, last_frame, frame_step, frame_count):
+    """
+    Returns the rendered frames the filmstrip is made of, evenly spread over the range.
+    """
+    rendered_frames = range(first_frame, last_frame + 1, frame_step)
+    frame_count = max(1, min(frame_count, len(rendered_frames)))
+    return sorted(set(rendered_frames[index * len(rendered_frames) / frame_count]
+                      for index in range(frame_count)))
+
+
+def __get_thumbnail_frames_path(thumbnails):
+    """
+    Returns the path of the jpegs written for the thumbnail frames.
+    """
+    return "%s/frames/thumbnail.%%04d.jpg" % thumbnails['folder']
+
+
+def __create_thumbnail_nodes(input_node, thumbnails, frames, width, view_name, raw):
+    """
+    Create the branch writing small jpegs of the thumbnail frames while the movie is rendered.
+    """
+    scale = nuke.nodes.Reformat()
+    scale["type"].setValue("scale")
+    scale["scale"].setValue(min(1.0, thumbnails['width'] / float(width)))
+    scale.setInput(0, input_node)
+
+    write = nuke.nodes.Write(file_type="jpeg")
+    write["file"].setValue(__get_thumbnail_frames_path(thumbnails))
+    if write.knob("_jpeg_quality"):
+        write["_jpeg_quality"].setValue(0.9)
+    if write.knob("views"):
+        write["views"].fromScript(view_name)
+    write["raw"].setValue(raw)
+    # only the thumbnail frames are written, the other frames don't even reach the Reformat
+    write["disable"].setExpression("!(%s)" % "||".join("frame==%d" % frame for frame in frames))
+    write.setInput(0, scale)
+    return write
+
+
+def __get_thumbnail_size_path(thumbnails, size):
+    """
+    Returns the path of the poster frame scaled to one of the extra thumbnail sizes.
+    """
+    return "%s/thumbnail_%d.jpg" % (thumbnails['folder'], size)
+
+
+def __create_thumbnail_size_nodes(input_node, thumbnails, poster_frame, width, view_name, raw):
+    """
+    Create the branches writing the poster frame at each of the extra thumbnail sizes while
+    the movie is rendered.
+    """
+    writes = []
+    for size in thumbnails.get('sizes', []):
+        scale = nuke.nodes.Reformat()
+        scale["type"].setValue("scale")
+        scale["scale"].setValue(min(1.0, size / float(width)))
+        scale.setInput(0, input_node)
+
+        write = nuke.nodes.Write(file_type="jpeg")
+        write["file"].setValue(__get_thumbnail_size_path(thumbnails, size))
+        if write.knob("views"):
+            write["views"].fromScript(view_name)
+        write["raw"].setValue(raw)
+        write["disable"].setExpression("frame!=%d" % poster_frame)
+        write.setInput(0, scale)
+        writes.append(write)
+    return writes
+
+
+def __assemble_filmstrip(frames_path, frames, filmstrip_path):
+    """
+    Lay the thumbnail frames out into a filmstrip. Only the small jpegs written during the
+    render are read, the source frames aren't decoded again.
+    """
+    read = nuke.nodes.Read(file=frames_path, first=frames[0], last=frames[-1])
+    read["on_error"].setValue("black")
+    frame_height = max(1, FILMSTRIP_FRAME_WIDTH * read.height() / max(1, read.width()))
+
+    nodes = [read]
+    sheet = nuke.nodes.ContactSheet()
+    for index, frame in enumerate(frames):
+        hold = nuke.nodes.FrameHold(first_frame=frame)
+        hold.setInput(0, read)
+        sheet.setInput(index, hold)
+        nodes.append(hold)
+    sheet["rows"].setValue(1)
+    sheet["columns"].setValue(len(frames))
+    sheet["width"].setValue(FILMSTRIP_FRAME_WIDTH * len(frames))
+    sheet["height"].setValue(frame_height)
+    sheet["gap"].setValue(0)
+
+    write = nuke.nodes.Write(file_type="jpeg", file=filmstrip_path)
+    write.setInput(0, sheet)
+    nodes.extend([sheet, write])
+    try:
+        nuke.execute(write, frames[0], frames[0])
+    finally:
+        for node in nodes:
+            nuke.delete(node)
+
+
+def __collect_render_profile(group, wall_time, memory_before):
+    """
+    Gather the performance timers of all the nodes of the render graph. Nuke has no per
+    node memory figures, only the usage of the whole session is recorded.
+
+    :param group:         Group holding the render graph
+    :param wall_time:     Wall clock time taken by the render, in seconds
+    :param memory_before: Memory used by Nuke before the render, in bytes
+    :return:              Dictionary with the render totals and the per node timings
+    """
+    nodes = []
+    for node in nuke.allNodes(group=group, recurseGroups=True):
+        # timings are reported in microseconds
+        info = node.performanceInfo(nuke.PROFILE_ENGINE)
+        if not info.get('callCount'):
+            continue
+        nodes.append({
+            'name': node.fullName(),
+            'class': node.Class(),
+            'calls': info['callCount'],
+            'wall': info['timeTakenWall'] / 1000000.0,
+            'cpu': info['timeTakenCPU'] / 1000000.0,
+        })
+    nodes.sort(key=lambda node_info: node_info['wall'], reverse=True)
+
+    return {
+        'wall': wall_time,
+        'memory_before': memory_before,
+        'memory_after': nuke.memory("usage"),
+        'memory_max': nuke.memory("max_usage"),
+        'nodes': nodes,
+    }
+
+
 def render_in_nuke(path_to_frames, path_to_movie, extra_write_node_mapping, width, height, first_frame, last_frame,
                    version, name, color_space, app_settings, ctx, render_info, is_subprocess=False):
     """
@@ -83,8 +490,17 @@ def render_in_nuke(path_to_frames, path_to_movie, extra_write_node_mapping, widt
     :return:               Status of the nuke script execution
     """
 
+    global _framespec
+
     output_node = None
+    thumbnail_node = None
+    thumbnail_size_nodes = []
+    thumbnail_paths = None
+    color_lut = None
+    profile = None
     try:
+        _framespec = imp.load_source("tk_multi_reviewsubmission_framespec", render_info['framespec_path'])
+
         root_node = nuke.root()
 
         if is_subprocess:
@@ -92,6 +508,25 @@ def render_in_nuke(path_to_frames, path_to_movie, extra_write_node_mapping, widt
             root_node["first_frame"].setValue(first_frame)
             root_node["last_frame"].setValue(last_frame)
 
+        # set up the views to render, only the first one unless told otherwise
+        views = render_info.get('views')
+        render_views = [nuke.views()[0]]
+        output_paths = [path_to_movie]
+        if views:
+            for view_name in views['names']:
+                if view_name not in nuke.views():
+                    nuke.addView(view_name)
+            if views['packing'] == 'separate':
+                render_views = views['names']
+                output_paths = [path_to_movie.replace("%V", view_name).replace("%v", view_name[:1])
+                                for view_name in views['names']]
+            else:
+                render_views = [views['names'][0]]
+
+        if color_space and render_info.get('color_lut'):
+            # the colorspace conversion is applied as a cached LUT after the downscale
+            color_lut = __get_baked_lut(color_space, render_info['color_lut'])
+
         # create group where everything happens
         group = nuke.nodes.Group()
 
@@ -104,9 +539,20 @@ def render_in_nuke(path_to_frames, path_to_movie, extra_write_node_mapping, widt
             read["on_error"].setValue("black")
             read["first"].setValue(first_frame)
             read["last"].setValue(last_frame)
-            if color_space:
+            if color_lut:
+                read["raw"].setValue(True)
+            elif color_space:
                 read["colorspace"].setValue(str(color_space))
 
+            # held frames read the first frame of their hold, the burnin is still evaluated per frame
+            held_frames = render_info.get('held_frames') or []
+            if held_frames:
+                read["frame_mode"].setValue("expression")
+                read["frame"].setValue(__create_held_frame_expression(held_frames))
+                if read.knob("cached"):
+                    # keep the decoded frame around for the rest of the hold
+                    read["cached"].setValue(True)
+
             if is_subprocess:
                 # set root_format = res of read node
                 read_format = read.format()
@@ -172,19 +618,88 @@ def render_in_nuke(path_to_frames, path_to_movie, extra_write_node_mapping, widt
             scale = __create_scale_node(width, height)
             scale.setInput(0, burn)
 
+            # Convert to the display colorspace at the output resolution
+            if color_lut:
+                lut_node = nuke.nodes.Vectorfield(vfield_file=color_lut['path'])
+                lut_node.setInput(0, __create_lut_shaper_node(scale, "lin2log"))
+                scale = lut_node
+
+            # Write the thumbnail frames of the first view in the same pass
+            thumbnails = render_info.get('thumbnails')
+            if thumbnails:
+                thumbnail_frames = __get_thumbnail_frames(first_frame, last_frame, render_info.get('frame_step', 1),
+                                                          thumbnails['filmstrip_frame_count'])
+                thumbnail_node = __create_thumbnail_nodes(scale, thumbnails, thumbnail_frames, width,
+                                                          render_views[0], bool(color_lut))
+                # the frame in the middle of the filmstrip is the poster frame
+                thumbnail_size_nodes = __create_thumbnail_size_nodes(
+                    scale, thumbnails, thumbnail_frames[len(thumbnail_frames) / 2], width, render_views[0],
+                    bool(color_lut))
+
+            # Pack the views into a single movie if required
+            if views and views['packing'] != 'separate':
+                scale = __create_view_packing_node(scale, views['names'], views['packing'], width, height)
+
             # Create the output node
             output_node = __create_output_node(path_to_movie, render_info.get('codec_settings', {}))
             output_node.setInput(0, scale)
+            if color_lut:
+                # the LUT already converted to the display colorspace
+                output_node["raw"].setValue(True)
         finally:
             group.end()
 
-        if output_node:
-            # Make sure the output folder exists
-            output_folder = os.path.dirname(path_to_movie)
-            ensure_folder_exists(output_folder)
+        staging = render_info.get('staging')
+        if output_node and staging:
+            # source frames are being staged to local scratch while we render
+            staging_args = (path_to_frames.replace(os.sep, "/"), staging, held_frames, read.fullName())
+            nuke.addBeforeFrameRender(__wait_for_staged_frame, staging_args, nodeClass='Write')
 
-            # Render the outputs, first view only
-            nuke.executeMultiple([output_node], ([first_frame - 1, last_frame, 1],), [nuke.views()[0]])
+        if output_node:
+            nuke.addAfterFrameRender(__report_frame_rendered, (output_node.name(),), nodeClass='Write')
+
+            # Make sure the output folders exist
+            for output_path in output_paths:
+                ensure_folder_exists(os.path.dirname(output_path))
+            if thumbnail_node:
+                ensure_folder_exists(os.path.dirname(__get_thumbnail_frames_path(thumbnails)))
+
+            if render_info.get('profile'):
+                nuke.resetPerformanceTimers()
+                nuke.startPerformanceTimers()
+                memory_before = nuke.memory("usage")
+                render_start = time.time()
+
+            # Render the outputs
+            try:
+                # the slate is always rendered, frames may be skipped for quick previews
+                frame_step = render_info.get('frame_step', 1)
+                if frame_step == 1:
+                    frame_ranges = ([first_frame - 1, last_frame, 1],)
+                else:
+                    frame_ranges = ([first_frame - 1, first_frame - 1, 1], [first_frame, last_frame, frame_step])
+                nuke.executeMultiple(filter(None, [output_node, thumbnail_node]) + thumbnail_size_nodes,
+                                    frame_ranges, render_views)
+                if render_info.get('profile'):
+                    profile = __collect_render_profile(group, time.time() - render_start, memory_before)
+            finally:
+                nuke.removeAfterFrameRender(__report_frame_rendered, (output_node.name(),), nodeClass='Write')
+                if staging:
+                    nuke.removeBeforeFrameRender(__wait_for_staged_frame, staging_args, nodeClass='Write')
+                if render_info.get('profile'):
+                    nuke.stopPerformanceTimers()
+
+            if thumbnail_node:
+                thumbnail_paths = {
+                    'thumbnail': "%s/thumbnail.jpg" % thumbnails['folder'],
+                    'filmstrip': "%s/filmstrip.jpg" % thumbnails['folder'],
+                }
+                for size in thumbnails.get('sizes', []):
+                    thumbnail_paths['thumbnail_%d' % size] = __get_thumbnail_size_path(thumbnails, size)
+                frames_path = __get_thumbnail_frames_path(thumbnails)
+                __assemble_filmstrip(frames_path, thumbnail_frames, thumbnail_paths['filmstrip'])
+                shutil.copy(__expand_frame_path(frames_path, thumbnail_frames[len(thumbnail_frames) / 2]),
+                            thumbnail_paths['thumbnail'])
 
         # Cleanup after ourselves
         nuke.delete(group)
@@ -192,7 +707,14 @@ def render_in_nuke(path_to_frames, path_to_movie, extra_write_node_mapping, widt
         return {'status': 'ERROR', 'error_msg': '{0}'.format(traceback.format_exc()),
             'output_path': path_to_movie}
 
-    return {'status': 'OK'}
+    ret_status = {'status': 'OK', 'output_paths': output_paths}
+    if color_lut:
+        ret_status['color_lut'] = color_lut
+    if profile:
+        ret_status['profile'] = profile
+    if thumbnail_paths:
+        ret_status['thumbnails'] = thumbnail_paths
+    return ret_status
 
 
 def get_usage():
@@ -261,7 +783,8 @@ if __name__ == '__main__':
     sys.stderr.write('')
     sys.stderr.write('[RETURN_STATUS_DATA]{0}[RETURN_STATUS_DATA]'.format(ret_status))
     sys.stderr.write('')
-    sys.stderr.write('[PROCESSED_PATHS]{0}[PROCESSED_PATHS]'.format(input_data['path_to_movie']))
+    processed_paths = ret_status.get('output_paths', [input_data['path_to_movie']])
+    sys.stderr.write('[PROCESSED_PATHS]{0}[PROCESSED_PATHS]'.format(':'.join(processed_paths)))
     sys.stderr.write('')
 
     if ret_status.get('status', '') == 'OK':
@@ -0,0 +1,139 @@
+import getopt
+import os
+import pickle
+import sys
+import traceback
+
+import nuke
+
+
+def __create_output_node(path, codec_settings):
+    """
+    Create the Nuke output node for the card, with the same settings as the review movies.
+    """
+    wn_settings = codec_settings.get('quicktime', {})
+
+    node = nuke.nodes.Write(file_type=wn_settings.get("file_type", ''))
+
+    # apply any additional knob settings provided by the hook. Now that the knob has been
+    # created, we can be sure specific file_type settings will be valid.
+    for knob_name, knob_value in wn_settings.iteritems():
+        if knob_name != "file_type":
+            node.knob(knob_name).setValue(knob_value)
+
+    node["file"].setValue(path.replace(os.sep, "/"))
+    return node
+
+
+def __escape_message(text):
+    """
+    Escape a text so that the Text node doesn't evaluate it as TCL.
+    """
+    return text.replace("\\", "\\\\").replace("[", "\\[").replace("]", "\\]")
+
+
+def render_slate_card(path_to_movie, width, height, fps, frame_count, text, render_info):
+    """
+    Use Nuke to render a short movie showing a text, e.g. the slate card between two
+    shots of a reel.
+
+    :param path_to_movie: Path to the output movie that will be rendered
+    :param width:         Width of the output movie
+    :param height:        Height of the output movie
+    :param fps:           Frame rate of the output movie
+    :param frame_count:   Number of frames of the output movie
+    :param text:          Text shown on the card
+    :param render_info:   Font and codec settings for the movie
+
+    :return:              Status of the nuke script execution
+    """
+    try:
+        root_node = nuke.root()
+        root_node["first_frame"].setValue(1)
+        root_node["last_frame"].setValue(frame_count)
+        root_node["fps"].setValue(fps)
+
+        card_format = nuke.addFormat("%d %d 1 SLATE_CARD_FORMAT" % (width, height))
+        root_node["format"].setValue(card_format)
+
+        background = nuke.nodes.Constant(format="SLATE_CARD_FORMAT")
+        background["color"].setValue([0, 0, 0, 1])
+
+        message = nuke.nodes.Text(message=__escape_message(text))
+        message["font"].setValue(render_info.get('slate_font'))
+        message["size"].setValue(max(12, height / 16))
+        message["xjustify"].setValue("center")
+        message["yjustify"].setValue("center")
+        message["box"].setValue([0, 0, width, height])
+        message.setInput(0, background)
+
+        output_node = __create_output_node(path_to_movie, render_info.get('codec_settings', {}))
+        output_node.setInput(0, message)
+
+        try:
+            nuke.execute(output_node, 1, frame_count)
+        finally:
+            for node in (output_node, message, background):
+                nuke.delete(node)
+    except:
+        return {'status': 'ERROR', 'error_msg': '{0}'.format(traceback.format_exc()),
+                'output_path': path_to_movie}
+
+    return {'status': 'OK', 'output_paths': [path_to_movie]}
+
+
+def get_usage():
+    return '''
+  Usage: python {0} [ OPTIONS ]
+         -h | --help ... print this usage message and exit.
+         --path_to_movie <OUTPUT_MOVIE_PATH> ... specify full path to output movie
+         --width <WIDTH> ... specify width for output movie
+         --height <HEIGHT> ... specify height for output movie
+         --fps <FPS> ... specify frame rate for output movie
+         --frame_count <FRAME_COUNT> ... specify number of frames of the output movie
+         --text <TEXT> ... specify text shown on the card
+         --render_info <RENDER_INFO> ... specify render info from the Toolkit app calling this
+'''.format(os.path.basename(sys.argv[0]))
+
+
+if __name__ == '__main__':
+    data_keys = ['path_to_movie', 'width', 'height', 'fps', 'frame_count', 'text', 'render_info']
+
+    short_opt_str = "h"
+    long_opt_list = ['help'] + ['{0}='.format(k) for k in data_keys]
+
+    input_data = {}
+    try:
+        opt_list, arg_list = getopt.getopt(sys.argv[1:], short_opt_str, long_opt_list)
+    except getopt.GetoptError as err:
+        sys.stderr.write(str(err))
+        sys.stderr.write(get_usage())
+        sys.exit(1)
+
+    for opt, opt_value in opt_list:
+        if opt in ('-h', '--help'):
+            print get_usage()
+            sys.exit(0)
+        elif opt.replace('--', '') in data_keys:
+            input_data[opt.replace('--', '')] = pickle.loads(opt_value)
+
+    for d_key in data_keys:
+        if d_key not in input_data:
+            sys.stderr.write('ERROR - missing input argument for "--{0}". Aborting'.format(d_key))
+            sys.stderr.write(get_usage())
+            sys.exit(2)
+
+    # Hack to ensure all output/error from this process can be captured when called as subprocess
+    print ''
+    ret_status = render_slate_card(input_data['path_to_movie'], input_data['width'], input_data['height'],
+                                   input_data['fps'], input_data['frame_count'], input_data['text'],
+                                   input_data['render_info'])
+
+    sys.stderr.write('[RETURN_STATUS_DATA]{0}[RETURN_STATUS_DATA]'.format(ret_status))
+    processed_paths = ret_status.get('output_paths', [input_data['path_to_movie']])
+    sys.stderr.write('[PROCESSED_PATHS]{0}[PROCESSED_PATHS]'.format(':'.join(processed_paths)))
+
+    if ret_status.get('status', '') == 'OK':
+        sys.exit(0)
+    else:
+        sys.exit(3)
@@ -8,5 +8,12 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+from .background import BackgroundSubmissionThread
+from .manifest import SubmissionManifest, get_submission_key
+from .output import MovieOutputStage
+from .reel import ReelBuilder
 from .renderer import Renderer
-from .submitter import Submitter
\ No newline at end of file
+from .staging import get_scratch_folder
+from .streaming import StreamingUpload
+from .submitter import Submitter
+from .throughput import format_duration, get_progress_steps, get_throughput_model, scale_progress
\ No newline at end of file
@@ -0,0 +1,54 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Work carried on after a submission call has returned.
+"""
+import traceback
+
+from sgtk.platform.qt import QtCore
+
+
+class BackgroundSubmissionThread(QtCore.QThread):
+    """
+    Worker thread running the remaining steps of a submission, e.g. the full
+    quality render of a quick look submission, without blocking the caller.
+    """
+    def __init__(self, app, description, callback, *args, **kwargs):
+        """
+        Construction
+
+        :param app:         The app running the submission
+        :param description: Short description of the work, used in log messages
+        :param callback:    Callable doing the work in this thread
+        """
+        QtCore.QThread.__init__(self)
+        self._app = app
+        self._description = description
+        self._callback = callback
+        self._args = args
+        self._kwargs = kwargs
+        self._errors = []
+
+    def get_errors(self):
+        """
+        can be called after execution to retrieve a list of errors
+        """
+        return self._errors
+
+    def run(self):
+        """
+        Thread loop
+        """
+        try:
+            self._callback(*self._args, **self._kwargs)
+        except Exception:
+            self._errors.append("%s failed:\n%s" % (self._description, traceback.format_exc()))
+            self._app.log_error(self._errors[-1])
@@ -0,0 +1,165 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Shotgun connections shared by the submitter and uploader threads, and caching of
+lookups which don't change during a session.
+"""
+import contextlib
+import threading
+import time
+
+import sgtk
+
+# maximum number of idle connections kept around
+_MAX_IDLE_CONNECTIONS = 8
+
+_pool_lock = threading.Lock()
+_connection_pool = None
+_session_cache = None
+
+
+class ShotgunConnectionPool(object):
+    """
+    Hands out Shotgun connections so that no two threads ever share one.
+
+    shotgun_api3 connections aren't thread safe. Connections are created on demand,
+    authenticated as the current user, and reused once they have been released.
+    """
+
+    def __init__(self, max_idle=_MAX_IDLE_CONNECTIONS):
+        """
+        Construction
+
+        :param max_idle: Maximum number of idle connections kept for reuse
+        """
+        self._max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns a connection for the exclusive use of the caller.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._create_connection()
+
+    def release(self, connection):
+        """
+        Returns a connection obtained from acquire() to the pool.
+        """
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                self._idle.append(connection)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Context manager acquiring a connection and releasing it afterwards.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    @staticmethod
+    def _create_connection():
+        """
+        Creates a new connection for the current user.
+        """
+        user = sgtk.get_authenticated_user() if hasattr(sgtk, "get_authenticated_user") else None
+        if user:
+            return user.create_sg_connection()
+        return sgtk.util.shotgun.create_sg_connection()
+
+
+class SessionCache(object):
+    """
+    Thread safe cache of Shotgun lookups, each entry expiring after a time to live.
+    """
+
+    def __init__(self, ttl):
+        """
+        Construction
+
+        :param ttl: Seconds after which cached values are looked up again
+        """
+        self.ttl = ttl
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, lookup):
+        """
+        Returns the cached value for the given key, looking it up if it isn't cached
+        or has expired. Concurrent callers of the same key wait for a single lookup,
+        lookups of different keys run concurrently.
+
+        :param key:    Hashable key of the value
+        :param lookup: Callable returning the value
+        :return:       The value
+        """
+        with self._lock:
+            cached = self._values.get(key)
+            if cached and time.time() - cached[0] < self.ttl:
+                return cached[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # lookups of other keys go on while this one runs
+        with key_lock:
+            with self._lock:
+                cached = self._values.get(key)
+                if cached and time.time() - cached[0] < self.ttl:
+                    # looked up by another caller while we were waiting
+                    return cached[1]
+
+            value = lookup()
+            with self._lock:
+                self._values[key] = (time.time(), value)
+            return value
+
+    def invalidate(self, key=None):
+        """
+        Forgets a cached value, or all of them if no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+
+def get_connection_pool():
+    """
+    Returns the Shotgun connection pool shared by all submissions of this session.
+    """
+    global _connection_pool
+    with _pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ShotgunConnectionPool()
+        return _connection_pool
+
+
+def get_session_cache():
+    """
+    Returns the lookup cache shared by all submissions of this session.
+    """
+    global _session_cache
+    app = sgtk.platform.current_bundle()
+    with _pool_lock:
+        if _session_cache is None:
+            _session_cache = SessionCache(app.get_setting("shotgun_cache_ttl"))
+        else:
+            # pick up configuration changes
+            _session_cache.ttl = app.get_setting("shotgun_cache_ttl")
+        return _session_cache
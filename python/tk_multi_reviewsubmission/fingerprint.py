@@ -0,0 +1,131 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Cheap fingerprinting of source frames, used to find held frames and to identify
+submissions.
+"""
+import filecmp
+import hashlib
+import os
+from multiprocessing.pool import ThreadPool
+
+from .framespec import expand_frame_path
+
+# number of blocks hashed per frame, spread evenly over the file
+_SAMPLE_COUNT = 4
+
+# size of each hashed block
+_SAMPLE_SIZE = 16 * 1024
+
+
+def fingerprint_file(path):
+    """
+    Returns a fingerprint of a file made of its size and a hash of a few blocks
+    sampled across it, so that only a small part of the file has to be read.
+
+    :param path: Path to the file
+    :return:     Fingerprint string, None if the file doesn't exist
+    """
+    if not os.path.isfile(path):
+        return None
+
+    file_size = os.path.getsize(path)
+    content_hash = hashlib.sha1()
+    with open(path, "rb") as sampled_file:
+        for index in range(_SAMPLE_COUNT):
+            sampled_file.seek(max(0, file_size - _SAMPLE_SIZE) * index / max(1, _SAMPLE_COUNT - 1))
+            content_hash.update(sampled_file.read(_SAMPLE_SIZE))
+    return "%d:%s" % (file_size, content_hash.hexdigest())
+
+
+def fingerprint_sequence(path_to_frames, first_frame, last_frame):
+    """
+    Returns a fingerprint of a frame range made of the size and modification time
+    of every frame, so that it changes whenever a frame is rendered again.
+
+    :param path_to_frames: The path where frames should be found
+    :param first_frame:    The first frame of the sequence of frames
+    :param last_frame:     The last frame of the sequence of frames
+    :return:               Fingerprint string
+    """
+    sequence_hash = hashlib.sha1()
+    for frame in range(first_frame, last_frame + 1):
+        frame_path = expand_frame_path(path_to_frames, frame)
+        if os.path.isfile(frame_path):
+            frame_stat = os.stat(frame_path)
+            sequence_hash.update("%d:%d:%d;" % (frame, frame_stat.st_size, int(frame_stat.st_mtime)))
+        else:
+            sequence_hash.update("%d:missing;" % frame)
+    return sequence_hash.hexdigest()
+
+
+def find_held_frames(path_to_frames, first_frame, last_frame, thread_count=8):
+    """
+    Finds the runs of frames which are identical to the frame before them.
+
+    Sizes are checked first, only frames as large as the frame before them are
+    sampled, and frames whose samples match the frame before them are compared
+    byte for byte before being declared held, as uncompressed frames of the same
+    size can share their sampled blocks. The sampling and the comparisons are
+    spread over a pool of threads.
+
+    :param path_to_frames: The path where frames should be found
+    :param first_frame:    The first frame of the sequence of frames
+    :param last_frame:     The last frame of the sequence of frames
+    :param thread_count:   Number of frames sampled concurrently
+    :return:               List of (first held frame, last held frame, source frame) tuples
+    """
+    frame_paths = dict((frame, expand_frame_path(path_to_frames, frame))
+                       for frame in range(first_frame, last_frame + 1))
+    sizes = dict((frame, os.path.getsize(path) if os.path.isfile(path) else None)
+                 for frame, path in frame_paths.iteritems())
+
+    # a frame can only be a hold if it has the same size as the frame before it
+    candidates = set()
+    for frame in range(first_frame + 1, last_frame + 1):
+        if sizes[frame] is not None and sizes[frame] == sizes[frame - 1]:
+            candidates.update([frame - 1, frame])
+    if not candidates:
+        return []
+
+    pool = ThreadPool(thread_count)
+    try:
+        sampled_frames = sorted(candidates)
+        fingerprints = dict(zip(sampled_frames, pool.map(fingerprint_file,
+                                                         [frame_paths[frame] for frame in sampled_frames])))
+        sampled_holds = [frame for frame in sampled_frames
+                         if fingerprints[frame] is not None and fingerprints[frame] == fingerprints.get(frame - 1)]
+        held_frames = set(frame for frame, identical in zip(sampled_holds, pool.map(
+            _is_same_content, [(frame_paths[frame - 1], frame_paths[frame]) for frame in sampled_holds]))
+            if identical)
+    finally:
+        pool.close()
+        pool.join()
+
+    held_runs = []
+    for frame in range(first_frame + 1, last_frame + 1):
+        if frame not in held_frames:
+            continue
+        if held_runs and held_runs[-1][1] == frame - 1:
+            # the hold goes on, keep reading the frame the run started from
+            held_runs[-1] = (held_runs[-1][0], frame, held_runs[-1][2])
+        else:
+            held_runs.append((frame, frame, frame - 1))
+    return held_runs
+
+
+def _is_same_content(paths):
+    """
+    Compares two files byte for byte, stopping at the first difference.
+
+    :param paths: Tuple of the paths of the two files
+    """
+    return filecmp.cmp(paths[0], paths[1], shallow=False)
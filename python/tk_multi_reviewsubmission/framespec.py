@@ -0,0 +1,35 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Frame specifiers of sequence paths. This module doesn't import anything from
+Toolkit, so that the render script running in Nuke can load it from its path.
+"""
+import re
+
+# matches the frame specifiers nuke understands, e.g. %04d, %d or ####
+FRAME_SPEC_REGEX = re.compile(r"%0?\d*d|#+")
+
+
+def expand_frame_path(path, frame):
+    """
+    Resolves the frame specifiers of a sequence path for the given frame.
+
+    :param path:  Sequence path, e.g. /path/to/frames.%04d.exr
+    :param frame: Frame number to substitute
+    :return:      Path to the single frame
+    """
+    def _replace(match):
+        spec = match.group(0)
+        if spec.startswith("%"):
+            return spec % frame
+        return "%0*d" % (len(spec), frame)
+
+    return FRAME_SPEC_REGEX.sub(_replace, path)
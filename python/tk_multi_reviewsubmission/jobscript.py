@@ -0,0 +1,307 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Self-contained Nuke job scripts rendering a review movie, executed with nuke -x
+instead of building the node graph from Python in every render. They are kept
+after the render, so that it can be replayed and profiled offline.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+# matches the per shot values of a skeleton
+_TOKEN_REGEX = re.compile(r"@@([A-Z_]+)@@")
+
+# matches the name of the top level group of a burnin script
+_BURNIN_GROUP_REGEX = re.compile(r"^Group \{\n(?: .*\n)*? name (\S+)\n", re.MULTILINE)
+
+# matches the header of the top level group of a burnin script, with its number of inputs if it is saved
+_BURNIN_GROUP_HEADER_REGEX = re.compile(r"^Group \{\n(?: inputs \d+\n)?", re.MULTILINE)
+
+# matches the lines a script copied from the node graph starts with, which connect the
+# pasted nodes to the selected node and only make sense when pasted in the node graph
+_CUT_PASTE_REGEX = re.compile(r"^(?:set cut_paste_input \[stack 0\]|push \$cut_paste_input)\n", re.MULTILINE)
+
+# matches the version of Nuke a script was saved with
+_VERSION_REGEX = re.compile(r"^version (.+)\n", re.MULTILINE)
+
+# version of the job scripts whose burnin script doesn't say, the one the burnin of the app is saved with
+_DEFAULT_SCRIPT_VERSION = "6.3 v7"
+
+# text nodes of the burnin script, as set up by the render script
+_BURNIN_FONT_NODES = ("top_left_text", "top_right_text", "bottom_left_text", "framecounter", "slate_info")
+
+# makes the root format the format of the source frames, which the burnin is laid out for
+_ON_SCRIPT_LOAD = """source = nuke.toNode('source')
+source.format().add('READ_FORMAT')
+nuke.root()['format'].setValue('READ_FORMAT')"""
+
+# tells the app a frame of the movie has been written, see ShooterThread
+_AFTER_FRAME_RENDER = ("__import__('sys').stderr.write('[FRAME_RENDERED] %d\\n' % int(nuke.frame())); "
+                       "__import__('sys').stderr.flush()")
+
+# skeletons, per burnin script and constant render settings
+_skeleton_lock = threading.Lock()
+_skeletons = {}
+
+# number of skeletons kept, one per show and codec profile in practice
+_MAX_SKELETONS = 16
+
+
+def tcl_quote(value):
+    """
+    Returns a value quoted for a Nuke script, so that nothing in it is evaluated
+    when the script is loaded.
+    """
+    value = unicode(value).encode("utf-8") if isinstance(value, unicode) else str(value)
+    for character in ("\\", "\"", "[", "]", "$", "{", "}"):
+        value = value.replace(character, "\\" + character)
+    return "\"%s\"" % value.replace("\n", "\\n")
+
+
+def _format_knob_value(value):
+    """
+    Returns a knob value as written in a Nuke script.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, long, float)):
+        return repr(value)
+    return tcl_quote(value)
+
+
+def get_incompatible_features(nuke_render_info):
+    """
+    Returns the features of a render which need the render script, and can't be
+    rendered with a job script.
+
+    :param nuke_render_info: Settings of the render, see Renderer.gather_nuke_render_info()
+    :return:                 List of feature names, empty if a job script can be used
+    """
+    render_info = nuke_render_info['render_info']
+    features = []
+    for key in ("staging", "held_frames", "thumbnails", "color_lut", "profile", "views"):
+        if render_info.get(key):
+            features.append(key)
+    if nuke_render_info.get('extra_write_node_mapping'):
+        features.append("extra_write_node_mapping")
+    if render_info.get('burnin_nk') and not _get_burnin_group_name(render_info['burnin_nk']):
+        features.append("burnin without a top level group")
+    return features
+
+
+def get_burnin_messages(ctx, version, name, first_frame, last_frame, version_number_padding):
+    """
+    Returns the messages of the burnin and slate, formatted like the render script does.
+
+    :return: Dictionary with the "project", "entity", "version" and "slate" messages,
+             "entity" being None if the context has no entity
+    """
+    version_str = "%%0%dd" % version_number_padding % version
+
+    if ctx.task:
+        version_label = "%s, v%s" % (ctx.task["name"], version_str)
+    elif ctx.step:
+        version_label = "%s, v%s" % (ctx.step["name"], version_str)
+    else:
+        version_label = "v%s" % version_str
+
+    slate_str = "Project: %s\n" % ctx.project["name"]
+    if ctx.entity:
+        slate_str += "%s: %s\n" % (ctx.entity["type"], ctx.entity["name"])
+    slate_str += "Name: %s\n" % name.capitalize()
+    slate_str += "Version: %s\n" % version_str
+
+    if ctx.task:
+        slate_str += "Task: %s\n" % ctx.task["name"]
+    elif ctx.step:
+        slate_str += "Step: %s\n" % ctx.step["name"]
+
+    slate_str += "Frames: %s - %s\n" % (first_frame, last_frame)
+
+    return {
+        'project': ctx.project["name"],
+        'entity': ctx.entity["name"] if ctx.entity else None,
+        'version': version_label,
+        'slate': slate_str,
+    }
+
+
+def get_skeleton(nuke_render_info, has_entity):
+    """
+    Returns the job script of a render with tokens in place of its per shot values.
+    Skeletons are built once per burnin script and constant render settings.
+
+    :param nuke_render_info: Settings of the render, see Renderer.gather_nuke_render_info()
+    :param has_entity:       If the context has an entity, which adds a burnin message
+    :return:                 Text of the skeleton
+    """
+    render_info = nuke_render_info['render_info']
+    with open(render_info['burnin_nk']) as burnin_file:
+        burnin = burnin_file.read()
+
+    logo = nuke_render_info['app_settings'].get('slate_logo', '')
+    cache_key = hashlib.sha1(json.dumps([
+        hashlib.sha1(burnin).hexdigest(), render_info['slate_font'], logo if os.path.isfile(logo) else '',
+        nuke_render_info['width'], nuke_render_info['height'], nuke_render_info['color_space'],
+        render_info['codec_settings']['quicktime'], has_entity,
+    ], sort_keys=True)).hexdigest()
+
+    with _skeleton_lock:
+        if cache_key not in _skeletons:
+            if len(_skeletons) >= _MAX_SKELETONS:
+                _skeletons.clear()
+            _skeletons[cache_key] = _build_skeleton(nuke_render_info, burnin, has_entity)
+        return _skeletons[cache_key]
+
+
+def _build_skeleton(nuke_render_info, burnin, has_entity):
+    """
+    Builds the skeleton of a job script, see get_skeleton().
+    """
+    render_info = nuke_render_info['render_info']
+    burnin_nodes, script_version = _split_burnin(burnin)
+    lines = [
+        "#! nuke -x",
+        "version %s" % script_version,
+        "# review movie job script, replay with: nuke -x -F @@SLATE_FRAME@@ -F @@FRAME_RANGE@@ <this script>",
+        "Root {",
+        " inputs 0",
+        " first_frame @@FIRST_FRAME@@",
+        " last_frame @@LAST_FRAME@@",
+        " onScriptLoad %s" % tcl_quote(_ON_SCRIPT_LOAD),
+        "}",
+        "Read {",
+        " inputs 0",
+        " file @@PATH_TO_FRAMES@@",
+        " first @@FIRST_FRAME@@",
+        " last @@LAST_FRAME@@",
+        " on_error black",
+    ]
+    if nuke_render_info['color_space']:
+        lines.append(" colorspace %s" % tcl_quote(nuke_render_info['color_space']))
+    lines += [" name source", "}"]
+
+    # the burnin group comes right after the Read node and takes it as its only input,
+    # its text nodes are set up by name like the render script does
+    lines.append(_BURNIN_GROUP_HEADER_REGEX.sub("Group {\n inputs 1\n", burnin_nodes, 1).rstrip("\n"))
+    burnin_group = _get_burnin_group_name(render_info['burnin_nk'])
+    for node_name in _BURNIN_FONT_NODES:
+        lines.append("knob %s.%s.font %s" % (burnin_group, node_name, tcl_quote(render_info['slate_font'])))
+    logo = nuke_render_info['app_settings'].get('slate_logo', '')
+    lines.append("knob %s.logo.file %s" % (burnin_group, tcl_quote(logo if os.path.isfile(logo) else '')))
+    lines.append("knob %s.top_left_text.message @@PROJECT_MESSAGE@@" % burnin_group)
+    if has_entity:
+        lines.append("knob %s.top_right_text.message @@ENTITY_MESSAGE@@" % burnin_group)
+    lines.append("knob %s.bottom_left_text.message @@VERSION_MESSAGE@@" % burnin_group)
+    lines.append("knob %s.slate_info.message @@SLATE_MESSAGE@@" % burnin_group)
+
+    lines += [
+        "Reformat {",
+        " type \"to box\"",
+        " box_width %d" % nuke_render_info['width'],
+        " box_height %d" % nuke_render_info['height'],
+        " box_fixed true",
+        " resize fit",
+        " center true",
+        " black_outside true",
+        " name scale",
+        "}",
+    ]
+
+    # the file type comes first, the knobs of the codec only exist once it is set
+    wn_settings = render_info['codec_settings']['quicktime']
+    lines += ["Write {", " file @@PATH_TO_MOVIE@@"]
+    lines.append(" file_type %s" % _format_knob_value(wn_settings.get("file_type", '')))
+    for knob_name, knob_value in sorted(wn_settings.iteritems()):
+        if knob_name != "file_type":
+            lines.append(" %s %s" % (knob_name, _format_knob_value(knob_value)))
+    lines += [
+        " afterFrameRender %s" % tcl_quote(_AFTER_FRAME_RENDER),
+        " name output",
+        "}",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def write_job_script(job_script_path, nuke_render_info, ctx):
+    """
+    Writes the job script of a render, from the skeleton of its constant settings.
+
+    :param job_script_path:  Path of the job script
+    :param nuke_render_info: Settings of the render, see Renderer.gather_nuke_render_info()
+    :param ctx:              Context the render runs in, for the burnin messages
+    """
+    first_frame = nuke_render_info['first_frame']
+    last_frame = nuke_render_info['last_frame']
+    messages = get_burnin_messages(ctx, nuke_render_info['version'], nuke_render_info['name'], first_frame,
+                                   last_frame, nuke_render_info['app_settings'].get('version_number_padding', 4))
+    values = {
+        'SLATE_FRAME': str(first_frame - 1),
+        'FRAME_RANGE': get_frame_range(nuke_render_info),
+        'FIRST_FRAME': str(first_frame),
+        'LAST_FRAME': str(last_frame),
+        'PATH_TO_FRAMES': tcl_quote(nuke_render_info['src_frames_path']),
+        'PATH_TO_MOVIE': tcl_quote(nuke_render_info['movie_output_path']),
+        'PROJECT_MESSAGE': tcl_quote(messages['project']),
+        'ENTITY_MESSAGE': tcl_quote(messages['entity'] or ''),
+        'VERSION_MESSAGE': tcl_quote(messages['version']),
+        'SLATE_MESSAGE': tcl_quote(messages['slate']),
+    }
+
+    # every token is replaced in one pass, so that values are never substituted again
+    skeleton = get_skeleton(nuke_render_info, bool(messages['entity']))
+    job_script = _TOKEN_REGEX.sub(lambda match: values[match.group(1)], skeleton)
+
+    temp_path = "%s.%d.tmp" % (job_script_path, os.getpid())
+    with open(temp_path, "w") as job_script_file:
+        job_script_file.write(job_script)
+    if os.path.exists(job_script_path) and sys.platform == "win32":
+        os.remove(job_script_path)
+    os.rename(temp_path, job_script_path)
+
+
+def get_frame_range(nuke_render_info):
+    """
+    Returns the range of frames of a render as given to nuke -F, the slate excluded.
+    """
+    frame_range = "%d-%d" % (nuke_render_info['first_frame'], nuke_render_info['last_frame'])
+    frame_step = nuke_render_info['render_info'].get('frame_step', 1)
+    if frame_step > 1:
+        frame_range += "x%d" % frame_step
+    return frame_range
+
+
+def _split_burnin(burnin):
+    """
+    Splits a burnin script in its nodes and the version of Nuke it was saved with,
+    dropping the lines of a script copied from the node graph.
+
+    :param burnin: Text of the burnin script
+    :return:       Tuple of the nodes and the version, _DEFAULT_SCRIPT_VERSION if it has none
+    """
+    match = _VERSION_REGEX.search(burnin)
+    script_version = match.group(1).strip() if match else _DEFAULT_SCRIPT_VERSION
+    burnin_nodes = _CUT_PASTE_REGEX.sub("", _VERSION_REGEX.sub("", burnin))
+    return burnin_nodes, script_version
+
+
+def _get_burnin_group_name(burnin_nk):
+    """
+    Returns the name of the top level group of a burnin script, None if it has none.
+    """
+    with open(burnin_nk) as burnin_file:
+        match = _BURNIN_GROUP_REGEX.search(burnin_file.read())
+    return match.group(1) if match else None
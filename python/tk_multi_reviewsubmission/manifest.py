@@ -0,0 +1,167 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Tracking of the steps of a submission, so that retrying it only redoes what failed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+from .fingerprint import fingerprint_sequence
+from .staging import get_scratch_folder
+
+# manifests of submissions older than this are forgotten, in seconds
+_MANIFEST_MAX_AGE = 14 * 24 * 3600
+
+
+def get_submission_key(version_name, entity, path_to_frames, first_frame, last_frame):
+    """
+    Returns a key identifying a submission, which stays the same as long as the same
+    frames are submitted for the same Version.
+
+    :param version_name:   Name of the Version, None if it is derived from the movie name
+    :param entity:         Entity the Version is linked to, None if there is none
+    :param path_to_frames: The path where frames should be found
+    :param first_frame:    The first frame of the sequence of frames
+    :param last_frame:     The last frame of the sequence of frames
+    :return:               The key, as a hex string
+    """
+    key_hash = hashlib.sha1()
+    key_hash.update(repr((version_name, entity and (entity["type"], entity["id"]), path_to_frames,
+                          first_frame, last_frame)))
+    key_hash.update(fingerprint_sequence(path_to_frames, first_frame, last_frame))
+    return key_hash.hexdigest()
+
+
+class SubmissionManifest(object):
+    """
+    Steps completed by a submission, saved to the local scratch folder after every step.
+
+    Submitting the same frames again once a submission is complete restarts it as a new
+    generation, with a key of its own so that it gets a Version of its own.
+
+    Submissions which can't be resumed have no key, their steps are only kept in memory.
+    """
+
+    def __init__(self, key=None):
+        """
+        Construction, loads the steps completed by earlier attempts of the submission.
+
+        :param key: Key of the submission, see get_submission_key(), None if it can't be resumed
+        """
+        self._persistent = key is not None
+        self._base_key = key or uuid.uuid4().hex
+        self._manifest_folder = get_scratch_folder("submissions")
+        self._path = os.path.join(self._manifest_folder, "%s.json" % self._base_key)
+        self._prune(self._manifest_folder)
+
+        self._data = {}
+        if self._persistent and os.path.isfile(self._path):
+            try:
+                with open(self._path) as manifest_file:
+                    self._data = json.load(manifest_file)
+            except ValueError:
+                # a corrupt manifest only means starting over
+                self._data = {}
+        self.key = self._get_key()
+
+    def restart(self):
+        """
+        Forgets every step of a complete submission, so that the same frames are submitted
+        again to a new Version.
+        """
+        shutil.rmtree(self.get_thumbnail_folder(), ignore_errors=True)
+        generation = self._data.get("generation", 0) + 1
+        self._data = {}
+        self.set("generation", generation)
+        self.key = self._get_key()
+
+    def get_thumbnail_folder(self):
+        """
+        Returns the folder the thumbnails of the submission are rendered to, kept until the
+        submission is complete so that retries reusing its movies upload them too.
+        """
+        return os.path.join(self._manifest_folder, "%s.thumbnails" % self.key)
+
+    def get(self, name, default=None):
+        """
+        Returns what has been recorded for a step.
+        """
+        return self._data.get(name, default)
+
+    def set(self, name, value):
+        """
+        Records a step and saves the manifest.
+        """
+        self._data[name] = value
+        if not self._persistent:
+            return
+        temp_path = "%s.%d.tmp" % (self._path, os.getpid())
+        with open(temp_path, "w") as manifest_file:
+            json.dump(self._data, manifest_file, indent=2)
+        if os.path.exists(self._path) and sys.platform == "win32":
+            os.remove(self._path)
+        os.rename(temp_path, self._path)
+
+    def set_movies(self, movie_paths, name="movies"):
+        """
+        Records the movies rendered by the submission.
+
+        :param movie_paths: List of movie paths, the movie of the first view first
+        :param name:        Name of the step which rendered the movies
+        """
+        self.set(name, [[movie_path, os.path.getsize(movie_path), int(os.path.getmtime(movie_path))]
+                        for movie_path in movie_paths])
+
+    def get_movies(self, name="movies"):
+        """
+        Returns the movies rendered by an earlier attempt of the submission, if they are
+        still there and haven't been overwritten since.
+
+        :param name: Name of the step which rendered the movies
+        :return:     List of movie paths, None if the movies must be rendered again
+        """
+        movies = self.get(name)
+        if not movies:
+            return None
+        for movie_path, movie_size, movie_mtime in movies:
+            if (not os.path.isfile(movie_path) or os.path.getsize(movie_path) != movie_size or
+                    int(os.path.getmtime(movie_path)) != movie_mtime):
+                return None
+        return [movie_path for movie_path, _, _ in movies]
+
+    def _get_key(self):
+        """
+        Returns the key of the current generation of the submission.
+        """
+        generation = self._data.get("generation", 0)
+        return "%s-%d" % (self._base_key, generation) if generation else self._base_key
+
+    @staticmethod
+    def _prune(manifest_folder):
+        """
+        Removes the manifests and thumbnail folders of old submissions.
+        """
+        for file_name in os.listdir(manifest_folder):
+            manifest_path = os.path.join(manifest_folder, file_name)
+            try:
+                if time.time() - os.path.getmtime(manifest_path) > _MANIFEST_MAX_AGE:
+                    if os.path.isdir(manifest_path):
+                        shutil.rmtree(manifest_path)
+                    else:
+                        os.remove(manifest_path)
+            except OSError:
+                # removed by another submission in the meantime
+                pass
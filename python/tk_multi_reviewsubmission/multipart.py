@@ -0,0 +1,253 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Uploads to Shotgun which can be metered as they are sent: part by part uploads to
+cloud storage and block by block form uploads to Shotgun's own storage.
+"""
+import mimetypes
+import os
+import urllib2
+import urlparse
+import uuid
+from cStringIO import StringIO
+
+# shotgun_api3 splits multipart uploads in parts of this size, storage requires all
+# parts but the last one to be at least 5MB
+_DEFAULT_PART_SIZE = 20 * 1024 * 1024
+
+
+class MultipartUploadSession(object):
+    """
+    Thin wrapper around the multipart cloud storage upload steps of shotgun_api3.
+
+    shotgun_api3 only exposes uploads of complete files, so this relies on the
+    private helpers it uses internally. All of that coupling is kept in here.
+    """
+
+    def __init__(self, sg, filename):
+        """
+        Construction
+
+        :param sg:       Shotgun connection to upload with
+        :param filename: Name the file will have in Shotgun
+        """
+        self._sg = sg
+        self._filename = filename
+        self._content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        self._upload_info = None
+        self._etags = {}
+        self._aborted = False
+        self.part_size = getattr(sg, "_MULTIPART_UPLOAD_CHUNK_SIZE", _DEFAULT_PART_SIZE)
+
+    @staticmethod
+    def is_supported(sg, entity_type, field_name):
+        """
+        Checks if the site and shotgun_api3 version support multipart uploads.
+
+        :param sg:          Shotgun connection to upload with
+        :param entity_type: Entity type the file will be linked to
+        :param field_name:  Field the file will be linked to
+        :return:            True if files can be uploaded part by part
+        """
+        required_methods = ["_requires_direct_s3_upload", "_get_attachment_upload_info", "_get_upload_part_link",
+                            "_upload_data_to_storage", "_complete_multipart_upload", "_send_form",
+                            "_auth_params"]
+        if not all(hasattr(sg, method_name) for method_name in required_methods):
+            return False
+        return sg._requires_direct_s3_upload(entity_type, field_name)
+
+    def abort(self):
+        """
+        Gives up on the upload. Shotgun has no call to cancel a multipart upload, the parts
+        which have been uploaded are never assembled and are cleaned up by the storage.
+        """
+        self._aborted = True
+        self._upload_info = None
+        self._etags = {}
+
+    def begin(self):
+        """
+        Requests the upload links from Shotgun.
+        """
+        self._upload_info = self._sg._get_attachment_upload_info(False, self._filename, True)
+
+    def upload_part(self, part_number, data):
+        """
+        Uploads a single part, parts can be uploaded in any order.
+
+        :param part_number: Number of the part, starting at 1
+        :param data:        Content of the part
+        """
+        if self._aborted:
+            raise MultipartUploadFailed("Upload of %s has been aborted" % self._filename)
+        part_url = self._sg._get_upload_part_link(self._upload_info, self._filename, part_number)
+        self._etags[part_number] = self._sg._upload_data_to_storage(data, self._content_type, len(data), part_url)
+
+    def complete(self):
+        """
+        Assembles the uploaded parts in storage.
+        """
+        if self._aborted:
+            raise MultipartUploadFailed("Upload of %s has been aborted" % self._filename)
+        etags = [self._etags[part_number] for part_number in sorted(self._etags)]
+        self._sg._complete_multipart_upload(self._upload_info, self._filename, etags)
+
+    def link(self, entity_type, entity_id, field_name, display_name=None):
+        """
+        Links the completed upload to a field of an entity.
+
+        :param entity_type:  Type of the entity to link the file to
+        :param entity_id:    Id of the entity to link the file to
+        :param field_name:   Field to link the file to
+        :param display_name: Name to display for the file, defaults to the file name
+        :return:             Id of the Attachment entity that was created
+        """
+        url = urlparse.urlunparse((self._sg.config.scheme, self._sg.config.server, "/upload/api_link_file",
+                                   None, None, None))
+        params = {
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "upload_link_info": self._upload_info["upload_info"],
+            "display_name": display_name or self._filename,
+        }
+        # like shotgun_api3, only send the field if there is one, None would be sent as "None"
+        if field_name:
+            params["field_name"] = field_name
+        params.update(self._sg._auth_params())
+
+        result = self._sg._send_form(url, params)
+        if not result.startswith("1"):
+            raise MultipartUploadFailed("Could not link uploaded file %s: %s" % (self._filename, result))
+        return int(result.split(":", 2)[1].split("\n", 1)[0])
+
+
+class MultipartUploadFailed(Exception):
+    pass
+
+
+class FormUpload(object):
+    """
+    Upload of a whole file to Shotgun's own storage, sending the same form as the
+    upload() of shotgun_api3 but reading the request body block by block as it is
+    sent, so that every block can be metered.
+
+    This relies on the private helpers of shotgun_api3 too, for the proxy, the
+    certificates and the authentication of the connection.
+    """
+
+    def __init__(self, sg, path, on_block=None):
+        """
+        Construction
+
+        :param sg:       Shotgun connection to upload with
+        :param path:     Path to the file
+        :param on_block: Callable receiving the size of every block of the body before it is sent
+        """
+        self._sg = sg
+        self._path = path
+        self._on_block = on_block
+
+    @staticmethod
+    def is_supported(sg):
+        """
+        Checks if the shotgun_api3 version exposes what a form upload needs.
+
+        :param sg: Shotgun connection to upload with
+        :return:   True if files can be uploaded block by block
+        """
+        return all(hasattr(sg, method_name) for method_name in ["_build_opener", "_auth_params", "config"])
+
+    def send(self, entity_type, entity_id, field_name=None, display_name=None):
+        """
+        Uploads the file and links it to an entity.
+
+        :param entity_type:  Type of the entity to upload the file to
+        :param entity_id:    Id of the entity to upload the file to
+        :param field_name:   Field to upload the file to, None to attach it
+        :param display_name: Name to display for the file, defaults to the file name
+        :return:             Id of the Attachment entity that was created
+        """
+        filename = os.path.basename(self._path)
+        url = urlparse.urlunparse((self._sg.config.scheme, self._sg.config.server, "/upload/upload_file",
+                                   None, None, None))
+        params = {
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "display_name": display_name or filename,
+        }
+        if field_name:
+            params["field_name"] = field_name
+        params.update(self._sg._auth_params())
+
+        body = _FormBody(params, "file", self._path, self._on_block)
+        try:
+            request = urllib2.Request(url, body, {"Content-Type": body.content_type,
+                                                  "Content-Length": str(len(body))})
+            result = self._sg._build_opener(urllib2.HTTPHandler).open(request).read()
+        finally:
+            body.close()
+
+        if not result.startswith("1"):
+            raise FormUploadFailed("Could not upload file %s: %s" % (filename, result))
+        return int(result.split(":", 2)[1].split("\n", 1)[0])
+
+
+class _FormBody(object):
+    """
+    Multipart form data read from the file being uploaded as httplib sends it.
+    """
+
+    def __init__(self, params, file_field, path, on_block=None):
+        boundary = uuid.uuid4().hex
+        self.content_type = "multipart/form-data; boundary=%s" % boundary
+
+        head = StringIO()
+        for key, value in sorted(params.iteritems()):
+            if isinstance(value, unicode):
+                value = value.encode("utf-8")
+            head.write('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (boundary, key, value))
+        filename = os.path.basename(path)
+        head.write('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n'
+                   % (boundary, file_field, filename,
+                      mimetypes.guess_type(filename)[0] or "application/octet-stream"))
+        tail = "\r\n--%s--\r\n" % boundary
+
+        self._length = head.tell() + os.path.getsize(path) + len(tail)
+        head.seek(0)
+        self._parts = [head, open(path, "rb"), StringIO(tail)]
+        self._on_block = on_block
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        """
+        Returns the next block of the body, httplib reads it in blocks of 8KB.
+        """
+        data = ""
+        while self._parts and (size < 0 or len(data) < size):
+            block = self._parts[0].read(size - len(data) if size >= 0 else -1)
+            if not block:
+                self._parts.pop(0).close()
+                continue
+            data += block
+        if data and self._on_block:
+            self._on_block(len(data))
+        return data
+
+    def close(self):
+        for part in self._parts:
+            part.close()
+        self._parts = []
+
+
+class FormUploadFailed(Exception):
+    pass
@@ -0,0 +1,140 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Rendering of movies to local scratch and publishing them to their final location.
+"""
+import hashlib
+import os
+import sys
+
+import sgtk
+from sgtk.util.filesystem import ensure_folder_exists
+
+from .staging import get_scratch_folder
+
+# memory backed file system used for movies which are only kept for the upload
+_TMPFS_ROOT = "/dev/shm"
+
+# size of the blocks used to copy the movie to network storage
+_COPY_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class MovieOutputStage(object):
+    """
+    Decides where Nuke writes the movie to and moves it to its final location
+    once the render has succeeded.
+
+    Rendering to local scratch keeps the many small writes of the encoder off
+    network storage and guarantees a failed render never leaves a partial movie
+    at the final location.
+    """
+
+    def __init__(self):
+        """
+        Construction
+        """
+        self.__app = sgtk.platform.current_bundle()
+        self._enabled = self.__app.get_setting("stage_movie_output")
+
+    def get_render_path(self, movie_path, upload_only):
+        """
+        Returns the path Nuke should write the movie to.
+
+        :param movie_path:  The final location of the movie
+        :param upload_only: True if the movie is only rendered to be uploaded to Shotgun
+        :return:            Path to render the movie to
+        """
+        if not self._enabled:
+            return movie_path
+
+        if upload_only and sys.platform.startswith("linux") and os.access(_TMPFS_ROOT, os.W_OK):
+            scratch_folder = os.path.join(_TMPFS_ROOT, "tk-multi-reviewsubmission", "movies")
+            ensure_folder_exists(scratch_folder)
+        else:
+            scratch_folder = get_scratch_folder("movies")
+
+        # keep the original file name so that uploads show the expected name in Shotgun
+        path_key = hashlib.sha1(movie_path).hexdigest()[:12]
+        return os.path.join(scratch_folder, path_key, os.path.basename(movie_path))
+
+    def get_movie_path(self, movie_path, upload_only):
+        """
+        Returns the path the movie can be found at once it has been published.
+
+        :param movie_path:  The final location of the movie
+        :param upload_only: True if the movie is only rendered to be uploaded to Shotgun
+        :return:            Path to the published movie
+        """
+        if upload_only:
+            # no need to copy the movie to network storage just to upload it
+            return self.get_render_path(movie_path, upload_only)
+        return movie_path
+
+    def publish(self, render_path, movie_path, upload_only):
+        """
+        Moves a rendered movie to its final location.
+
+        The movie is transferred next to its final location under a temporary name
+        and renamed into place, so the final path only ever holds a complete movie.
+
+        :param render_path: Path the movie was rendered to
+        :param movie_path:  The final location of the movie
+        :param upload_only: True if the movie is only rendered to be uploaded to Shotgun
+        :return:            Path to the published movie
+        """
+        published_path = self.get_movie_path(movie_path, upload_only)
+        if render_path == published_path:
+            return published_path
+
+        ensure_folder_exists(os.path.dirname(published_path))
+        temp_path = os.path.join(os.path.dirname(published_path),
+                                 ".%s.%d.tmp" % (os.path.basename(published_path), os.getpid()))
+        try:
+            try:
+                # cheap when the scratch folder lives on the same device
+                os.rename(render_path, temp_path)
+            except OSError:
+                self._copy(render_path, temp_path)
+                os.remove(render_path)
+
+            if sys.platform == "win32" and os.path.exists(published_path):
+                # rename doesn't replace existing files on windows
+                os.remove(published_path)
+            os.rename(temp_path, published_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.__app.log_debug("Published movie %s to %s" % (render_path, published_path))
+        return published_path
+
+    def discard(self, render_path, movie_path):
+        """
+        Removes a movie left in the scratch folder by a failed render.
+
+        :param render_path: Path the movie was rendered to
+        :param movie_path:  The final location of the movie
+        """
+        if render_path != movie_path and os.path.exists(render_path):
+            os.remove(render_path)
+
+    @staticmethod
+    def _copy(source_path, destination_path):
+        """
+        Copies a file in large sequential blocks.
+        """
+        with open(source_path, "rb") as source_file:
+            with open(destination_path, "wb") as destination_file:
+                while True:
+                    data = source_file.read(_COPY_BLOCK_SIZE)
+                    if not data:
+                        break
+                    destination_file.write(data)
@@ -0,0 +1,210 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Assembly of dailies reels from review movies which have already been rendered.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import sgtk
+
+from .connections import get_connection_pool
+from .renderer import NUKE_PATH_SETTINGS, Renderer
+from .staging import get_scratch_folder
+
+# stream properties which must be the same for movies to be concatenated without re-encoding
+_STREAM_KEYS = ("codec_name", "profile", "width", "height", "r_frame_rate", "time_base", "pix_fmt")
+
+
+class ReelAssemblyFailed(Exception):
+    pass
+
+
+class ReelBuilder(object):
+    """
+    Concatenates review movies into one reel by copying their streams, with a short
+    slate card before each of them. Slate cards are the only frames rendered, and are
+    cached in the local scratch folder.
+    """
+
+    def __init__(self):
+        """
+        Construction
+        """
+        self.__app = sgtk.platform.current_bundle()
+        self._connection_pool = get_connection_pool()
+        self._renderer = Renderer()
+        self._ffmpeg_path = self.__app.get_setting("ffmpeg_path")
+        # ffprobe is shipped alongside ffmpeg
+        ffmpeg_folder, ffmpeg_name = os.path.split(self._ffmpeg_path)
+        self._ffprobe_path = os.path.join(ffmpeg_folder, ffmpeg_name.replace("ffmpeg", "ffprobe"))
+
+    def resolve_movies(self, items):
+        """
+        Returns the movie and the slate card text of each item of a reel.
+
+        :param items: List of Version entity dictionaries and movie paths
+        :return:      List of (movie path, slate card text) tuples, in the order of the items
+        """
+        version_ids = [item["id"] for item in items if isinstance(item, dict)]
+        sg_versions = {}
+        if version_ids:
+            with self._connection_pool.connection() as sg:
+                for sg_version in sg.find("Version", [["id", "in", version_ids]], ["code", "sg_path_to_movie"]):
+                    sg_versions[sg_version["id"]] = sg_version
+
+        movies = []
+        for item in items:
+            if not isinstance(item, dict):
+                movies.append((item, os.path.splitext(os.path.basename(item))[0]))
+                continue
+            sg_version = sg_versions.get(item["id"])
+            if not sg_version:
+                raise ReelAssemblyFailed("Version %d doesn't exist!" % item["id"])
+            # only movies stored on disk can be concatenated, uploaded ones would have to be downloaded
+            if not sg_version.get("sg_path_to_movie"):
+                raise ReelAssemblyFailed("Version %s has no movie on disk!" % sg_version["code"])
+            movies.append((sg_version["sg_path_to_movie"], sg_version["code"]))
+        return movies
+
+    def build(self, items, path_to_reel, codec_profile, slate_frames=0):
+        """
+        Builds a reel from review movies.
+
+        :param items:         List of Version entity dictionaries and movie paths
+        :param path_to_reel:  The path where the reel should be written to
+        :param codec_profile: Codec profile the movies were encoded with, used for the slate cards
+        :param slate_frames:  Number of frames of the slate card before each movie, 0 for none
+        :return:              Number of frames of the reel
+        """
+        movies = self.resolve_movies(items)
+        if not movies:
+            raise ReelAssemblyFailed("No movies to assemble a reel from!")
+
+        # streams can only be copied if all the movies were encoded the same way
+        streams = [self._probe(movie_path) for movie_path, _ in movies]
+        for (movie_path, _), stream in zip(movies[1:], streams[1:]):
+            self._check_stream(movie_path, stream, streams[0])
+
+        reel_parts = []
+        frame_count = 0
+        for (movie_path, text), stream in zip(movies, streams):
+            if slate_frames:
+                slate_card = self._get_slate_card(text, streams[0], slate_frames, codec_profile,
+                                                  os.path.splitext(movie_path)[1])
+                reel_parts.append(slate_card)
+                frame_count += slate_frames
+            reel_parts.append(movie_path)
+            frame_count += int(stream.get("nb_frames") or 0)
+
+        self._concatenate(reel_parts, path_to_reel)
+        return frame_count
+
+    def _get_slate_card(self, text, stream, frame_count, codec_profile, extension):
+        """
+        Returns a slate card matching the movies of a reel, rendering it unless it is cached.
+        """
+        width, height = stream["width"], stream["height"]
+        numerator, denominator = stream["r_frame_rate"].split("/")
+        fps = float(numerator) / float(denominator)
+
+        # cards are identified by everything they are rendered from
+        card_hash = hashlib.sha1()
+        card_hash.update(repr((text, width, height, stream["r_frame_rate"], frame_count, codec_profile,
+                               self.__app.get_setting("codec_settings_hook"),
+                               self.__app.get_setting(NUKE_PATH_SETTINGS[sys.platform]))))
+        card_folder = get_scratch_folder("slate_cards")
+        card_path = os.path.join(card_folder, "%s%s" % (card_hash.hexdigest(), extension))
+        if os.path.isfile(card_path):
+            return card_path
+
+        # rendered under a temporary name, so that an interrupted render is never used
+        temp_path = os.path.join(card_folder, "%s.%d%s" % (card_hash.hexdigest(), os.getpid(), extension))
+        self.__app.log_debug("Rendering slate card '%s' to %s" % (text, card_path))
+        self._renderer.render_slate_card(temp_path, width, height, fps, frame_count, text, codec_profile)
+        self._check_stream(temp_path, self._probe(temp_path), stream)
+        if os.path.exists(card_path) and sys.platform == "win32":
+            os.remove(card_path)
+        os.rename(temp_path, card_path)
+        return card_path
+
+    def _probe(self, movie_path):
+        """
+        Returns the properties of the video stream of a movie.
+        """
+        if not os.path.isfile(movie_path):
+            raise ReelAssemblyFailed("Movie %s doesn't exist!" % movie_path)
+        process = subprocess.Popen([self._ffprobe_path, "-v", "error", "-select_streams", "v:0",
+                                    "-show_entries", "stream=%s,nb_frames" % ",".join(_STREAM_KEYS),
+                                    "-of", "json", movie_path],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errors = process.communicate()
+        if process.returncode != 0:
+            raise ReelAssemblyFailed("Failed to read %s:\n%s" % (movie_path, errors))
+        streams = json.loads(output).get("streams")
+        if not streams:
+            raise ReelAssemblyFailed("Movie %s has no video stream!" % movie_path)
+        return streams[0]
+
+    @staticmethod
+    def _check_stream(movie_path, stream, reference_stream):
+        """
+        Makes sure a movie can be concatenated with the first movie of a reel.
+        """
+        for key in _STREAM_KEYS:
+            if stream.get(key) != reference_stream.get(key):
+                raise ReelAssemblyFailed("Movie %s can't be concatenated without re-encoding, its %s is %s "
+                                         "instead of %s" % (movie_path, key, stream.get(key),
+                                                            reference_stream.get(key)))
+
+    def _concatenate(self, movie_paths, path_to_reel):
+        """
+        Copies the streams of movies one after the other into a reel. The reel is written
+        under a temporary name and renamed into place, so that an interrupted assembly never
+        leaves a partial reel behind.
+        """
+        reel_folder = os.path.dirname(path_to_reel)
+        if reel_folder and not os.path.isdir(reel_folder):
+            os.makedirs(reel_folder)
+
+        list_path = "%s.%d.txt" % (path_to_reel, os.getpid())
+        self._write_concat_list(movie_paths, list_path)
+        # ffmpeg picks the container from the extension, which the temporary name keeps
+        reel_root, reel_extension = os.path.splitext(path_to_reel)
+        temp_path = "%s.%d%s" % (reel_root, os.getpid(), reel_extension)
+        try:
+            process = subprocess.Popen([self._ffmpeg_path, "-v", "error", "-f", "concat", "-safe", "0",
+                                        "-i", list_path, "-c", "copy", "-movflags", "+faststart", "-y",
+                                        temp_path],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            _, errors = process.communicate()
+            if process.returncode != 0:
+                raise ReelAssemblyFailed("Failed to assemble %s:\n%s" % (path_to_reel, errors))
+            if os.path.exists(path_to_reel) and sys.platform == "win32":
+                os.remove(path_to_reel)
+            os.rename(temp_path, path_to_reel)
+        finally:
+            os.remove(list_path)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _write_concat_list(movie_paths, list_path):
+        """
+        Writes the list of movies read by the ffmpeg concat demuxer, which takes single
+        quoted paths with their quotes escaped.
+        """
+        with open(list_path, "w") as list_file:
+            for movie_path in movie_paths:
+                list_file.write("file '%s'\n" % movie_path.replace("\\", "/").replace("'", "'\\''"))
@@ -9,12 +9,22 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import sgtk
+import ast
+import copy
+import json
 import os
 import pickle
+import re
 import sys
 import subprocess
+import threading
+import time
 from sgtk.platform.qt import QtCore
 
+from .fingerprint import find_held_frames
+from .jobscript import get_frame_range, get_incompatible_features, write_job_script
+from .staging import FAILED_FRAME_SUFFIX, FrameStager, get_scratch_folder
+from .throughput import RenderEta, get_throughput_model
 
 try:
     import nuke
@@ -22,6 +32,33 @@ except ImportError:
     nuke = None
 
 
+# matches the view specifiers nuke understands in paths
+VIEW_SPEC_REGEX = re.compile(r"%[Vv]")
+
+# maximum number of holds remapped by the Read node, the longest ones are kept
+MAX_HELD_RUNS = 256
+
+# resolved codec settings, per codec hook, Nuke version and codec profile
+_codec_settings_lock = threading.Lock()
+_codec_settings_cache = {}
+
+# settings holding the Nuke executable path of each OS
+NUKE_PATH_SETTINGS = {'win32': 'nuke_windows_path',
+                      'linux2': 'nuke_linux_path',
+                      'darwin': 'nuke_mac_path'}
+
+# resolved launch specs of the nuke subprocess, per context and configuration
+_launch_spec_lock = threading.Lock()
+_launch_specs = {}
+
+# number of launch specs kept, one per context a session has rendered in
+_MAX_LAUNCH_SPECS = 16
+
+# variables of this process' environment which change what Nuke starts with, a launch spec
+# is resolved again when one of them changes
+_LAUNCH_ENV_VARIABLES = ("PATH", "PYTHONPATH", "LD_LIBRARY_PATH", "DYLD_LIBRARY_PATH", "NUKE_PATH", "OCIO",
+                         "foundry_LICENSE", "RLM_LICENSE")
+
 # DD imports
 from dd.runtime import api
 api.load('wam')
@@ -45,6 +82,9 @@ class Renderer(object):
         if not os.path.isfile(self._burnin_nk):
             self._burnin_nk = os.path.join(self.__app.disk_location, "resources", "burnin.nk")
 
+        # frames timed during the last render, see get_last_render_timing()
+        self._last_render_timing = None
+
         self._logo = None
         logo_template = self.__app.get_template("slate_logo")
         logo_file_path = logo_template.apply_fields(self._context_fields)
@@ -59,8 +99,73 @@ class Renderer(object):
             self._logo = self._logo.replace(os.sep, "/")
             self._burnin_nk = self._burnin_nk.replace(os.sep, "/")
 
+    def get_view_settings(self):
+        """
+        Returns the views to render according to the app settings.
+
+        :return: Dictionary with the view names and how they are packed, None to render the first view only
+        """
+        view_names = self.__app.get_setting("render_views")
+        if not view_names:
+            return None
+        return {'names': view_names, 'packing': self.__app.get_setting("view_packing")}
+
+    def get_movie_paths(self, path_to_movie):
+        """
+        Returns the paths of all the movies rendered for the given movie path. Each view
+        is written to its own movie, unless the views are packed into a single movie.
+
+        :param path_to_movie: The path where the movie should be written to
+        :return:              List of movie paths, the movie of the first view comes first
+        """
+        views = self.get_view_settings()
+        if not views or views['packing'] != 'separate':
+            return [path_to_movie]
+        return [self._get_view_path(path_to_movie, view_name) for view_name in views['names']]
+
+    def get_output_size(self, width, height):
+        """
+        Returns the size of the frames of each rendered movie, views packed side by side or
+        over under making them wider or taller than the movie_width and movie_height.
+
+        :param width:  Width of a single view
+        :param height: Height of a single view
+        :return:       Tuple of the width and height of the movie frames
+        """
+        return self._get_packed_size(width, height, self.get_view_settings())
+
+    @staticmethod
+    def _get_packed_size(width, height, views):
+        """
+        Returns the size of the movie frames once the views are packed.
+        """
+        if views and views['packing'] == 'side_by_side':
+            return width * len(views['names']), height
+        if views and views['packing'] == 'over_under':
+            return width, height * len(views['names'])
+        return width, height
+
+    @staticmethod
+    def _get_view_pattern(path_to_movie):
+        """
+        Returns the movie path with a view specifier nuke substitutes per view.
+        """
+        if VIEW_SPEC_REGEX.search(path_to_movie):
+            return path_to_movie
+        base_path, extension = os.path.splitext(path_to_movie)
+        return "%s_%%V%s" % (base_path, extension)
+
+    @classmethod
+    def _get_view_path(cls, path_to_movie, view_name):
+        """
+        Returns the path of the movie of a single view.
+        """
+        view_pattern = cls._get_view_pattern(path_to_movie)
+        return view_pattern.replace("%V", view_name).replace("%v", view_name[:1])
+
     def gather_nuke_render_info(self, path_to_frames, path_to_movie, extra_write_node_mapping, width, height,
-                                first_frame, last_frame, version, name, color_space, burnin_nk):
+                                first_frame, last_frame, version, name, color_space, burnin_nk, staging_info=None,
+                                codec_profile=None):
         """
         Prepares the render settings for the nuke subprocess hook
 
@@ -76,42 +181,51 @@ class Renderer(object):
         :param name:        Name of the file being published
         :param color_space: Colorspace used to create the frames
         :param burnin_nk:   Path to the nuke file to be used for processing
+        :param staging_info: Information about source frames staged to local scratch, if any
+        :param codec_profile: Codec profile to encode the movie with, None to use the codec_profile setting
 
         :return:            Dictionary of settings to be used by the subprocess.
         """
-        # First get Nuke executable path from project configuration environment
-        setting_key_by_os = {'win32': 'nuke_windows_path',
-                             'linux2': 'nuke_linux_path',
-                             'darwin': 'nuke_mac_path'}
-        nuke_exe_path = self.__app.get_setting(setting_key_by_os[sys.platform])
+        # Nuke executable, render script and environment are resolved once per context and configuration
+        launch_spec = self.get_launch_spec()
+        nuke_exe_path = launch_spec['nuke_exe_path']
 
         # get the Write node settings we'll use for generating the Quicktime
-        writenode_quicktime_settings = self.__app.execute_hook_method("codec_settings_hook",
-                                                                      "get_quicktime_settings")
-
-        # making the python script passed to nuke configurable as a setting because
-        # making it a hook would still not allow us to subprocess it out
-        render_script_path = ''
-        render_script_template = self.__app.get_template("render_script")
-        if render_script_template:
-            render_script_path = render_script_template.apply_fields(self._context_fields)
-
-        # If a show specific render script has not been defined, take it from the default location
-        if not os.path.isfile(render_script_path):
-            render_script_path = os.path.join(self.__app.disk_location, "hooks",
-                                              "nuke_batch_render_movie.py")
-
-        serialized_context = self.__app.context.serialize()
+        output_width, output_height = self.get_output_size(width, height)
+        codec_profile = codec_profile or self.get_codec_profile(last_frame - first_frame + 1, output_width,
+                                                                output_height,
+                                                                not self.__app.get_setting("store_on_disk"))
+        codec_settings = self._get_codec_settings(nuke_exe_path, codec_profile)
+        self.__app.log_debug("Encoding %s with the '%s' codec profile" % (path_to_movie, codec_profile))
 
         app_settings = {
             'version_number_padding': self.__app.get_setting('version_number_padding'),
             'slate_logo': self._logo,
         }
 
+        # bake the colorspace conversion into a cached LUT applied at the output resolution
+        color_lut_info = None
+        if color_space and self.__app.get_setting("bake_color_lut"):
+            color_lut_info = {
+                'cache_dir': get_scratch_folder("luts").replace('\\', '/'),
+                'display': self.__app.get_setting("review_display_colorspace"),
+                'cube_size': self.__app.get_setting("color_lut_size"),
+            }
+
+        # render every configured view, each to its own movie unless they are packed
+        views = self.get_view_settings()
+        if views and views['packing'] == 'separate':
+            path_to_movie = self._get_view_pattern(path_to_movie)
+
         render_info = {
             'burnin_nk': burnin_nk,
             'slate_font': self._font,
-            'codec_settings': {'quicktime': writenode_quicktime_settings},
+            'codec_settings': {'quicktime': codec_settings['quicktime'], 'profile': codec_profile},
+            'staging': staging_info,
+            'color_lut': color_lut_info,
+            'profile': self.__app.get_setting("profile_render"),
+            'views': views,
+            'framespec_path': os.path.join(os.path.dirname(__file__), "framespec.py").replace('\\', '/'),
         }
 
         # set needed paths and force them to use forward slashes for use in Nuke (for Windows)
@@ -127,8 +241,11 @@ class Renderer(object):
             'name': name,
             'color_space': color_space,
             'nuke_exe_path': nuke_exe_path,
-            'render_script_path': render_script_path,
-            'serialized_context': serialized_context,
+            'nuke_threads': codec_settings['threads'],
+            'render_script_path': launch_spec['render_script_path'],
+            'serialized_context': launch_spec['serialized_context'],
+            'launch_env': launch_spec['env'],
+            'env_overlay': {'TANK_CONTEXT': launch_spec['serialized_context']},
             'app_settings': app_settings,
             'render_info': render_info,
             'src_frames_path': src_frames_path,
@@ -138,7 +255,9 @@ class Renderer(object):
         return nuke_render_info
 
     def render_in_nuke(self, path_to_frames, path_to_movie, extra_write_node_mapping, width, height, first_frame,
-                       last_frame, version, name, color_space, fields=None, active_progress_info=None):
+                       last_frame, version, name, color_space, fields=None, active_progress_info=None,
+                       frame_step=1, thumbnail_folder=None, codec_profile=None, thumbnail_sizes=None,
+                       published_movie_path=None):
         """
         Renders the movie using a Nuke subprocess,
         along with slate/burnins using all the app settings.
@@ -157,6 +276,13 @@ class Renderer(object):
         :param fields:          Any additional information to be used in slate/burnins
         :param active_progress_info: Any function that receives the progress percentage
                                      Can be used to update GUI
+        :param frame_step:      Only render every Nth frame, e.g. for quick previews
+        :param thumbnail_folder: Folder to write a thumbnail and a filmstrip to in the same pass, see
+                                 get_thumbnail_paths()
+        :param codec_profile:   Codec profile to encode the movie with, None to use the codec_profile setting
+        :param thumbnail_sizes: Widths of extra thumbnails of the poster frame to write to the thumbnail folder
+        :param published_movie_path: Path the movie is published to once rendered, if it is rendered
+                                     somewhere else, see MovieOutputStage
         """
         # add to information passed for preprocessing
         fields["first_frame"] = first_frame
@@ -169,19 +295,82 @@ class Renderer(object):
                                                                     nuke_script_path=self._burnin_nk,
                                                                     fields=fields)
 
-        render_info = self.gather_nuke_render_info(path_to_frames, path_to_movie, extra_write_node_mapping, width,
-                                                   height, first_frame, last_frame, version, name, color_space,
-                                                   processed_nuke_script_path)
+        # find the held frames, so that only the first frame of each hold is read
+        held_frames = []
+        if self.__app.get_setting("detect_held_frames") and VIEW_SPEC_REGEX.search(path_to_frames):
+            self.__app.log_debug("Not detecting held frames in per view source frames %s" % path_to_frames)
+        elif self.__app.get_setting("detect_held_frames") and frame_step == 1:
+            held_frames = self._find_held_frames(path_to_frames, first_frame, last_frame)
+
+        # copy the source frames to local scratch ahead of the render if required
+        stager = None
+        staging_info = None
+        render_path_to_frames = path_to_frames
+        if self.__app.get_setting("stage_source_frames") and VIEW_SPEC_REGEX.search(path_to_frames):
+            self.__app.log_debug("Not staging per view source frames %s" % path_to_frames)
+        elif self.__app.get_setting("stage_source_frames"):
+            stager = FrameStager(get_scratch_folder("staged_frames"),
+                                 self.__app.get_setting("staging_cache_size") * 1024 * 1024,
+                                 self.__app.get_setting("staging_threads"),
+                                 self.__app.get_setting("staging_read_ahead"))
+            skip_frames = set(frame for start, end, _ in held_frames for frame in range(start, end + 1))
+            render_path_to_frames = stager.stage(path_to_frames, first_frame, last_frame, frame_step, skip_frames)
+            staging_info = {
+                'source_path': path_to_frames.replace('\\', '/'),
+                'first_frame': first_frame,
+                'last_frame': last_frame,
+                'failed_suffix': FAILED_FRAME_SUFFIX,
+            }
+            stager.wait_for_read_ahead()
+
+        render_info = self.gather_nuke_render_info(render_path_to_frames, path_to_movie, extra_write_node_mapping,
+                                                   width, height, first_frame, last_frame, version, name, color_space,
+                                                   processed_nuke_script_path, staging_info, codec_profile)
+        render_info['render_info']['frame_step'] = frame_step
+        render_info['render_info']['held_frames'] = held_frames
+        render_info['render_info']['thumbnails'] = None
+        if thumbnail_folder:
+            render_info['render_info']['thumbnails'] = {
+                'folder': thumbnail_folder.replace('\\', '/'),
+                'width': self.__app.get_setting("thumbnail_width"),
+                'filmstrip_frame_count': self.__app.get_setting("filmstrip_frame_count"),
+                'sizes': list(thumbnail_sizes or []),
+            }
         run_in_batch_mode = True if nuke is None else False
 
-        event_loop = QtCore.QEventLoop()
-        thread = ShooterThread(render_info, run_in_batch_mode, active_progress_info)
-        thread.finished.connect(event_loop.quit)
-        thread.start()
-        event_loop.exec_()
-
-        # log any errors generated in the thread
-        thread_error_msg = thread.get_errors()
+        # separate views can be rendered in parallel, with one nuke subprocess per view
+        render_infos = [render_info]
+        views = render_info['render_info']['views']
+        if views and views['packing'] == 'separate' and self.__app.get_setting("parallel_view_renders"):
+            render_infos = []
+            for view_name in views['names']:
+                # the thumbnails come from the first view
+                view_render_info = dict(render_info['render_info'],
+                                        views={'names': [view_name], 'packing': 'separate'},
+                                        thumbnails=render_info['render_info']['thumbnails'] if not render_infos
+                                        else None)
+                render_infos.append(dict(render_info, render_info=view_render_info))
+
+        # the graph of simple renders is loaded from a job script rather than built by the render script
+        thread_class = ShooterThread
+        if self.__app.get_setting("render_job_scripts"):
+            incompatible_features = get_incompatible_features(render_info)
+            if incompatible_features:
+                self.__app.log_debug("Not rendering %s from a job script, it uses %s"
+                                     % (path_to_movie, ", ".join(incompatible_features)))
+            else:
+                render_info['job_script_path'] = self._write_job_script(render_info, published_movie_path)
+                thread_class = JobScriptThread
+
+        try:
+            threads = self._run_shooter_threads(render_infos, run_in_batch_mode, active_progress_info, thread_class)
+        finally:
+            if stager:
+                for staging_error in stager.stop():
+                    self.__app.log_warning(staging_error)
+
+        # log any errors generated in the threads
+        thread_error_msg = "\n".join(thread.get_errors() for thread in threads if thread.get_errors())
         if thread_error_msg:
             self.__app.log_error("ERROR:\n" + thread_error_msg)
             # Do not clutter user message with any warnings etc from Nuke. Print only traceback.
@@ -193,7 +382,30 @@ class Renderer(object):
             # Make sure we don't display a success message.
             raise NukeSubprocessFailed("Error in tk-multi-reviewsubmission: " + subproc_traceback)
 
-        processed_paths = thread.get_processed_paths()
+        # each view rendered in its own process reports its own results
+        for thread in threads:
+            thread_views = thread.render_info['render_info']['views']
+            thread_movie_path = path_to_movie
+            if thread_views and thread_views['packing'] == 'separate' and len(thread_views['names']) == 1:
+                thread_movie_path = self._get_view_path(path_to_movie, thread_views['names'][0])
+
+            color_lut = thread.get_return_status().get('color_lut')
+            if color_lut:
+                self.__app.log_info("%s: %s LUT '%s' -> '%s' (%d^3): max delta %.5f, mean delta %.5f, "
+                                    "max delta above 1.0 %.5f"
+                                    % (os.path.basename(thread_movie_path),
+                                       "Used cached" if color_lut['cached'] else "Baked", color_lut['color_space'],
+                                       color_lut['display'], color_lut['cube_size'], color_lut['max_delta'],
+                                       color_lut['mean_delta'], color_lut.get('max_delta_above_one', 0.0)))
+
+            profile = thread.get_return_status().get('profile')
+            if profile:
+                self._report_render_profile(thread_movie_path, profile)
+
+        self._record_throughput(threads)
+        self._last_render_timing = self._get_render_timing(threads)
+
+        processed_paths = ":".join(thread.get_processed_paths() for thread in threads if thread.get_processed_paths())
         if not processed_paths:
             raise NoProcessedPathsReturnedByNukeSubprocess("Error in tk-multi-reviewsubmission: "
                                                            "No output paths were returned after the Nuke Render!")
@@ -207,6 +419,363 @@ class Renderer(object):
                                                                                "output": {"name": "Nuke"}})
             return processed_paths_list
 
+    def render_slate_card(self, path_to_movie, width, height, fps, frame_count, text, codec_profile):
+        """
+        Renders a short movie showing a text, e.g. the name of the next shot of a reel. It is
+        encoded with the settings of the review movies, so that it can be concatenated with
+        them without re-encoding.
+
+        :param path_to_movie: The path where the movie should be written to
+        :param width:         Movie width
+        :param height:        Movie height
+        :param fps:           Movie frame rate
+        :param frame_count:   Number of frames of the movie
+        :param text:          Text shown on the card
+        :param codec_profile: Codec profile the review movies were encoded with
+        :return:              Path of the rendered movie
+        """
+        launch_spec = self.get_launch_spec()
+        codec_settings = self._get_codec_settings(launch_spec['nuke_exe_path'], codec_profile)
+        render_info = {
+            'width': width,
+            'height': height,
+            'fps': fps,
+            'frame_count': frame_count,
+            'text': text,
+            'nuke_exe_path': launch_spec['nuke_exe_path'],
+            'nuke_threads': codec_settings['threads'],
+            'render_script_path': os.path.join(self.__app.disk_location, "hooks", "nuke_render_slate_card.py"),
+            'launch_env': launch_spec['env'],
+            'render_info': {'slate_font': self._font, 'codec_settings': codec_settings},
+            'movie_output_path': path_to_movie.replace('\\', '/'),
+        }
+
+        event_loop = QtCore.QEventLoop()
+        thread = SlateCardThread(render_info, nuke is None)
+        thread.finished.connect(event_loop.quit)
+        thread.start()
+        event_loop.exec_()
+
+        if thread.get_errors():
+            self.__app.log_error("ERROR:\n" + thread.get_errors())
+            raise NukeSubprocessFailed("Error in tk-multi-reviewsubmission: " + thread.get_errors())
+        return path_to_movie
+
+    def _write_job_script(self, render_info, published_movie_path=None):
+        """
+        Writes the job script of a render next to its published movie, or to the local
+        scratch folder if the movie is only rendered to be uploaded.
+
+        :param render_info:          Settings of the render, see gather_nuke_render_info()
+        :param published_movie_path: Path the movie is published to, None if it is rendered in place
+        :return:                     Path of the job script
+        """
+        movie_path = published_movie_path or render_info['movie_output_path']
+        if self.__app.get_setting("store_on_disk"):
+            job_script_path = "%s.nk" % os.path.splitext(movie_path)[0]
+            sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(job_script_path))
+        else:
+            job_script_path = os.path.join(get_scratch_folder("job_scripts"),
+                                           "%s.nk" % os.path.splitext(os.path.basename(movie_path))[0])
+
+        # nuke -x doesn't create the folder of the movie
+        sgtk.util.filesystem.ensure_folder_exists(os.path.dirname(render_info['movie_output_path']))
+        write_job_script(job_script_path, render_info, self.__app.context)
+        self.__app.log_debug("Rendering %s from job script %s" % (movie_path, job_script_path))
+        return job_script_path
+
+    def get_launch_spec(self):
+        """
+        Returns what the nuke subprocess is launched with: the Nuke executable, the render
+        script and the clean environment. They are resolved once per context, Nuke path,
+        render script template and the variables of this process' environment Nuke depends
+        on, and reused by all the renders sharing them.
+
+        :return: Dictionary with the "nuke_exe_path", "render_script_path", "serialized_context"
+                 and "env", which must not be modified
+        """
+        serialized_context = self.__app.context.serialize()
+        render_script_template = self.__app.get_template("render_script")
+        cache_key = (serialized_context,
+                     self.__app.get_setting(NUKE_PATH_SETTINGS[sys.platform]),
+                     render_script_template.definition if render_script_template else None,
+                     tuple(os.environ.get(name) for name in _LAUNCH_ENV_VARIABLES))
+
+        with _launch_spec_lock:
+            if cache_key not in _launch_specs:
+                if len(_launch_specs) >= _MAX_LAUNCH_SPECS:
+                    _launch_specs.clear()
+                _launch_specs[cache_key] = self._resolve_launch_spec(serialized_context)
+            return _launch_specs[cache_key]
+
+    def _resolve_launch_spec(self, serialized_context):
+        """
+        Resolves what the nuke subprocess is launched with, see get_launch_spec().
+        """
+        # First get Nuke executable path from project configuration environment
+        nuke_exe_path = self.__app.get_setting(NUKE_PATH_SETTINGS[sys.platform])
+
+        # making the python script passed to nuke configurable as a setting because
+        # making it a hook would still not allow us to subprocess it out
+        render_script_path = ''
+        render_script_template = self.__app.get_template("render_script")
+        if render_script_template:
+            render_script_path = render_script_template.apply_fields(self._context_fields)
+
+        # If a show specific render script has not been defined, take it from the default location
+        if not os.path.isfile(render_script_path):
+            render_script_path = os.path.join(self.__app.disk_location, "hooks",
+                                              "nuke_batch_render_movie.py")
+
+        return {
+            'nuke_exe_path': nuke_exe_path,
+            'render_script_path': render_script_path,
+            'serialized_context': serialized_context,
+            'env': formCleanEnv(),
+        }
+
+    def get_codec_profiles(self):
+        """
+        Returns the codec profiles defined by the codec settings hook.
+
+        :return: Dictionary of profile names and settings, empty if the hook doesn't define profiles
+        """
+        try:
+            return self.__app.execute_hook_method("codec_settings_hook", "get_codec_profiles")
+        except AttributeError:
+            # hooks written before profiles existed only provide get_quicktime_settings
+            return {}
+
+    def get_codec_profile(self, frame_count, width, height, upload_only):
+        """
+        Returns the codec profile to encode a movie with, as set by the codec_profile
+        setting or selected by the codec settings hook.
+
+        :param frame_count: Number of frames of the movie
+        :param width:       Movie width
+        :param height:      Movie height
+        :param upload_only: True if the movie is only rendered to be uploaded to Shotgun
+        :return:            Name of the codec profile
+        """
+        codec_profile = self.__app.get_setting("codec_profile")
+        if codec_profile != "auto":
+            return codec_profile
+
+        try:
+            return self.__app.execute_hook_method("codec_settings_hook", "select_codec_profile",
+                                                  frame_count=frame_count, width=width, height=height,
+                                                  upload_only=upload_only, calibration=self.get_codec_calibration())
+        except AttributeError:
+            return "balanced"
+
+    @staticmethod
+    def get_codec_calibration():
+        """
+        Returns the encode speeds of the codec profiles measured on this host by the
+        app's benchmark_codec_profiles(), None if they haven't been measured.
+        """
+        calibration_path = os.path.join(get_scratch_folder("codec_profiles"), "calibration.json")
+        if not os.path.isfile(calibration_path):
+            return None
+        with open(calibration_path) as calibration_file:
+            return json.load(calibration_file)
+
+    @staticmethod
+    def save_codec_calibration(calibration):
+        """
+        Saves the encode speeds of the codec profiles measured on this host.
+
+        :param calibration: Dictionary of profile names and measurements, see get_codec_calibration()
+        """
+        calibration_path = os.path.join(get_scratch_folder("codec_profiles"), "calibration.json")
+        temp_path = "%s.%d.tmp" % (calibration_path, os.getpid())
+        with open(temp_path, "w") as calibration_file:
+            json.dump(calibration, calibration_file, indent=2)
+        if os.path.exists(calibration_path) and sys.platform == "win32":
+            os.remove(calibration_path)
+        os.rename(temp_path, calibration_path)
+
+    def _get_codec_settings(self, nuke_exe_path, codec_profile):
+        """
+        Returns the Write node settings and the number of threads of a codec profile,
+        resolved by the codec settings hook once per Nuke version.
+
+        :param nuke_exe_path: Nuke executable the movie is rendered with
+        :param codec_profile: Name of the codec profile
+        :return:              Dictionary with the "quicktime" knob settings and "threads"
+        """
+        nuke_version = nuke.NUKE_VERSION_STRING if nuke else None
+        cache_key = (self.__app.get_setting("codec_settings_hook"), nuke_exe_path, nuke_version, codec_profile)
+        with _codec_settings_lock:
+            if cache_key not in _codec_settings_cache:
+                _codec_settings_cache[cache_key] = {
+                    'quicktime': self.__app.execute_hook_method("codec_settings_hook", "get_quicktime_settings",
+                                                                profile=codec_profile),
+                    'threads': self.get_codec_profiles().get(codec_profile, {}).get("threads", 0),
+                }
+            return copy.deepcopy(_codec_settings_cache[cache_key])
+
+    @staticmethod
+    def get_thumbnail_paths(thumbnail_folder):
+        """
+        Returns the thumbnails rendered along with a movie.
+
+        :param thumbnail_folder: The folder passed to render_in_nuke()
+        :return:                 Dictionary with the paths of the "thumbnail" and "filmstrip" images
+                                 which have been rendered, and of the "thumbnail_<width>" images of
+                                 the extra thumbnail sizes
+        """
+        thumbnail_paths = {}
+        if not os.path.isdir(thumbnail_folder):
+            return thumbnail_paths
+        for file_name in os.listdir(thumbnail_folder):
+            key, extension = os.path.splitext(file_name)
+            if extension == ".jpg" and (key in ("thumbnail", "filmstrip") or re.match(r"thumbnail_\d+$", key)):
+                thumbnail_paths[key] = os.path.join(thumbnail_folder, file_name)
+        return thumbnail_paths
+
+    def _run_shooter_threads(self, render_infos, run_in_batch_mode, active_progress_info,
+                             thread_class=None):
+        """
+        Runs a nuke subprocess per render info concurrently and waits for all of them.
+
+        :param render_infos:         List of settings to be used by the subprocesses
+        :param run_in_batch_mode:    If nuke should run in terminal mode
+        :param active_progress_info: Any function that receives the progress percentage
+        :param thread_class:         ShooterThread subclass running the subprocesses, ShooterThread if None
+        :return:                     List of finished ShooterThreads
+        """
+        # the renders run in parallel, so the whole batch takes as long as its longest render
+        model = get_throughput_model()
+        estimates = []
+        for render_info in render_infos:
+            width, height = self._get_rendered_size(render_info)
+            estimates.append(model.estimate_render(self._count_rendered_frames(render_info), width, height,
+                                                   render_info['render_info']['codec_settings']['profile']))
+        eta = RenderEta(sum(self._count_rendered_frames(render_info) for render_info in render_infos),
+                        max(estimates))
+        progress = RenderProgress(eta, active_progress_info)
+
+        event_loop = QtCore.QEventLoop()
+        threads = []
+        for render_info in render_infos:
+            thread = (thread_class or ShooterThread)(render_info, run_in_batch_mode, active_progress_info)
+            thread.finished.connect(event_loop.quit)
+            # progress is reported from this thread, not from the render threads
+            thread.frame_rendered.connect(progress.on_frame_rendered, QtCore.Qt.QueuedConnection)
+            thread.start()
+            threads.append(thread)
+
+        # each finished thread quits the event loop once, keep going until all are done
+        while not all(thread.isFinished() for thread in threads):
+            event_loop.exec_()
+
+        return threads
+
+    def _find_held_frames(self, path_to_frames, first_frame, last_frame):
+        """
+        Finds the holds in the source frames, keeping the longest ones if there are
+        too many to be remapped by the Read node.
+
+        :param path_to_frames: The path where frames should be found
+        :param first_frame:    The first frame of the sequence of frames
+        :param last_frame:     The last frame of the sequence of frames
+        :return:               List of (first held frame, last held frame, source frame) tuples
+        """
+        held_runs = find_held_frames(path_to_frames, first_frame, last_frame,
+                                     self.__app.get_setting("staging_threads"))
+        if len(held_runs) > MAX_HELD_RUNS:
+            held_runs = sorted(sorted(held_runs, key=lambda run: run[0] - run[1])[:MAX_HELD_RUNS])
+
+        if held_runs:
+            self.__app.log_info("Found %d held frames in %d holds in %s, their source frames are read once"
+                                % (sum(end - start + 1 for start, end, _ in held_runs), len(held_runs),
+                                   path_to_frames))
+        return held_runs
+
+    @staticmethod
+    def _count_rendered_frames(render_info):
+        """
+        Returns the number of frames a nuke subprocess writes to its movies, slates included.
+        """
+        frame_count = len(range(render_info['first_frame'], render_info['last_frame'] + 1,
+                                render_info['render_info'].get('frame_step', 1))) + 1
+        views = render_info['render_info'].get('views')
+        if views and views['packing'] == 'separate':
+            return frame_count * len(views['names'])
+        return frame_count
+
+    @classmethod
+    def _get_rendered_size(cls, render_info):
+        """
+        Returns the size of the movie frames a nuke subprocess writes, views packed.
+        """
+        return cls._get_packed_size(render_info['width'], render_info['height'],
+                                    render_info['render_info'].get('views'))
+
+    def get_last_render_timing(self):
+        """
+        Returns how long the frames of the last render took, from the first frame written to
+        the last one, so that the startup of Nuke isn't included.
+
+        :return: Tuple of the number of frames timed and the seconds they took, None if the
+                 render didn't write enough frames to be timed
+        """
+        return self._last_render_timing
+
+    @staticmethod
+    def _get_render_timing(threads):
+        """
+        Returns the frames timed by the finished renders and how long the renders took, see
+        get_last_render_timing(). Renders running in parallel are timed together.
+        """
+        frame_times = [thread.get_frame_times() for thread in threads if len(thread.get_frame_times()) >= 2]
+        if not frame_times:
+            return None
+        seconds = max(times[-1] for times in frame_times) - min(times[0] for times in frame_times)
+        return sum(len(times) - 1 for times in frame_times), seconds
+
+    def _record_throughput(self, threads):
+        """
+        Records how fast the finished renders went in the throughput model.
+
+        :param threads: List of finished ShooterThreads
+        """
+        model = get_throughput_model()
+        for thread in threads:
+            frame_times = thread.get_frame_times()
+            if len(frame_times) < 2:
+                continue
+            movie_size = sum(os.path.getsize(path) for path in thread.get_return_status().get('output_paths', [])
+                             if os.path.isfile(path))
+            width, height = self._get_rendered_size(thread.render_info)
+            model.record_render(width, height, thread.render_info['render_info']['codec_settings']['profile'],
+                                len(frame_times) - 1, frame_times[-1] - frame_times[0],
+                                frame_times[0] - thread.get_start_time(), movie_size)
+
+    def _report_render_profile(self, path_to_movie, profile):
+        """
+        Logs the most expensive nodes of a profiled render and saves the whole
+        profile to the profiles folder of the local scratch folder.
+
+        :param path_to_movie: The path the movie was written to
+        :param profile:       Profile returned by the nuke subprocess
+        """
+        self.__app.log_info("Rendered %s in %.1fs, peak memory %.1fMB. Most expensive nodes:"
+                            % (os.path.basename(path_to_movie), profile['wall'],
+                               profile['memory_max'] / (1024.0 * 1024.0)))
+        for node_info in profile['nodes'][:10]:
+            self.__app.log_info("  %s (%s): %.2fs wall, %.2fs cpu, %d calls"
+                                % (node_info['name'], node_info['class'], node_info['wall'], node_info['cpu'],
+                                   node_info['calls']))
+
+        profile_path = os.path.join(get_scratch_folder("profiles"), "%s.%s.json"
+                                    % (os.path.basename(path_to_movie), time.strftime("%Y%m%d_%H%M%S")))
+        profile = dict(profile, movie_path=path_to_movie, burnin_nk=self._burnin_nk)
+        with open(profile_path, "w") as profile_file:
+            json.dump(profile, profile_file, indent=2)
+        self.__app.log_debug("Saved render profile to %s" % profile_path)
+
 
 class NukeSubprocessFailed(Exception):
     pass
@@ -216,7 +785,28 @@ class NoProcessedPathsReturnedByNukeSubprocess(Exception):
     pass
 
 
+class RenderProgress(QtCore.QObject):
+    """
+    Reports the progress of renders, with an estimate of the time left, as their frames are rendered.
+    The percentage reported is the share of the expected render time which has elapsed.
+    """
+    def __init__(self, eta, active_progress_info=None):
+        QtCore.QObject.__init__(self)
+        self._eta = eta
+        self._active_progress_info = active_progress_info
+
+    def on_frame_rendered(self):
+        self._eta.frame_rendered()
+        message = self._eta.get_message()
+        if message and self._active_progress_info:
+            self._active_progress_info(percent=self._eta.get_percent_done(), msg=message,
+                                       stage={"item": {"name": "Render"}, "output": {"name": "Nuke"}})
+
+
 class ShooterThread(QtCore.QThread):
+    # emitted every time the nuke subprocess has written a frame of the movie
+    frame_rendered = QtCore.Signal()
+
     def __init__(self, render_info, batch_mode=True, active_progress_info=None):
         QtCore.QThread.__init__(self)
         self.render_info = render_info
@@ -224,6 +814,9 @@ class ShooterThread(QtCore.QThread):
         self.active_progress_info = active_progress_info
         self.subproc_error_msg = ''
         self.processed_paths = ''
+        self.return_status = {}
+        self.start_time = None
+        self.frame_times = []
 
     def get_errors(self):
         return self.subproc_error_msg
@@ -231,14 +824,37 @@ class ShooterThread(QtCore.QThread):
     def get_processed_paths(self):
         return self.processed_paths
 
-    def run(self):
-        if self.batch_mode:
-            nuke_flag = '-t'
-        else:
-            nuke_flag = '-it'
+    def get_return_status(self):
+        return self.return_status
+
+    def get_start_time(self):
+        return self.start_time
+
+    def get_frame_times(self):
+        return self.frame_times
+
+    def _get_nuke_prefix(self):
+        """
+        Returns the start of the command line of the nuke subprocess: the executable and
+        the number of threads it renders with.
+        """
+        cmd_and_args = [self.render_info['nuke_exe_path']]
+        if self.render_info.get('nuke_threads'):
+            cmd_and_args.extend(['-m', str(self.render_info['nuke_threads'])])
+        return cmd_and_args
+
+    def _get_nuke_flag(self):
+        """
+        Returns the flag nuke runs the subprocess script with.
+        """
+        return '-t' if self.batch_mode else '-it'
 
-        cmd_and_args = [
-            self.render_info['nuke_exe_path'], nuke_flag, self.render_info['render_script_path'],
+    def _get_command(self, nuke_flag):
+        """
+        Returns the command line of the nuke subprocess.
+        """
+        cmd_and_args = self._get_nuke_prefix() + [
+            nuke_flag, self.render_info['render_script_path'],
             '--path_to_frames', pickle.dumps(self.render_info['src_frames_path']),
             '--path_to_movie', pickle.dumps(self.render_info['movie_output_path']),
             '--extra_write_node_mapping', pickle.dumps(self.render_info['extra_write_node_mapping']),
@@ -253,17 +869,26 @@ class ShooterThread(QtCore.QThread):
             '--shotgun_context', self.render_info['serialized_context'],
             '--render_info', pickle.dumps(self.render_info['render_info']),
         ]
+        return cmd_and_args
 
-        clean_env = formCleanEnv()
-        clean_env["TANK_CONTEXT"] = self.render_info['serialized_context']
+    def run(self):
+        cmd_and_args = self._get_command(self._get_nuke_flag())
+
+        # the clean environment is shared by all renders, only the overlay of this render is applied
+        clean_env = dict(self.render_info['launch_env'])
+        clean_env.update(self.render_info.get('env_overlay', {}))
 
+        self.start_time = time.time()
         p = subprocess.Popen(cmd_and_args, stderr=subprocess.PIPE, env=clean_env, bufsize=1)
 
         output_lines = []
 
         while p.poll() is None:
             line = p.stderr.readline()
-            if line != '':
+            if line.startswith('[FRAME_RENDERED]'):
+                self.frame_times.append(time.time())
+                self.frame_rendered.emit()
+            elif line != '':
                 output_lines.append(line.rstrip())
 
             # disable the active progress update, clutters the whole UI
@@ -272,7 +897,13 @@ class ShooterThread(QtCore.QThread):
             #     self.active_progress_info(msg=line.rstrip(), stage={"item": {"name": "Render"},
             #                                                         "output": {"name": "Nuke"}})
 
-        if p.returncode != 0:
+        self._parse_output(p.returncode, output_lines)
+
+    def _parse_output(self, returncode, output_lines):
+        """
+        Reads the errors, processed paths and return status reported by the nuke subprocess.
+        """
+        if returncode != 0:
             output_str = '\n'.join(output_lines)
             try:
                 self.subproc_error_msg = output_str.split('[RETURN_STATUS_DATA]')[1]
@@ -284,4 +915,54 @@ class ShooterThread(QtCore.QThread):
             # we should get the paths now!!
             output_str = '\n'.join(output_lines)
             self.processed_paths = output_str.split('[PROCESSED_PATHS]')[1]
+            try:
+                self.return_status = ast.literal_eval(output_str.split('[RETURN_STATUS_DATA]')[1])
+            except (IndexError, SyntaxError, ValueError):
+                # older render scripts don't report anything but the status
+                self.return_status = {}
             del output_str
+
+
+class SlateCardThread(ShooterThread):
+    """
+    Runs the nuke subprocess rendering a slate card, see Renderer.render_slate_card().
+    """
+    def _get_command(self, nuke_flag):
+        cmd_and_args = self._get_nuke_prefix() + [
+            nuke_flag, self.render_info['render_script_path'],
+            '--path_to_movie', pickle.dumps(self.render_info['movie_output_path']),
+            '--width', pickle.dumps(self.render_info['width']),
+            '--height', pickle.dumps(self.render_info['height']),
+            '--fps', pickle.dumps(self.render_info['fps']),
+            '--frame_count', pickle.dumps(self.render_info['frame_count']),
+            '--text', pickle.dumps(self.render_info['text']),
+            '--render_info', pickle.dumps(self.render_info['render_info']),
+        ]
+        return cmd_and_args
+
+
+class JobScriptThread(ShooterThread):
+    """
+    Runs nuke on the job script of a render, see jobscript.py. The slate frame is
+    rendered before the frames of the movie.
+    """
+    def _get_nuke_flag(self):
+        # job scripts are executed rather than run as python scripts
+        return '-x' if self.batch_mode else '-ix'
+
+    def _get_command(self, nuke_flag):
+        cmd_and_args = self._get_nuke_prefix() + [
+            nuke_flag,
+            '-F', str(self.render_info['first_frame'] - 1),
+            '-F', get_frame_range(self.render_info),
+            self.render_info['job_script_path'],
+        ]
+        return cmd_and_args
+
+    def _parse_output(self, returncode, output_lines):
+        if returncode != 0:
+            # nuke reports errors of job scripts as they happen
+            self.subproc_error_msg = '\n'.join(output_lines) or "Nuke exited with status %d" % returncode
+        else:
+            self.processed_paths = self.render_info['movie_output_path']
+            self.return_status = {'status': 'OK', 'output_paths': [self.render_info['movie_output_path']]}
@@ -0,0 +1,354 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Staging of source frames from network storage to a local scratch cache.
+"""
+import hashlib
+import os
+import Queue
+import shutil
+import tempfile
+import threading
+import time
+
+import sgtk
+
+from .framespec import expand_frame_path
+
+try:
+    import fcntl
+except ImportError:
+    # no locking of cache entries on windows, only the entry of this process is protected
+    fcntl = None
+
+# name of the file used to track when a cache entry was last used
+_LAST_USED_MARKER = ".last_used"
+
+# name of the lock file of a cache entry, share locked by every process reading from the entry
+_IN_USE_LOCK = ".in_use"
+
+# appended to the path of a frame which failed to stage, for the render to read it from the network
+FAILED_FRAME_SUFFIX = ".failed"
+
+
+def get_scratch_folder(*sub_folders):
+    """
+    Returns a folder on local disk that can be used for scratch files,
+    creating it if needed.
+
+    :param sub_folders: Optional sub folder names to append to the scratch root
+    :return:            Path to the scratch folder
+    """
+    app = sgtk.platform.current_bundle()
+    scratch_root = app.get_setting("local_scratch_root") or os.path.join(tempfile.gettempdir(),
+                                                                       "tk-multi-reviewsubmission")
+    scratch_folder = os.path.join(scratch_root, *sub_folders)
+    sgtk.util.filesystem.ensure_folder_exists(scratch_folder)
+    return scratch_folder
+
+
+def open_lock_file(path):
+    """
+    Opens a lock file which isn't inherited by subprocesses, so that a Nuke process
+    started while the lock is held doesn't keep holding it.
+
+    :param path: Path to the lock file, created if needed
+    :return:     The open lock file
+    """
+    lock_file = open(path, "a")
+    if fcntl:
+        flags = fcntl.fcntl(lock_file.fileno(), fcntl.F_GETFD)
+        fcntl.fcntl(lock_file.fileno(), fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    return lock_file
+
+
+def copy_frame(source_path, destination_path):
+    """
+    Copies a single frame so that it appears atomically at the destination.
+
+    The data is written to a temporary file next to the destination first and
+    renamed into place, so a reader never sees a partially copied frame.
+
+    :param source_path:      Path to the frame on network storage
+    :param destination_path: Path to the frame in the scratch cache
+    """
+    temp_path = "%s.%d.%d.tmp" % (destination_path, os.getpid(), threading.current_thread().ident)
+    try:
+        shutil.copy2(source_path, temp_path)
+        os.rename(temp_path, destination_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class FrameStager(object):
+    """
+    Copies a frame range to a size capped, LRU evicted scratch cache using a pool
+    of worker threads.
+
+    Frames are queued in frame order so that copying stays ahead of a render that
+    starts as soon as the read-ahead window has landed. Frames already staged by a
+    previous render and unchanged on the network are reused as they are.
+    """
+
+    def __init__(self, cache_root, max_cache_size, thread_count=8, read_ahead=16):
+        """
+        Construction
+
+        :param cache_root:     Folder the staged frames are cached in
+        :param max_cache_size: Maximum size of the cache, in bytes
+        :param thread_count:   Number of frames copied concurrently
+        :param read_ahead:     Number of frames that must be staged before the render starts
+        """
+        self.__app = sgtk.platform.current_bundle()
+        self._cache_root = cache_root
+        self._max_cache_size = max_cache_size
+        self._thread_count = max(1, thread_count)
+        self._read_ahead = max(1, read_ahead)
+
+        self._queue = Queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._staged_event = threading.Event()
+        self._read_ahead_frames = set()
+        self._errors = []
+        self._entry_folder = None
+        self._entry_lock = None
+
+    def stage(self, path_to_frames, first_frame, last_frame, frame_step=1, skip_frames=None):
+        """
+        Starts staging the given frame range in the background.
+
+        :param path_to_frames: The path where frames should be found
+        :param first_frame:    The first frame of the sequence of frames
+        :param last_frame:     The last frame of the sequence of frames
+        :param frame_step:     Only stage every Nth frame
+        :param skip_frames:    Frames which won't be read, e.g. held frames
+        :return:               The path the staged frames can be read from
+        """
+        # each source sequence gets its own cache entry so it can be evicted as a whole
+        entry_key = hashlib.sha1(path_to_frames).hexdigest()
+        self._entry_folder = os.path.join(self._cache_root, entry_key)
+        self._entry_lock = self._lock_entry(self._entry_folder)
+        self._touch_entry(self._entry_folder)
+
+        frames = [frame for frame in range(first_frame, last_frame + 1, frame_step)
+                  if not skip_frames or frame not in skip_frames]
+
+        # make room for the frames about to be staged
+        incoming_size = 0
+        for frame in frames:
+            source_path = expand_frame_path(path_to_frames, frame)
+            if os.path.isfile(source_path):
+                incoming_size += os.path.getsize(source_path)
+        self._evict(self._entry_folder, incoming_size)
+
+        staged_path = os.path.join(self._entry_folder, os.path.basename(path_to_frames))
+        self._read_ahead_frames = set(frames[:self._read_ahead])
+        for frame in frames:
+            self._queue.put((frame, expand_frame_path(path_to_frames, frame),
+                             expand_frame_path(staged_path, frame)))
+
+        for _ in range(min(self._thread_count, len(frames))):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        if not self._workers:
+            self._staged_event.set()
+
+        return staged_path
+
+    def wait_for_read_ahead(self, timeout=None):
+        """
+        Blocks until the read-ahead window has been staged.
+
+        :param timeout: Maximum number of seconds to wait for, None to wait forever
+        :return:        True if the read-ahead window is available
+        """
+        self._staged_event.wait(timeout)
+        return self._staged_event.is_set()
+
+    def stop(self):
+        """
+        Cancels any frames which haven't been picked up by a worker yet and waits
+        for the frames being copied to land.
+
+        :return: List of error messages from the workers
+        """
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Queue.Empty:
+                break
+
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+        # frames of the read-ahead window may have been cancelled, nobody may wait for them
+        self._staged_event.set()
+
+        if self._entry_folder:
+            self._touch_entry(self._entry_folder)
+
+        # the render is over, the entry can be evicted again
+        if self._entry_lock:
+            self._entry_lock.close()
+            self._entry_lock = None
+
+        return self._errors
+
+    def _worker(self):
+        """
+        Worker thread loop, copies queued frames until the queue is empty.
+        """
+        while True:
+            try:
+                frame, source_path, staged_path = self._queue.get_nowait()
+            except Queue.Empty:
+                break
+
+            try:
+                if os.path.isfile(source_path) and not self._is_current(source_path, staged_path):
+                    copy_frame(source_path, staged_path)
+                    if os.path.exists(staged_path + FAILED_FRAME_SUFFIX):
+                        os.remove(staged_path + FAILED_FRAME_SUFFIX)
+            except Exception, e:
+                # the render reads the frame from the network instead, so keep going
+                with self._lock:
+                    self._errors.append("Failed to stage %s: %s" % (source_path, e))
+                self._mark_failed(staged_path)
+
+            with self._lock:
+                self._read_ahead_frames.discard(frame)
+                if not self._read_ahead_frames:
+                    self._staged_event.set()
+
+    @staticmethod
+    def _mark_failed(staged_path):
+        """
+        Tells the render a frame won't be staged, so that it doesn't wait for it.
+        """
+        try:
+            with open(staged_path + FAILED_FRAME_SUFFIX, "w"):
+                pass
+        except (IOError, OSError):
+            # the render waits for the frame and then reads it from the network
+            pass
+
+    @staticmethod
+    def _is_current(source_path, staged_path):
+        """
+        Checks if a previously staged frame can be reused.
+        """
+        if not os.path.isfile(staged_path):
+            return False
+        source_stat = os.stat(source_path)
+        staged_stat = os.stat(staged_path)
+        # copy2 carries the modification time over with less than the precision of the
+        # file system, so times are compared to the second
+        return source_stat.st_size == staged_stat.st_size and int(source_stat.st_mtime) <= int(staged_stat.st_mtime)
+
+    @staticmethod
+    def _touch_entry(entry_folder):
+        """
+        Records that the cache entry has just been used.
+        """
+        with open(os.path.join(entry_folder, _LAST_USED_MARKER), "w"):
+            pass
+
+    @staticmethod
+    def _lock_entry(entry_folder):
+        """
+        Share locks a cache entry for as long as frames are read from it, so that no
+        other process evicts it.
+
+        :param entry_folder: Cache entry folder, created if needed
+        :return:             The open lock file, closing it releases the entry
+        """
+        lock_path = os.path.join(entry_folder, _IN_USE_LOCK)
+        while True:
+            sgtk.util.filesystem.ensure_folder_exists(entry_folder)
+            lock_file = open_lock_file(lock_path)
+            if not fcntl:
+                return lock_file
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            # the entry may have been evicted while we were waiting for the lock
+            if os.path.exists(lock_path) and os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+            lock_file.close()
+
+    def _evict(self, keep, incoming_size):
+        """
+        Removes the least recently used cache entries until the cache fits its size cap
+        along with the frames about to be staged. Entries in use by any process are kept.
+
+        :param keep:          Cache entry folder the frames are about to be staged to
+        :param incoming_size: Size of the frames about to be staged, in bytes
+        """
+        entries = []
+        # the frames already staged to the kept entry are replaced by the incoming ones
+        total_size = incoming_size
+        for entry_name in os.listdir(self._cache_root):
+            entry_folder = os.path.join(self._cache_root, entry_name)
+            if not os.path.isdir(entry_folder) or entry_folder == keep:
+                continue
+
+            entry_size = 0
+            for file_name in os.listdir(entry_folder):
+                try:
+                    entry_size += os.path.getsize(os.path.join(entry_folder, file_name))
+                except OSError:
+                    # removed while we were looking at it
+                    pass
+
+            marker_path = os.path.join(entry_folder, _LAST_USED_MARKER)
+            last_used = os.path.getmtime(marker_path) if os.path.exists(marker_path) else 0
+            entries.append((last_used, entry_folder, entry_size))
+            total_size += entry_size
+
+        for last_used, entry_folder, entry_size in sorted(entries):
+            if total_size <= self._max_cache_size:
+                break
+            if not self._evict_entry(entry_folder):
+                self.__app.log_debug("Not evicting staged frames %s, they are in use" % entry_folder)
+                continue
+            self.__app.log_debug("Evicted staged frames %s (last used %s)"
+                                 % (entry_folder, time.ctime(last_used)))
+            total_size -= entry_size
+
+        if total_size > self._max_cache_size:
+            self.__app.log_debug("Staged frames use %dMB, more than the %dMB cache size, as frames in use "
+                                 "can't be evicted" % (total_size / 1024 / 1024, self._max_cache_size / 1024 / 1024))
+
+    @staticmethod
+    def _evict_entry(entry_folder):
+        """
+        Removes a cache entry unless a process is reading from it.
+
+        :return: True if the entry has been removed
+        """
+        if not fcntl:
+            shutil.rmtree(entry_folder, ignore_errors=True)
+            return True
+
+        lock_file = open_lock_file(os.path.join(entry_folder, _IN_USE_LOCK))
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return False
+            shutil.rmtree(entry_folder, ignore_errors=True)
+            return True
+        finally:
+            lock_file.close()
@@ -0,0 +1,193 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Uploading of movies to Shotgun while they are still being rendered.
+"""
+import os
+import threading
+
+import sgtk
+
+from .connections import get_connection_pool
+from .multipart import MultipartUploadSession
+from .upload_scheduler import PRIORITY_MOVIE, get_upload_scheduler
+
+
+class StreamingUpload(object):
+    """
+    Uploads a movie to Shotgun storage while it is still being encoded.
+
+    A background thread follows the growing file and uploads every part as soon
+    as the encoder has written past its end. The first part is held back until
+    the render is done, as movie writers patch the header at the start of the
+    file when they close it. Only writers which otherwise append to the file are
+    safe to stream, see the stream_upload setting.
+    """
+
+    def __init__(self, entity_type="Version", field_name="sg_uploaded_movie", poll_interval=1.0):
+        """
+        Construction
+
+        :param entity_type:   Entity type the movie will be linked to
+        :param field_name:    Field the movie will be linked to
+        :param poll_interval: Seconds between checks of the size of the growing file
+        """
+        self.__app = sgtk.platform.current_bundle()
+        self._sg = None
+        self._entity_type = entity_type
+        self._field_name = field_name
+        self._poll_interval = poll_interval
+
+        self._session = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._next_part = 2
+        self._error = None
+        self._completed = False
+
+    def start(self, path_to_movie):
+        """
+        Starts following the movie the render is about to write.
+
+        :param path_to_movie: Path the movie is written to
+        """
+        # the upload spans several threads one after the other, but never shares its connection
+        self._sg = get_connection_pool().acquire()
+        if not MultipartUploadSession.is_supported(self._sg, self._entity_type, self._field_name):
+            self.__app.log_debug("Site doesn't support multipart uploads, the movie will be uploaded "
+                                 "once it has been rendered.")
+            self._release_connection()
+            return
+
+        # a movie left there by an earlier render would be streamed before the encoder truncates it
+        if os.path.exists(path_to_movie):
+            os.remove(path_to_movie)
+
+        self._session = MultipartUploadSession(self._sg, os.path.basename(path_to_movie))
+        self._thread = threading.Thread(target=self._follow, args=(path_to_movie,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops following the movie, to be called once the render is over.
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def abort(self):
+        """
+        Stops following the movie and gives up on the upload, to be called if the render failed.
+        """
+        self.stop()
+        if self._session and not self._completed:
+            self._session.abort()
+            self._session = None
+        self._release_connection()
+
+    def finish(self, path_to_movie):
+        """
+        Uploads the parts which haven't been uploaded yet and completes the upload.
+
+        :param path_to_movie: Path to the complete movie, which may have been moved since the render
+        :return:              True if the movie has been uploaded, False if it must be uploaded in one go
+        """
+        self.stop()
+        if not self._session or self._error:
+            if self._error:
+                self.__app.log_warning("Streaming upload of %s failed, uploading it again: %s"
+                                       % (path_to_movie, self._error))
+            self.abort()
+            return False
+
+        try:
+            self._upload_remaining_parts(path_to_movie)
+        except Exception:
+            self.abort()
+            raise
+        self._completed = True
+        return True
+
+    def _upload_remaining_parts(self, path_to_movie):
+        """
+        Uploads the first part and the parts written after the render stopped being followed.
+        """
+        # parts are sent in an upload slot and metered like any other upload of the host
+        scheduler = get_upload_scheduler()
+        part_size = self._session.part_size
+        with scheduler.upload_slot(PRIORITY_MOVIE):
+            with open(path_to_movie, "rb") as movie_file:
+                first_part = movie_file.read(part_size)
+                scheduler.call(len(first_part), self._session.upload_part, 1, first_part)
+
+                part_number = self._next_part
+                movie_file.seek((part_number - 1) * part_size)
+                while True:
+                    data = movie_file.read(part_size)
+                    if not data:
+                        break
+                    scheduler.call(len(data), self._session.upload_part, part_number, data)
+                    part_number += 1
+
+            scheduler.call(0, self._session.complete)
+
+    def link(self, entity_id, display_name=None):
+        """
+        Links the uploaded movie to the entity it was uploaded for.
+
+        :param entity_id:    Id of the entity to link the movie to
+        :param display_name: Name to display for the movie
+        """
+        if not self._completed:
+            raise StreamingUploadFailed("Can't link a movie which hasn't been completely uploaded!")
+        try:
+            return self._session.link(self._entity_type, entity_id, self._field_name, display_name)
+        finally:
+            self._release_connection()
+
+    def _release_connection(self):
+        """
+        Returns the connection of the upload to the pool, once it isn't needed anymore.
+        """
+        if self._sg:
+            get_connection_pool().release(self._sg)
+            self._sg = None
+
+    def _follow(self, path_to_movie):
+        """
+        Thread loop uploading the parts the encoder is done with.
+        """
+        try:
+            scheduler = get_upload_scheduler()
+            scheduler.call(0, self._session.begin)
+            part_size = self._session.part_size
+            while not self._stop_event.is_set():
+                self._stop_event.wait(self._poll_interval)
+                # a part is final once the encoder has written past its end
+                if not os.path.exists(path_to_movie) or \
+                        os.path.getsize(path_to_movie) < self._next_part * part_size:
+                    continue
+
+                # the slot is only held while parts are sent, not for the whole render
+                with scheduler.upload_slot(PRIORITY_MOVIE):
+                    while os.path.getsize(path_to_movie) >= self._next_part * part_size:
+                        with open(path_to_movie, "rb") as movie_file:
+                            movie_file.seek((self._next_part - 1) * part_size)
+                            data = movie_file.read(part_size)
+                        scheduler.call(len(data), self._session.upload_part, self._next_part, data)
+                        self._next_part += 1
+        except Exception, e:
+            self._error = e
+
+
+class StreamingUploadFailed(Exception):
+    pass
@@ -12,8 +12,20 @@
 """
 import sgtk
 import os
+import threading
+import time
 from sgtk.platform.qt import QtCore
 
+from .connections import get_connection_pool, get_session_cache
+from .throughput import get_throughput_model
+from .upload_scheduler import PRIORITY_THUMBNAIL, get_upload_scheduler
+
+# seconds waited before retrying a failed upload, doubled on every retry
+_UPLOAD_RETRY_BACKOFF = 5
+
+# appended to the key versions are tagged with once their submission is complete
+_COMPLETE_KEY_SUFFIX = ":complete"
+
 class Submitter(object):
     
     def __init__(self):
@@ -21,16 +33,38 @@ class Submitter(object):
         Construction
         """
         self.__app = sgtk.platform.current_bundle()
+        self._connection_pool = get_connection_pool()
+        self._cache = get_session_cache()
     
     def submit_version(self, path_to_frames, path_to_movie, thumbnail_path, sg_publishes,
                         sg_task, comment, store_on_disk, first_frame, last_frame,
-                        upload_to_shotgun, version_name=None):
+                        upload_to_shotgun, version_name=None, movie_upload=None, extra_movie_paths=None,
+                        rendered_thumbnails=None, submission=None):
         """
         Create a version in Shotgun for this path and linked to this publish.
+
+        If a StreamingUpload is given, the parts of the movie uploaded during the
+        render are linked to the version instead of uploading the movie again.
+        The movies of any additional views are attached to the same version.
+        Thumbnails rendered along with the movie are uploaded alongside it, the extra
+        thumbnail sizes being attached to the version unless they are stored on disk.
+
+        If a SubmissionManifest is given, the version created by an earlier attempt
+        of the submission is reused and only the uploads which didn't complete are
+        done again.
         """
+        rendered_thumbnails = self._get_thumbnails_to_upload(rendered_thumbnails, store_on_disk)
+        sg_version = self.find_submitted_version(submission) if submission else None
+        if sg_version:
+            self.__app.log_info("Reusing version %s created by an earlier attempt of this submission"
+                                % sg_version["code"])
+            self._upload_files(sg_version, path_to_movie, thumbnail_path, upload_to_shotgun, movie_upload,
+                               extra_movie_paths, rendered_thumbnails, submission)
+            return sg_version
         
-        # get current shotgun user
-        current_user = sgtk.util.get_current_user(self.__app.sgtk)
+        # get current shotgun user, looked up once per session
+        site_key = self.__app.sgtk.shotgun_url
+        current_user = self._cache.get((site_key, "current_user"), self._find_current_user)
 
         # If no version name is defined in the env config...
         if not version_name:
@@ -63,7 +97,11 @@ class Submitter(object):
             "project": ctx.project,
         }
 
-        if sgtk.util.get_published_file_entity_type(self.__app.sgtk) == "PublishedFile":
+        # read from the pipeline configuration, no need for a connection
+        published_file_entity_type = self._cache.get(
+            (site_key, "published_file_entity_type"),
+            lambda: self.__app.sgtk.pipeline_configuration.get_published_file_entity_type())
+        if published_file_entity_type == "PublishedFile":
             data["published_files"] = sg_publishes
         else:# == "TankPublishedFile"
             if len(sg_publishes) > 0:
@@ -73,28 +111,217 @@ class Submitter(object):
 
         if store_on_disk:
             data["sg_path_to_movie"] = path_to_movie
+            data.update(self._get_extra_views_data(extra_movie_paths))
 
-        sg_version = self.__app.sgtk.shotgun.create("Version", data)
+        valid_statuses = self._get_version_schema().get("sg_status_list", {}).get("properties", {}).get(
+            "valid_values", {}).get("value")
+        if valid_statuses and data["sg_status_list"] not in valid_statuses:
+            self.__app.log_warning("Status '%s' is not a valid Version status!" % data["sg_status_list"])
+
+        submission_key_field = self._get_submission_key_field()
+        if submission and submission_key_field:
+            data[submission_key_field] = submission.key
+
+        with self._connection_pool.connection() as sg:
+            sg_version = sg.create("Version", data)
         self.__app.log_debug("Created version in shotgun: %s" % str(data))
+        if submission:
+            submission.set("version", {"type": "Version", "id": sg_version["id"], "code": sg_version["code"]})
+            submission.set("uploads", [])
         
         # upload files:
-        self._upload_files(sg_version, path_to_movie, thumbnail_path, upload_to_shotgun)
+        self._upload_files(sg_version, path_to_movie, thumbnail_path, upload_to_shotgun, movie_upload,
+                           extra_movie_paths, rendered_thumbnails, submission)
         
         return sg_version
     
-    def _upload_files(self, sg_version, output_path, thumbnail_path, upload_to_shotgun):
+    def replace_movie(self, sg_version, path_to_movie, store_on_disk, extra_movie_paths=None,
+                      rendered_thumbnails=None):
         """
+        Replace the movie of an existing version, e.g. the preview of a quick look submission,
+        along with the thumbnails rendered with the preview if new ones have been rendered.
         """
-        # Upload in a new thread and make our own event loop to wait for the
-        # thread to finish.
-        event_loop = QtCore.QEventLoop()
-        thread = UploaderThread(self.__app, sg_version, output_path, thumbnail_path, upload_to_shotgun)
-        thread.finished.connect(event_loop.quit)
-        thread.start()
-        event_loop.exec_()
-        
+        if store_on_disk:
+            data = {"sg_path_to_movie": path_to_movie}
+            data.update(self._get_extra_views_data(extra_movie_paths))
+            with self._connection_pool.connection() as sg:
+                sg.update("Version", sg_version["id"], data)
+
+        self._upload_files(sg_version, path_to_movie, None, True, extra_movie_paths=extra_movie_paths,
+                           rendered_thumbnails=self._get_thumbnails_to_upload(rendered_thumbnails, store_on_disk))
+
+    def set_review_phase(self, sg_version, phase):
+        """
+        Record which phase of a quick look submission the movie of a version comes from.
+        """
+        sg_version["review_phase"] = phase
+
+        review_phase_field = self.__app.get_setting("review_phase_field")
+        if not review_phase_field:
+            return
+        if review_phase_field not in self._get_version_schema():
+            self.__app.log_warning("Version field '%s' doesn't exist, can't record the review phase!"
+                                   % review_phase_field)
+            return
+
+        with self._connection_pool.connection() as sg:
+            sg.update("Version", sg_version["id"], {review_phase_field: phase})
+
+    def find_submitted_version(self, submission, complete=False):
+        """
+        Find the version created by an earlier attempt of a submission, in a single query.
+
+        Versions are looked up by the field defined by the submission_key_field setting, so
+        that attempts made on other hosts are found too, and by the id recorded in the
+        submission manifest otherwise. The key of a complete submission is marked as such,
+        so that its version is never taken for the one of an interrupted attempt, even if
+        it was submitted from another host or its manifest has been pruned.
+
+        :param submission: The SubmissionManifest of the submission
+        :param complete:   True to find the version of a complete submission, False for the
+                           version of an attempt which was interrupted
+        :return:           The version, None if it doesn't exist
+        """
+        submission_key_field = self._get_submission_key_field()
+        if submission_key_field:
+            filters = [[submission_key_field, "is", self._get_version_key(submission, complete)]]
+        elif submission.get("version") and bool(submission.get("complete")) == complete:
+            filters = [["id", "is", submission.get("version")["id"]]]
+        else:
+            return None
+
+        with self._connection_pool.connection() as sg:
+            sg_version = sg.find_one("Version", filters, ["code", "entity", "sg_task", "sg_path_to_movie"])
+
+        if sg_version and (submission.get("version") or {}).get("id") != sg_version["id"]:
+            # created on another host, the uploads of that attempt are unknown
+            submission.set("version", {"type": "Version", "id": sg_version["id"], "code": sg_version["code"]})
+            submission.set("uploads", [])
+        return sg_version
+
+    def complete_submission(self, sg_version, submission):
+        """
+        Records that a submission is complete, marking the key its version is tagged with
+        as complete too.
+
+        :param sg_version: The version of the submission
+        :param submission: The SubmissionManifest of the submission
+        """
+        submission_key_field = self._get_submission_key_field()
+        if submission_key_field:
+            with self._connection_pool.connection() as sg:
+                sg.update("Version", sg_version["id"],
+                          {submission_key_field: self._get_version_key(submission, complete=True)})
+        submission.set("complete", True)
+
+    def has_submission_key_field(self):
+        """
+        Checks if versions are tagged with the key of their submission, see the
+        submission_key_field setting.
+        """
+        return self._get_submission_key_field() is not None
+
+    @staticmethod
+    def _get_version_key(submission, complete):
+        """
+        Returns the key the version of a submission is tagged with.
+        """
+        return submission.key + _COMPLETE_KEY_SUFFIX if complete else submission.key
+
+    def _get_submission_key_field(self):
+        """
+        Returns the Version field submissions are tagged with, None if it isn't configured or doesn't exist.
+        """
+        submission_key_field = self.__app.get_setting("submission_key_field")
+        if not submission_key_field:
+            return None
+        if submission_key_field not in self._get_version_schema():
+            self.__app.log_warning("Version field '%s' doesn't exist, can't tag the submission!"
+                                   % submission_key_field)
+            return None
+        return submission_key_field
+
+    @staticmethod
+    def _get_thumbnails_to_upload(rendered_thumbnails, store_on_disk):
+        """
+        Returns the rendered thumbnails to upload. The extra thumbnail sizes are kept next
+        to the movie when it is stored on disk, and only uploaded otherwise.
+        """
+        if not rendered_thumbnails or not store_on_disk:
+            return rendered_thumbnails
+        return dict((key, path) for key, path in rendered_thumbnails.iteritems() if not key.startswith("thumbnail_"))
+
+    def _find_current_user(self):
+        """
+        Returns the current Shotgun user, as resolved by the toolkit for both human and
+        script authentication.
+        """
+        return sgtk.util.get_current_user(self.__app.sgtk)
+
+    def _get_extra_views_data(self, extra_movie_paths):
+        """
+        Returns the Version fields recording where the movies of the other views are stored
+        on disk. They are only logged if the extra_views_field setting isn't configured.
+        """
+        if not extra_movie_paths:
+            return {}
+        self.__app.log_info("Movies of the other views: %s" % ", ".join(extra_movie_paths))
+
+        extra_views_field = self.__app.get_setting("extra_views_field")
+        if not extra_views_field:
+            return {}
+        if extra_views_field not in self._get_version_schema():
+            self.__app.log_warning("Version field '%s' doesn't exist, can't record the movies of the other views!"
+                                   % extra_views_field)
+            return {}
+        return {extra_views_field: "\n".join(extra_movie_paths)}
+
+    def _get_version_schema(self):
+        """
+        Returns the schema of the Version entity, looked up once per session.
+        """
+        def _read_schema():
+            with self._connection_pool.connection() as sg:
+                return sg.schema_field_read("Version")
+
+        return self._cache.get((self.__app.sgtk.shotgun_url, "schema", "Version"), _read_schema)
+
+    def _upload_files(self, sg_version, output_path, thumbnail_path, upload_to_shotgun, movie_upload=None,
+                      extra_movie_paths=None, rendered_thumbnails=None, submission=None):
+        """
+        Upload the files of a version, retrying the uploads which failed with exponential backoff.
+        """
+        # uploads done by earlier attempts of the submission are skipped
+        completed_uploads = set(submission.get("uploads", [])) if submission else set()
+
+        retries = self.__app.get_setting("submission_retries")
+        for attempt in range(retries + 1):
+            # Upload in a new thread and make our own event loop to wait for the
+            # thread to finish.
+            event_loop = QtCore.QEventLoop()
+            # a streaming upload can't be resumed, retries upload the movie in one go
+            thread = UploaderThread(self.__app, sg_version, output_path, thumbnail_path, upload_to_shotgun,
+                                    movie_upload if attempt == 0 else None, extra_movie_paths, rendered_thumbnails,
+                                    completed_uploads)
+            thread.finished.connect(event_loop.quit)
+            thread.start()
+            event_loop.exec_()
+
+            if submission:
+                submission.set("uploads", sorted(completed_uploads))
+
+            thread_errors = thread.get_errors()
+            if not thread_errors or attempt == retries:
+                break
+
+            backoff = _UPLOAD_RETRY_BACKOFF * 2 ** attempt
+            self.__app.log_warning("Upload to Shotgun failed, retrying in %ds:\n%s"
+                                   % (backoff, "\n".join(thread_errors)))
+            # keep the UI responsive while waiting
+            QtCore.QTimer.singleShot(backoff * 1000, event_loop.quit)
+            event_loop.exec_()
+
         # log any errors generated in the thread
-        thread_errors = thread.get_errors()
         if thread_errors:
             for e in thread_errors:
                 self.__app.log_error(e)
@@ -109,13 +336,19 @@ class UploaderThread(QtCore.QThread):
     Broken out of the main loop so that the UI can remain responsive
     even though an upload is happening
     """
-    def __init__(self, app, version, path_to_movie, thumbnail_path, upload_to_shotgun):
+    def __init__(self, app, version, path_to_movie, thumbnail_path, upload_to_shotgun, movie_upload=None,
+                 extra_movie_paths=None, rendered_thumbnails=None, completed_uploads=None):
         QtCore.QThread.__init__(self)
         self._app = app
         self._version = version
         self._path_to_movie = path_to_movie
         self._thumbnail_path = thumbnail_path
         self._upload_to_shotgun = upload_to_shotgun
+        self._movie_upload = movie_upload
+        self._extra_movie_paths = extra_movie_paths or []
+        self._rendered_thumbnails = rendered_thumbnails or {}
+        # names of the uploads done, shared with other attempts so that they are skipped
+        self._completed_uploads = completed_uploads if completed_uploads is not None else set()
         self._errors = []
 
     def get_errors(self):
@@ -128,17 +361,100 @@ class UploaderThread(QtCore.QThread):
         """
         Thread loop
         """
+        # use a connection of our own, connections can't be shared between threads
+        with get_connection_pool().connection() as sg:
+            self._upload(sg)
+
+    def _upload(self, sg):
+        """
+        Upload the files with the given connection, sharing the bandwidth with the
+        other uploads of the host.
+        """
         upload_error = False
+        scheduler = get_upload_scheduler()
 
-        if self._upload_to_shotgun:
+        # thumbnails rendered along with the movie don't have to wait for it
+        thumbnail_thread = None
+        if self._rendered_thumbnails:
+            thumbnail_thread = threading.Thread(target=self._upload_rendered_thumbnails)
+            thumbnail_thread.start()
+
+        if self._upload_to_shotgun and "movie" not in self._completed_uploads:
             try:
-                self._app.sgtk.shotgun.upload("Version", self._version["id"], self._path_to_movie, "sg_uploaded_movie")
+                if not self._finish_streaming_upload():
+                    upload_start = time.time()
+                    scheduler.upload(sg, "Version", self._version["id"], self._path_to_movie, "sg_uploaded_movie")
+                    get_throughput_model().record_upload(os.path.getsize(self._path_to_movie),
+                                                         time.time() - upload_start)
+                self._completed_uploads.add("movie")
             except Exception, e:
                 self._errors.append("Movie upload to Shotgun failed: %s" % e)
                 upload_error = True
 
-        if not self._upload_to_shotgun or upload_error:
+        if self._upload_to_shotgun:
+            # the movies of the other views are attached to the version
+            for extra_movie_path in self._extra_movie_paths:
+                upload_name = "movie:%s" % os.path.basename(extra_movie_path)
+                if upload_name in self._completed_uploads:
+                    continue
+                try:
+                    scheduler.upload(sg, "Version", self._version["id"], extra_movie_path,
+                                     display_name=os.path.basename(extra_movie_path))
+                    self._completed_uploads.add(upload_name)
+                except Exception, e:
+                    self._errors.append("Movie upload to Shotgun failed: %s" % e)
+
+        if thumbnail_thread:
+            thumbnail_thread.join()
+        elif (not self._upload_to_shotgun or upload_error) and "thumbnail" not in self._completed_uploads:
             try:
-                self._app.sgtk.shotgun.upload_thumbnail("Version", self._version["id"], self._thumbnail_path)
+                scheduler.upload_thumbnail(sg, "Version", self._version["id"], self._thumbnail_path)
+                self._completed_uploads.add("thumbnail")
             except Exception, e:
                 self._errors.append("Thumbnail upload to Shotgun failed: %s" % e)
+
+    def _upload_rendered_thumbnails(self):
+        """
+        Upload the thumbnail and filmstrip rendered along with the movie, with a connection of their own.
+        Extra thumbnail sizes are attached to the version.
+        """
+        scheduler = get_upload_scheduler()
+        with get_connection_pool().connection() as sg:
+            for key in ("thumbnail", "filmstrip"):
+                if key not in self._rendered_thumbnails or key in self._completed_uploads:
+                    continue
+                try:
+                    scheduler.upload_thumbnail(sg, "Version", self._version["id"], self._rendered_thumbnails[key],
+                                               filmstrip=(key == "filmstrip"))
+                    self._completed_uploads.add(key)
+                except Exception, e:
+                    self._errors.append("Thumbnail upload to Shotgun failed: %s" % e)
+
+            for key in sorted(self._rendered_thumbnails):
+                if not key.startswith("thumbnail_") or key in self._completed_uploads:
+                    continue
+                try:
+                    scheduler.upload(sg, "Version", self._version["id"], self._rendered_thumbnails[key],
+                                     display_name="%s_%s.jpg" % (self._version.get("code", "version"), key),
+                                     priority=PRIORITY_THUMBNAIL)
+                    self._completed_uploads.add(key)
+                except Exception, e:
+                    self._errors.append("Thumbnail upload to Shotgun failed: %s" % e)
+
+    def _finish_streaming_upload(self):
+        """
+        Completes the upload of a movie which has been streamed during the render.
+
+        :return: True if the movie has been uploaded and linked to the version
+        """
+        if not self._movie_upload:
+            return False
+
+        try:
+            if self._movie_upload.finish(self._path_to_movie):
+                self._movie_upload.link(self._version["id"])
+                return True
+        except Exception, e:
+            # the movie is complete on disk, so it can still be uploaded in one go
+            self._app.log_warning("Streaming upload of %s failed: %s" % (self._path_to_movie, e))
+        return False
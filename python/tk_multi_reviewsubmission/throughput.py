@@ -0,0 +1,274 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Render and upload speeds measured on this host, used for time estimates.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import sgtk
+
+from .staging import get_scratch_folder
+
+# weight of the latest measurement in the moving averages
+_SMOOTHING = 0.3
+
+# assumed speeds until something has been measured
+_DEFAULT_PIXELS_PER_SECOND = 10 * 1920 * 1080
+_DEFAULT_STARTUP_SECONDS = 15.0
+_DEFAULT_BYTES_PER_PIXEL = 0.15
+_DEFAULT_UPLOAD_BYTES_PER_SECOND = 5 * 1024 * 1024
+
+# frames rendered before the measured frame rate is trusted over the model
+_MIN_OBSERVED_FRAMES = 3
+
+# minimum number of seconds between two progress reports of a render
+_REPORT_INTERVAL = 2.0
+
+# percentages of the progress of a submission left to preparing it and to cleaning up
+_PROGRESS_START = 10
+_PROGRESS_END = 95
+
+_models_lock = threading.Lock()
+_models = {}
+
+
+class ThroughputModel(object):
+    """
+    Moving averages of the render and upload speeds of a show on this host,
+    persisted to a json file of the local scratch folder.
+
+    Render speeds are kept per codec profile, both per resolution and in pixels
+    per second for resolutions which haven't been rendered yet.
+    """
+
+    def __init__(self, path):
+        """
+        Construction
+
+        :param path: Path of the json file the statistics are persisted to
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._stats = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as stats_file:
+                    self._stats = json.load(stats_file)
+            except ValueError:
+                # a corrupt file only costs the history
+                self._stats = {}
+
+    def record_render(self, width, height, codec_profile, frame_count, render_seconds, startup_seconds,
+                      movie_size=None):
+        """
+        Records a completed render.
+
+        :param width:           Movie width
+        :param height:          Movie height
+        :param codec_profile:   Codec profile the movie was encoded with
+        :param frame_count:     Number of frames rendered
+        :param render_seconds:  Seconds spent rendering the frames, startup excluded
+        :param startup_seconds: Seconds spent before the first frame was rendered
+        :param movie_size:      Size of the movie in bytes, if known
+        """
+        if frame_count <= 0 or render_seconds <= 0:
+            return
+
+        with self._lock:
+            self._update("fps|%s|%dx%d" % (codec_profile, width, height), frame_count / render_seconds)
+            self._update("pixels_per_second|%s" % codec_profile, frame_count * width * height / render_seconds)
+            self._update("startup_seconds", startup_seconds)
+            if movie_size:
+                self._update("bytes_per_pixel|%s" % codec_profile, movie_size / float(frame_count * width * height))
+            self._save()
+
+    def record_upload(self, byte_count, seconds):
+        """
+        Records a completed upload.
+
+        :param byte_count: Number of bytes uploaded
+        :param seconds:    Seconds the upload took
+        """
+        if byte_count <= 0 or seconds <= 0:
+            return
+
+        with self._lock:
+            self._update("upload_bytes_per_second", byte_count / seconds)
+            self._save()
+
+    def estimate_render(self, frame_count, width, height, codec_profile):
+        """
+        Returns the number of seconds a render is expected to take, startup included.
+        """
+        with self._lock:
+            fps = self._stats.get("fps|%s|%dx%d" % (codec_profile, width, height))
+            if fps:
+                frame_seconds = frame_count / fps
+            else:
+                pixels_per_second = self._stats.get("pixels_per_second|%s" % codec_profile,
+                                                    _DEFAULT_PIXELS_PER_SECOND)
+                frame_seconds = frame_count * width * height / float(pixels_per_second)
+            return self._stats.get("startup_seconds", _DEFAULT_STARTUP_SECONDS) + frame_seconds
+
+    def estimate_movie_size(self, frame_count, width, height, codec_profile):
+        """
+        Returns the size in bytes a movie is expected to have.
+        """
+        with self._lock:
+            return frame_count * width * height * self._stats.get("bytes_per_pixel|%s" % codec_profile,
+                                                                  _DEFAULT_BYTES_PER_PIXEL)
+
+    def estimate_upload(self, byte_count):
+        """
+        Returns the number of seconds an upload is expected to take.
+        """
+        with self._lock:
+            return byte_count / float(self._stats.get("upload_bytes_per_second", _DEFAULT_UPLOAD_BYTES_PER_SECOND))
+
+    def _update(self, key, value):
+        """
+        Folds a measurement into the moving average of a statistic.
+        """
+        previous = self._stats.get(key)
+        self._stats[key] = value if previous is None else previous + _SMOOTHING * (value - previous)
+
+    def _save(self):
+        """
+        Writes the statistics to disk, replacing the previous file in one go.
+        """
+        temp_path = "%s.%d.tmp" % (self._path, os.getpid())
+        with open(temp_path, "w") as stats_file:
+            json.dump(self._stats, stats_file, indent=2, sort_keys=True)
+        if os.path.exists(self._path) and sys.platform == "win32":
+            os.remove(self._path)
+        os.rename(temp_path, self._path)
+
+
+class RenderEta(object):
+    """
+    Estimates the time left of a running render from the frames rendered so far,
+    falling back on the throughput model until enough frames have been rendered.
+    """
+
+    def __init__(self, total_frames, estimated_seconds):
+        """
+        Construction
+
+        :param total_frames:      Number of frames the render writes, slates and views included
+        :param estimated_seconds: Number of seconds the throughput model expects the render to take
+        """
+        self.total_frames = total_frames
+        self._estimated_seconds = estimated_seconds
+        self._start_time = time.time()
+        self._frame_times = []
+        self._last_report = 0
+
+    def frame_rendered(self):
+        """
+        Records that a frame has been rendered.
+        """
+        self._frame_times.append(time.time())
+
+    def get_seconds_left(self):
+        """
+        Returns the number of seconds the render is expected to go on for.
+        """
+        frames_left = self.total_frames - len(self._frame_times)
+        if len(self._frame_times) > _MIN_OBSERVED_FRAMES:
+            seconds_per_frame = ((self._frame_times[-1] - self._frame_times[0]) /
+                                 (len(self._frame_times) - 1))
+            return max(0.0, frames_left * seconds_per_frame)
+        return max(0.0, self._estimated_seconds - (time.time() - self._start_time))
+
+    def get_percent_done(self):
+        """
+        Returns the percentage of the render done, from the time spent so far and the time left.
+        """
+        elapsed = time.time() - self._start_time
+        total = elapsed + self.get_seconds_left()
+        if total <= 0:
+            return 100.0
+        return min(100.0, 100.0 * elapsed / total)
+
+    def get_message(self):
+        """
+        Returns a progress message for the render, None if the last one was reported too recently.
+        """
+        if time.time() - self._last_report < _REPORT_INTERVAL:
+            return None
+        self._last_report = time.time()
+        return "Rendered %d of %d frames, %s left" % (len(self._frame_times), self.total_frames,
+                                                     format_duration(self.get_seconds_left()))
+
+
+def get_progress_steps(estimates):
+    """
+    Splits the progress of a submission between its render and its upload, in proportion
+    to how long each is expected to take.
+
+    :param estimates: Dictionary with the "render" and "upload" estimates in seconds, see the
+                      app's estimate_submission()
+    :return:          Tuple of the percentages the render starts at, the upload starts at and
+                      the submission ends at
+    """
+    total_seconds = estimates["render"] + estimates["upload"]
+    upload_start = _PROGRESS_END
+    if total_seconds > 0:
+        upload_start = _PROGRESS_START + (_PROGRESS_END - _PROGRESS_START) * estimates["render"] / total_seconds
+    return _PROGRESS_START, int(round(upload_start)), _PROGRESS_END
+
+
+def scale_progress(progress_cb, start, end):
+    """
+    Returns a progress callback reporting the percentage of a single step of a submission
+    as the matching part of the progress of the whole submission.
+
+    :param progress_cb: Callback reporting the progress of the submission
+    :param start:       Percentage of the submission the step starts at
+    :param end:         Percentage of the submission the step ends at
+    """
+    def _progress_cb(percent=None, msg=None, **kwargs):
+        if percent is None:
+            return progress_cb(msg=msg, **kwargs)
+        return progress_cb(start + (end - start) * percent / 100.0, msg, **kwargs)
+    return _progress_cb
+
+
+def format_duration(seconds):
+    """
+    Returns a short human readable duration, e.g. 1m05s.
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "%dh%02dm" % (hours, minutes)
+    if minutes:
+        return "%dm%02ds" % (minutes, seconds)
+    return "%ds" % seconds
+
+
+def get_throughput_model():
+    """
+    Returns the throughput model of the current show on this host.
+    """
+    app = sgtk.platform.current_bundle()
+    project = app.context.project
+    file_name = "%s_%s.json" % (project["id"] if project else "site", socket.gethostname())
+    path = os.path.join(get_scratch_folder("throughput"), file_name)
+    with _models_lock:
+        if path not in _models:
+            _models[path] = ThroughputModel(path)
+        return _models[path]
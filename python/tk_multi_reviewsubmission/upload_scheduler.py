@@ -0,0 +1,353 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Scheduling of the uploads of all submissions running on a host.
+"""
+import contextlib
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+
+import sgtk
+
+from .multipart import FormUpload, MultipartUploadSession
+from .staging import get_scratch_folder, open_lock_file
+
+try:
+    import fcntl
+except ImportError:
+    # no host wide upload slots on windows, uploads are only scheduled per process
+    fcntl = None
+
+# small uploads are scheduled ahead of large ones
+PRIORITY_THUMBNAIL = 0
+PRIORITY_MOVIE = 10
+
+# http status codes Shotgun and its storage use to throttle clients
+_THROTTLED_STATUS_CODES = (429, 503)
+
+# number of times a throttled request is retried before giving up
+_MAX_RETRIES = 6
+
+# seconds waited before the first retry of a throttled request, doubled on every retry
+_INITIAL_BACKOFF = 2.0
+
+# bandwidth ceiling is never lowered below this fraction by throttling
+_MIN_RATE_FRACTION = 0.05
+
+# marker files of the uploads waiting for a host wide slot, with their priority
+_WAITING_FILE_REGEX = re.compile(r"^waiting_(\d+)_\d+_\d+\.lock$")
+
+_scheduler_lock = threading.Lock()
+_scheduler = None
+
+
+class UploadScheduler(object):
+    """
+    Shares the upload bandwidth of the host between all uploads.
+
+    Uploads wait for one of a limited number of upload slots, which are lock files
+    shared by all processes of the host, with thumbnails going ahead of movies. Each
+    upload waiting for a slot holds a marker file recording its priority, so that the
+    uploads of other processes let it go first. The
+    data sent is metered by a token bucket, the ceiling being split between the
+    uploads currently running on the host. When Shotgun throttles requests, the rate
+    is halved and the request retried with exponential backoff, the rate then
+    recovering gradually as requests succeed.
+    """
+
+    def __init__(self, max_bytes_per_second, max_concurrent_uploads, slot_folder):
+        """
+        Construction
+
+        :param max_bytes_per_second:   Upload bandwidth ceiling for the host, 0 for no limit
+        :param max_concurrent_uploads: Maximum number of uploads running at the same time on the host
+        :param slot_folder:            Folder holding the lock files of the upload slots
+        """
+        self.__app = sgtk.platform.current_bundle()
+        self.max_bytes_per_second = max_bytes_per_second
+        self.max_concurrent_uploads = max(1, max_concurrent_uploads)
+        self._slot_folder = slot_folder
+
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active_uploads = 0
+
+        self._bucket_lock = threading.Lock()
+        self._rate_factor = 1.0
+        self._tokens = 0.0
+        self._last_refill = time.time()
+
+    @contextlib.contextmanager
+    def upload_slot(self, priority=PRIORITY_MOVIE):
+        """
+        Context manager waiting for an upload slot and releasing it afterwards.
+
+        :param priority: Uploads with a lower priority value get a slot first
+        """
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or self._active_uploads >= self.max_concurrent_uploads:
+                self._condition.wait(1.0)
+            heapq.heappop(self._waiting)
+            self._active_uploads += 1
+            self._condition.notify_all()
+
+        slot_file = None
+        try:
+            slot_file = self._acquire_host_slot(ticket)
+            yield
+        finally:
+            if slot_file:
+                slot_file.close()
+            with self._condition:
+                self._active_uploads -= 1
+                self._condition.notify_all()
+
+    def throttle(self, byte_count):
+        """
+        Blocks until the given amount of data can be sent without exceeding the host's share
+        of the bandwidth.
+
+        :param byte_count: Number of bytes about to be sent
+        """
+        if not self.max_bytes_per_second:
+            return
+
+        with self._bucket_lock:
+            rate = self._get_rate()
+            now = time.time()
+            # allow bursts of up to a second worth of data
+            self._tokens = min(rate, self._tokens + (now - self._last_refill) * rate)
+            self._last_refill = now
+            self._tokens -= byte_count
+            delay = -self._tokens / rate if self._tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+    def call(self, byte_count, request, *args, **kwargs):
+        """
+        Sends a request once the bandwidth allows it, retrying with exponential backoff
+        when it is throttled.
+
+        :param byte_count: Number of bytes the request sends
+        :param request:    Callable sending the request
+        :return:           The result of the request
+        """
+        for attempt in range(_MAX_RETRIES + 1):
+            self.throttle(byte_count)
+            try:
+                result = request(*args, **kwargs)
+            except Exception, e:
+                if attempt == _MAX_RETRIES or not self._is_throttled(e):
+                    raise
+                backoff = _INITIAL_BACKOFF * 2 ** attempt
+                self._on_throttled()
+                self.__app.log_debug("Upload throttled by Shotgun (%s), retrying in %.0fs" % (e, backoff))
+                time.sleep(backoff)
+            else:
+                self._on_success()
+                return result
+
+    def upload(self, sg, entity_type, entity_id, path, field_name=None, display_name=None,
+               priority=PRIORITY_MOVIE):
+        """
+        Uploads a file to an entity once a slot is available, metering the data sent.
+
+        Files uploaded to cloud storage are sent part by part and files uploaded to
+        Shotgun's own storage block by block, so that the bandwidth can be shared with
+        other uploads while they are sent. Files are only admitted as a whole when the
+        shotgun_api3 version doesn't allow either.
+
+        :param sg:           Shotgun connection to upload with
+        :param entity_type:  Type of the entity to upload the file to
+        :param entity_id:    Id of the entity to upload the file to
+        :param path:         Path to the file
+        :param field_name:   Field to upload the file to, None to attach it
+        :param display_name: Name to display for the file
+        :param priority:     Uploads with a lower priority value get a slot first
+        """
+        with self.upload_slot(priority):
+            if not MultipartUploadSession.is_supported(sg, entity_type, field_name):
+                if FormUpload.is_supported(sg):
+                    # every block of the body is metered as it is sent
+                    form_upload = FormUpload(sg, path, self.throttle)
+                    return self.call(0, form_upload.send, entity_type, entity_id, field_name, display_name)
+                return self.call(os.path.getsize(path), sg.upload, entity_type, entity_id, path, field_name,
+                                 display_name)
+
+            session = MultipartUploadSession(sg, os.path.basename(path))
+            self.call(0, session.begin)
+            with open(path, "rb") as upload_file:
+                part_number = 1
+                while True:
+                    data = upload_file.read(session.part_size)
+                    if not data:
+                        break
+                    self.call(len(data), session.upload_part, part_number, data)
+                    part_number += 1
+            self.call(0, session.complete)
+            return self.call(0, session.link, entity_type, entity_id, field_name, display_name)
+
+    def upload_thumbnail(self, sg, entity_type, entity_id, path, filmstrip=False):
+        """
+        Uploads a thumbnail, ahead of any movies waiting for a slot.
+
+        :param sg:          Shotgun connection to upload with
+        :param entity_type: Type of the entity to upload the thumbnail to
+        :param entity_id:   Id of the entity to upload the thumbnail to
+        :param path:        Path to the thumbnail
+        :param filmstrip:   True to upload a filmstrip thumbnail
+        """
+        upload_method = sg.upload_filmstrip_thumbnail if filmstrip else sg.upload_thumbnail
+        with self.upload_slot(PRIORITY_THUMBNAIL):
+            return self.call(os.path.getsize(path), upload_method, entity_type, entity_id, path)
+
+    def _get_rate(self):
+        """
+        Returns the number of bytes per second this process may currently send.
+        """
+        return self.max_bytes_per_second * self._rate_factor / self._count_host_uploads()
+
+    def _on_throttled(self):
+        """
+        Halves the rate after Shotgun throttled a request.
+        """
+        with self._bucket_lock:
+            self._rate_factor = max(_MIN_RATE_FRACTION, self._rate_factor / 2.0)
+            self._tokens = min(self._tokens, 0.0)
+
+    def _on_success(self):
+        """
+        Lets the rate recover after a request went through.
+        """
+        with self._bucket_lock:
+            self._rate_factor = min(1.0, self._rate_factor + 0.1)
+
+    @staticmethod
+    def _is_throttled(error):
+        """
+        Checks if a request failed because Shotgun or its storage throttled it.
+        """
+        status_code = getattr(error, "code", None) or getattr(error, "errcode", None)
+        if status_code in _THROTTLED_STATUS_CODES:
+            return True
+        return bool(re.search(r"\b(%s)\b" % "|".join(str(code) for code in _THROTTLED_STATUS_CODES), str(error)))
+
+    def _slot_paths(self):
+        """
+        Returns the paths of the lock files of the host wide upload slots.
+        """
+        return [os.path.join(self._slot_folder, "slot_%d.lock" % index)
+                for index in range(self.max_concurrent_uploads)]
+
+    def _acquire_host_slot(self, ticket):
+        """
+        Waits for one of the host wide upload slots, once no upload of a higher priority
+        is waiting for one in any process of the host.
+
+        :param ticket: Priority and sequence number of the upload in this process
+        :return:       The open lock file of the slot, closing it releases the slot
+        """
+        if not fcntl:
+            return None
+
+        priority, sequence = ticket
+        waiting_path = os.path.join(self._slot_folder, "waiting_%d_%d_%d.lock" % (priority, os.getpid(), sequence))
+        waiting_file = open_lock_file(waiting_path)
+        try:
+            fcntl.flock(waiting_file, fcntl.LOCK_EX)
+            while True:
+                if not self._is_waiting_ahead(priority):
+                    for slot_path in self._slot_paths():
+                        # not inherited by the Nuke renders, which would hold the slot
+                        slot_file = open_lock_file(slot_path)
+                        try:
+                            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            return slot_file
+                        except IOError:
+                            slot_file.close()
+                time.sleep(0.5)
+        finally:
+            try:
+                os.remove(waiting_path)
+            except OSError:
+                pass
+            waiting_file.close()
+
+    def _is_waiting_ahead(self, priority):
+        """
+        Checks if an upload with a higher priority is waiting for a host wide slot.
+        Markers left behind by processes which died are removed.
+
+        :param priority: Priority of the upload about to take a slot
+        """
+        for file_name in os.listdir(self._slot_folder):
+            match = _WAITING_FILE_REGEX.match(file_name)
+            if not match or int(match.group(1)) >= priority:
+                continue
+            waiting_path = os.path.join(self._slot_folder, file_name)
+            try:
+                waiting_file = open(waiting_path, "r")
+            except IOError:
+                # the upload got its slot in the meantime
+                continue
+            with waiting_file:
+                try:
+                    fcntl.flock(waiting_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except IOError:
+                    return True
+                try:
+                    os.remove(waiting_path)
+                except OSError:
+                    pass
+        return False
+
+    def _count_host_uploads(self):
+        """
+        Returns the number of uploads currently holding a slot on this host, at least one.
+        """
+        if not fcntl:
+            return max(1, self._active_uploads)
+
+        busy_slots = 0
+        for slot_path in self._slot_paths():
+            with open_lock_file(slot_path) as slot_file:
+                try:
+                    fcntl.flock(slot_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                    fcntl.flock(slot_file, fcntl.LOCK_UN)
+                except IOError:
+                    busy_slots += 1
+        return max(1, busy_slots)
+
+
+def get_upload_scheduler():
+    """
+    Returns the upload scheduler shared by all uploads of this process.
+    """
+    global _scheduler
+    app = sgtk.platform.current_bundle()
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = UploadScheduler(app.get_setting("upload_max_bytes_per_second"),
+                                         app.get_setting("max_concurrent_uploads"),
+                                         get_scratch_folder("upload_slots"))
+        else:
+            # pick up configuration changes
+            _scheduler.max_bytes_per_second = app.get_setting("upload_max_bytes_per_second")
+            _scheduler.max_concurrent_uploads = max(1, app.get_setting("max_concurrent_uploads"))
+        return _scheduler
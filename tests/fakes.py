@@ -0,0 +1,161 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Stand-ins for Toolkit, so that the modules of the app which don't talk to Nuke or
+Qt can be tested outside of an engine.
+"""
+import contextlib
+import imp
+import os
+import sys
+import tempfile
+import types
+
+PACKAGE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python",
+                              "tk_multi_reviewsubmission")
+HOOKS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hooks")
+
+
+class FakeApp(object):
+    """
+    App returned by sgtk.platform.current_bundle(), with the settings the tests set.
+    """
+    def __init__(self):
+        self.settings = {"local_scratch_root": tempfile.mkdtemp()}
+        self.messages = []
+
+    def get_setting(self, name, default=None):
+        return self.settings.get(name, default)
+
+    def log_debug(self, msg):
+        self.messages.append(msg)
+
+    log_info = log_warning = log_error = log_debug
+
+
+def install():
+    """
+    Installs a fake sgtk module and an empty tk_multi_reviewsubmission package, so that
+    its modules can be imported one by one without importing the whole app.
+
+    :return: The FakeApp returned by sgtk.platform.current_bundle()
+    """
+    # modules already imported keep the fake they were imported with
+    if hasattr(sys.modules.get("sgtk"), "fake_app"):
+        return sys.modules["sgtk"].fake_app
+
+    app = FakeApp()
+
+    sgtk = types.ModuleType("sgtk")
+    sgtk.platform = types.ModuleType("sgtk.platform")
+    sgtk.platform.current_bundle = lambda: app
+    sgtk.fake_app = app
+    sgtk.util = types.ModuleType("sgtk.util")
+    sgtk.util.filesystem = types.ModuleType("sgtk.util.filesystem")
+
+    def ensure_folder_exists(path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    sgtk.util.filesystem.ensure_folder_exists = ensure_folder_exists
+
+    sys.modules.update({"sgtk": sgtk, "sgtk.platform": sgtk.platform, "sgtk.util": sgtk.util,
+                        "sgtk.util.filesystem": sgtk.util.filesystem})
+
+    if "tk_multi_reviewsubmission" not in sys.modules:
+        package = imp.new_module("tk_multi_reviewsubmission")
+        package.__path__ = [PACKAGE_FOLDER]
+        sys.modules["tk_multi_reviewsubmission"] = package
+    return app
+
+
+def load_hook(name):
+    """
+    Loads one of the Nuke hooks of the app with an empty nuke module, so that its
+    helpers which don't create nodes can be tested.
+
+    :param name: Name of the hook file, without extension
+    :return:     The hook module
+    """
+    install()
+    sgtk = sys.modules["sgtk"]
+    if "nuke" not in sys.modules:
+        sys.modules["nuke"] = types.ModuleType("nuke")
+    if not hasattr(sgtk, "context"):
+        sgtk.context = types.ModuleType("sgtk.context")
+        sgtk.context.Context = object
+        sys.modules["sgtk.context"] = sgtk.context
+    return imp.load_source("hook_%s" % name, os.path.join(HOOKS_FOLDER, "%s.py" % name))
+
+
+def load_app():
+    """
+    Loads the app module with a stand-in for the Toolkit Application class, so that its
+    methods which only combine other methods can be tested.
+
+    :return: The app module
+    """
+    install()
+    sgtk = sys.modules["sgtk"]
+    if not hasattr(sgtk.platform, "Application"):
+        sgtk.platform.Application = object
+        sgtk.templatekey = types.ModuleType("sgtk.templatekey")
+        sys.modules["sgtk.templatekey"] = sgtk.templatekey
+    return imp.load_source("review_submission_app", os.path.join(os.path.dirname(HOOKS_FOLDER), "app.py"))
+
+
+class FakeRenderer(object):
+    """
+    Renderer which never starts Nuke.
+    """
+    def render_slate_card(self, path_to_movie, *args, **kwargs):
+        raise NotImplementedError("No Nuke to render %s with" % path_to_movie)
+
+
+def install_renderer():
+    """
+    Installs a stand-in for the renderer module, which needs Qt and the studio runtime,
+    so that the modules using it can be imported.
+
+    :return: The stand-in renderer module
+    """
+    install()
+    module_name = "tk_multi_reviewsubmission.renderer"
+    if module_name not in sys.modules:
+        renderer = types.ModuleType(module_name)
+        renderer.NUKE_PATH_SETTINGS = {"win32": "nuke_windows_path", "linux2": "nuke_linux_path",
+                                       "darwin": "nuke_mac_path"}
+        renderer.Renderer = FakeRenderer
+        sys.modules[module_name] = renderer
+    return sys.modules[module_name]
+
+
+class FakeScheduler(object):
+    """
+    Upload scheduler sending every request right away.
+    """
+    def __init__(self):
+        self.slots_taken = 0
+        self.bytes_sent_without_slot = 0
+        self._active_slots = 0
+
+    @contextlib.contextmanager
+    def upload_slot(self, priority=None):
+        self.slots_taken += 1
+        self._active_slots += 1
+        try:
+            yield
+        finally:
+            self._active_slots -= 1
+
+    def call(self, byte_count, request, *args, **kwargs):
+        if not self._active_slots:
+            self.bytes_sent_without_slot += byte_count
+        return request(*args, **kwargs)
@@ -0,0 +1,61 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import connections
+
+
+class SessionCacheTest(unittest.TestCase):
+
+    def test_lookups_of_other_keys_run_concurrently(self):
+        cache = connections.SessionCache(ttl=60)
+        slow_lookup_started = threading.Event()
+        release_slow_lookup = threading.Event()
+
+        def slow_lookup():
+            slow_lookup_started.set()
+            release_slow_lookup.wait(5)
+            return "slow"
+
+        thread = threading.Thread(target=cache.get, args=("slow", slow_lookup))
+        thread.start()
+        slow_lookup_started.wait(5)
+        try:
+            # would wait for the slow lookup if it held the lock of the whole cache
+            self.assertEqual(cache.get("fast", lambda: "fast"), "fast")
+        finally:
+            release_slow_lookup.set()
+            thread.join()
+        self.assertEqual(cache.get("slow", lambda: "looked up again"), "slow")
+
+    def test_same_key_is_looked_up_once(self):
+        cache = connections.SessionCache(ttl=60)
+        lookups = []
+
+        def lookup():
+            lookups.append(1)
+            return len(lookups)
+
+        threads = [threading.Thread(target=cache.get, args=("key", lookup)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(lookups), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import fingerprint
+
+render_hook = fakes.load_hook("nuke_batch_render_movie")
+
+
+class FindHeldFramesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path_to_frames = os.path.join(self.folder, "plate.%04d.exr")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write_frames(self, contents):
+        for frame, content in contents.iteritems():
+            with open(self.path_to_frames % frame, "wb") as frame_file:
+                frame_file.write(content)
+
+    def test_holds(self):
+        frame_a = os.urandom(100000)
+        frame_b = os.urandom(100000)
+        self._write_frames({1: frame_a, 2: frame_a, 3: frame_a, 4: frame_b, 5: os.urandom(100000), 6: frame_b,
+                            7: frame_b})
+        self.assertEqual(fingerprint.find_held_frames(self.path_to_frames, 1, 7, 2), [(2, 3, 1), (7, 7, 6)])
+
+    def test_no_candidates(self):
+        self._write_frames(dict((frame, os.urandom(1000 + frame)) for frame in range(1, 5)))
+        self.assertEqual(fingerprint.find_held_frames(self.path_to_frames, 1, 4), [])
+
+    def test_missing_frames_are_not_held(self):
+        self._write_frames({1: "a" * 100, 4: "a" * 100})
+        self.assertEqual(fingerprint.find_held_frames(self.path_to_frames, 1, 4), [])
+
+    def test_samples_matching_is_not_a_hold(self):
+        # uncompressed frames of the same size only differing between the sampled blocks
+        frame = bytearray(os.urandom(1024 * 1024))
+        other_frame = bytearray(frame)
+        other_frame[300000] = (other_frame[300000] + 1) % 256
+        self._write_frames({1: str(frame), 2: str(other_frame)})
+        self.assertEqual(fingerprint.fingerprint_file(self.path_to_frames % 1),
+                         fingerprint.fingerprint_file(self.path_to_frames % 2))
+        self.assertEqual(fingerprint.find_held_frames(self.path_to_frames, 1, 2), [])
+
+
+class HeldFrameExpressionTest(unittest.TestCase):
+
+    @staticmethod
+    def _evaluate(expression, frame):
+        return eval(expression.replace("&&", " and "), {"frame": frame})
+
+    def test_held_frames_read_their_source_frame(self):
+        held_frames = [(2, 3, 1), (7, 9, 6)]
+        expression = getattr(render_hook, "__create_held_frame_expression")(held_frames)
+        read_frames = [self._evaluate(expression, frame) for frame in range(0, 12)]
+        self.assertEqual(read_frames, [0, 1, 1, 1, 4, 5, 6, 6, 6, 6, 10, 11])
+
+    def test_matches_source_frame_lookup(self):
+        held_frames = [(1001 + index * 10, 1005 + index * 10, 1000 + index * 10) for index in range(50)]
+        expression = getattr(render_hook, "__create_held_frame_expression")(held_frames)
+        for frame in range(990, 1520):
+            self.assertEqual(self._evaluate(expression, frame),
+                             getattr(render_hook, "__get_source_frame")(frame, held_frames))
+
+
+if __name__ == "__main__":
+    unittest.main()
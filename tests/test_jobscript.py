@@ -0,0 +1,139 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import jobscript
+
+# the burnin the app ships with
+_BURNIN_NK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "burnin.nk")
+
+
+class FakeContext(object):
+    def __init__(self, entity=True, task=True, step=True):
+        self.project = {"type": "Project", "name": "Big Buck"}
+        self.entity = {"type": "Shot", "name": "sh010"} if entity else None
+        self.task = {"type": "Task", "name": "comp"} if task else None
+        self.step = {"type": "Step", "name": "Comp"} if step else None
+
+
+class TclQuoteTest(unittest.TestCase):
+
+    def test_nothing_is_evaluated(self):
+        self.assertEqual(jobscript.tcl_quote("[exec rm] $env(HOME) {x}"),
+                         '"\\[exec rm\\] \\$env(HOME) \\{x\\}"')
+
+    def test_quotes_and_backslashes(self):
+        self.assertEqual(jobscript.tcl_quote('C:\\shots\\"a"'), '"C:\\\\shots\\\\\\"a\\""')
+
+    def test_newlines(self):
+        self.assertEqual(jobscript.tcl_quote("Project: x\nShot: y\n"), '"Project: x\\nShot: y\\n"')
+
+    def test_unicode(self):
+        self.assertEqual(jobscript.tcl_quote(u"caf\xe9"), '"caf\xc3\xa9"')
+
+
+class BurninMessagesTest(unittest.TestCase):
+    """
+    The messages must match what the render script sets on the burnin nodes.
+    """
+
+    def test_task_context(self):
+        messages = jobscript.get_burnin_messages(FakeContext(), 5, "comp main", 1001, 1010, 3)
+        self.assertEqual(messages, {
+            "project": "Big Buck",
+            "entity": "sh010",
+            "version": "comp, v005",
+            "slate": "Project: Big Buck\nShot: sh010\nName: Comp main\nVersion: 005\nTask: comp\n"
+                     "Frames: 1001 - 1010\n",
+        })
+
+    def test_step_context(self):
+        messages = jobscript.get_burnin_messages(FakeContext(task=False), 12, "comp", 1, 2, 4)
+        self.assertEqual(messages["version"], "Comp, v0012")
+        self.assertEqual(messages["slate"],
+                         "Project: Big Buck\nShot: sh010\nName: Comp\nVersion: 0012\nStep: Comp\nFrames: 1 - 2\n")
+
+    def test_project_context(self):
+        messages = jobscript.get_burnin_messages(FakeContext(entity=False, task=False, step=False), 1, "x", 1, 1, 2)
+        self.assertEqual(messages["version"], "v01")
+        self.assertIsNone(messages["entity"])
+        self.assertEqual(messages["slate"], "Project: Big Buck\nName: X\nVersion: 01\nFrames: 1 - 1\n")
+
+
+class WriteJobScriptTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, name, src_frames_path):
+        job_script_path = os.path.join(self.folder, "movie.nk")
+        jobscript.write_job_script(job_script_path, {
+            "width": 1920,
+            "height": 1080,
+            "first_frame": 1001,
+            "last_frame": 1010,
+            "version": 5,
+            "name": name,
+            "color_space": None,
+            "src_frames_path": src_frames_path,
+            "movie_output_path": "/shots/sh010/movie.mov",
+            "app_settings": {"version_number_padding": 3, "slate_logo": ""},
+            "render_info": {
+                "burnin_nk": _BURNIN_NK,
+                "slate_font": "/fonts/font.ttf",
+                "codec_settings": {"quicktime": {"file_type": "mov64", "mov64_quality_max": "3"}},
+            },
+        }, FakeContext())
+        with open(job_script_path) as job_script_file:
+            return job_script_file.read()
+
+    def test_values_are_substituted_once(self):
+        # a value containing a token must not get the value of that token
+        job_script = self._write("@@PATH_TO_MOVIE@@ [pwd]", "/shots/@@SLATE_MESSAGE@@/frame.%04d.exr")
+
+        self.assertIn(' file "/shots/@@SLATE_MESSAGE@@/frame.%04d.exr"\n', job_script)
+        # the name is capitalized like the render script does
+        self.assertIn("Name: @@path_to_movie@@ \\[pwd\\]\\n", job_script)
+        self.assertIn(' file "/shots/sh010/movie.mov"\n', job_script)
+        self.assertEqual(job_script.count("@@"), 4)
+
+    def test_burnin_messages(self):
+        job_script = self._write("comp", "/shots/frame.%04d.exr")
+
+        self.assertIn('knob Group1.top_left_text.message "Big Buck"\n', job_script)
+        self.assertIn('knob Group1.top_right_text.message "sh010"\n', job_script)
+        self.assertIn('knob Group1.bottom_left_text.message "comp, v005"\n', job_script)
+        self.assertIn(' first_frame 1001\n', job_script)
+        self.assertIn('nuke -x -F 1000 -F 1001-1010 ', job_script)
+
+    def test_burnin_is_connected_to_the_source(self):
+        job_script = self._write("comp", "/shots/frame.%04d.exr")
+
+        # the version comes before any node, the burnin group right after the Read node
+        self.assertTrue(job_script.startswith("#! nuke -x\nversion 6.3 v7\n"))
+        self.assertEqual(job_script.count("\nversion "), 1)
+        self.assertNotIn("cut_paste_input", job_script)
+        self.assertIn(" name source\n}\nGroup {\n inputs 1\n name Group1\n", job_script)
+        self.assertLess(job_script.index("\nend_group\n"), job_script.index("\nReformat {\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakes
+
+app = fakes.install()
+
+from tk_multi_reviewsubmission import manifest
+
+
+class SubmissionManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        app.settings["local_scratch_root"] = self.folder
+        self.movie_path = os.path.join(self.folder, "movie.mov")
+        with open(self.movie_path, "wb") as movie_file:
+            movie_file.write("movie")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_steps_are_kept_across_attempts(self):
+        submission = manifest.SubmissionManifest("key")
+        submission.set_movies([self.movie_path], "quick_look_movies")
+        submission.set("quick_look_complete", True)
+
+        retry = manifest.SubmissionManifest("key")
+        self.assertEqual(retry.key, "key")
+        self.assertTrue(retry.get("quick_look_complete"))
+        self.assertEqual(retry.get_movies("quick_look_movies"), [self.movie_path])
+        self.assertIsNone(retry.get_movies())
+
+    def test_restart_gets_a_key_of_its_own(self):
+        submission = manifest.SubmissionManifest("key")
+        submission.set_movies([self.movie_path])
+        os.makedirs(submission.get_thumbnail_folder())
+        submission.set("complete", True)
+
+        resubmission = manifest.SubmissionManifest("key")
+        thumbnail_folder = resubmission.get_thumbnail_folder()
+        resubmission.restart()
+        self.assertEqual(resubmission.key, "key-1")
+        self.assertIsNone(resubmission.get("complete"))
+        self.assertIsNone(resubmission.get_movies())
+        self.assertFalse(os.path.exists(thumbnail_folder))
+
+        # retries of the new submission keep its key
+        self.assertEqual(manifest.SubmissionManifest("key").key, "key-1")
+
+    def test_submission_without_key_is_not_saved(self):
+        submission = manifest.SubmissionManifest()
+        submission.set_movies([self.movie_path])
+        self.assertEqual(submission.get_movies(), [self.movie_path])
+        self.assertEqual([name for name in os.listdir(os.path.join(self.folder, "submissions"))
+                          if name.endswith(".json")], [])
+        # every submission without a key is a submission of its own
+        self.assertNotEqual(manifest.SubmissionManifest().key, submission.key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import fakes
+
+app = fakes.install()
+fakes.install_renderer()
+
+from tk_multi_reviewsubmission import reel
+
+# writes the last argument, the output, and exits with the status found next to it
+_FAKE_FFMPEG = """#!/bin/sh
+for output; do true; done
+echo reel > "$output"
+exit `cat "$0.status" 2>/dev/null || echo 0`
+"""
+
+_STREAM = {"codec_name": "h264", "profile": "High", "width": 1920, "height": 1080, "r_frame_rate": "24/1",
+           "time_base": "1/24", "pix_fmt": "yuv420p", "nb_frames": "48"}
+
+
+class CheckStreamTest(unittest.TestCase):
+
+    def test_same_encoding(self):
+        reel.ReelBuilder._check_stream("b.mov", dict(_STREAM, nb_frames="12"), _STREAM)
+
+    def test_different_encoding(self):
+        for key, value in (("profile", "Main"), ("time_base", "1/12800"), ("width", 2048), ("pix_fmt", None)):
+            self.assertRaises(reel.ReelAssemblyFailed, reel.ReelBuilder._check_stream, "b.mov",
+                              dict(_STREAM, **{key: value}), _STREAM)
+
+
+class ConcatenateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ffmpeg_path = os.path.join(self.folder, "ffmpeg")
+        with open(self.ffmpeg_path, "w") as ffmpeg_file:
+            ffmpeg_file.write(_FAKE_FFMPEG)
+        os.chmod(self.ffmpeg_path, stat.S_IRWXU)
+        app.settings["ffmpeg_path"] = self.ffmpeg_path
+        self.builder = reel.ReelBuilder()
+        self.path_to_reel = os.path.join(self.folder, "reels", "dailies.mov")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_concat_list_quoting(self):
+        list_path = os.path.join(self.folder, "list.txt")
+        reel.ReelBuilder._write_concat_list(["/shows/it's here/a.mov", "C:\\shows\\b.mov"], list_path)
+        with open(list_path) as list_file:
+            self.assertEqual(list_file.read(), "file '/shows/it'\\''s here/a.mov'\nfile 'C:/shows/b.mov'\n")
+
+    @unittest.skipIf(os.name != "posix", "the stand-in ffmpeg is a shell script")
+    def test_reel_is_renamed_into_place(self):
+        self.builder._concatenate(["a.mov", "b.mov"], self.path_to_reel)
+        self.assertEqual(os.listdir(os.path.dirname(self.path_to_reel)), ["dailies.mov"])
+
+    @unittest.skipIf(os.name != "posix", "the stand-in ffmpeg is a shell script")
+    def test_failed_assembly_leaves_nothing(self):
+        with open(self.ffmpeg_path + ".status", "w") as status_file:
+            status_file.write("1")
+        self.assertRaises(reel.ReelAssemblyFailed, self.builder._concatenate, ["a.mov"], self.path_to_reel)
+        self.assertEqual(os.listdir(os.path.dirname(self.path_to_reel)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
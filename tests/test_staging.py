@@ -0,0 +1,138 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import staging
+
+
+class FrameStagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_root = os.path.join(self.folder, "cache")
+        self.source_folder = os.path.join(self.folder, "source")
+        os.makedirs(self.cache_root)
+        os.makedirs(self.source_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write_frames(self, name, frame_count, frame_size):
+        path_to_frames = os.path.join(self.source_folder, "%s.%%04d.exr" % name)
+        for frame in range(1, frame_count + 1):
+            with open(path_to_frames % frame, "wb") as frame_file:
+                frame_file.write("x" * frame_size)
+        return path_to_frames
+
+    def _make_entry(self, name, size, last_used):
+        entry_folder = os.path.join(self.cache_root, name)
+        os.makedirs(entry_folder)
+        with open(os.path.join(entry_folder, "frame.0001.exr"), "wb") as frame_file:
+            frame_file.write("x" * size)
+        marker_path = os.path.join(entry_folder, staging._LAST_USED_MARKER)
+        open(marker_path, "w").close()
+        os.utime(marker_path, (last_used, last_used))
+        return entry_folder
+
+    def test_stage_copies_frames(self):
+        path_to_frames = self._write_frames("shot", 4, 10)
+        stager = staging.FrameStager(self.cache_root, 1024 * 1024, thread_count=2, read_ahead=2)
+        staged_path = stager.stage(path_to_frames, 1, 4)
+        self.assertTrue(stager.wait_for_read_ahead(5))
+        self.assertEqual(stager.stop(), [])
+        for frame in range(1, 5):
+            with open(staged_path % frame, "rb") as frame_file:
+                self.assertEqual(frame_file.read(), "x" * 10)
+
+    def test_evict_counts_incoming_frames(self):
+        old_entry = self._make_entry("old", 600, time.time() - 100)
+        recent_entry = self._make_entry("recent", 300, time.time() - 10)
+        stager = staging.FrameStager(self.cache_root, 1000)
+
+        # 900 bytes staged fit the cache, not with the 400 bytes about to be staged
+        stager._evict(os.path.join(self.cache_root, "new"), 400)
+        self.assertFalse(os.path.exists(old_entry))
+        self.assertTrue(os.path.exists(recent_entry))
+
+    @unittest.skipIf(staging.fcntl is None, "no locking of cache entries on this platform")
+    def test_entries_in_use_are_kept(self):
+        in_use_entry = self._make_entry("in_use", 600, time.time() - 100)
+        other_entry = self._make_entry("other", 600, time.time() - 10)
+        # another process reading from the entry
+        lock_file = staging.FrameStager._lock_entry(in_use_entry)
+        try:
+            staging.FrameStager(self.cache_root, 500)._evict(os.path.join(self.cache_root, "new"), 0)
+            self.assertTrue(os.path.exists(in_use_entry))
+            self.assertFalse(os.path.exists(other_entry))
+        finally:
+            lock_file.close()
+
+        staging.FrameStager(self.cache_root, 500)._evict(os.path.join(self.cache_root, "new"), 0)
+        self.assertFalse(os.path.exists(in_use_entry))
+
+    def test_is_current(self):
+        path_to_frames = self._write_frames("shot", 1, 10)
+        source_path = path_to_frames % 1
+        staged_path = os.path.join(self.folder, "staged.0001.exr")
+        self.assertFalse(staging.FrameStager._is_current(source_path, staged_path))
+
+        staging.copy_frame(source_path, staged_path)
+        self.assertTrue(staging.FrameStager._is_current(source_path, staged_path))
+
+        # the frame has been rendered again on the network since it was staged
+        os.utime(source_path, (time.time() + 10, time.time() + 10))
+        self.assertFalse(staging.FrameStager._is_current(source_path, staged_path))
+
+    def test_failed_frames_are_marked(self):
+        path_to_frames = self._write_frames("shot", 2, 10)
+        stager = staging.FrameStager(self.cache_root, 1024 * 1024, thread_count=1, read_ahead=2)
+        original_copy_frame = staging.copy_frame
+
+        def failing_copy_frame(source_path, destination_path):
+            raise IOError("No space left on device")
+        staging.copy_frame = failing_copy_frame
+        try:
+            staged_path = stager.stage(path_to_frames, 1, 2)
+            self.assertTrue(stager.wait_for_read_ahead(5))
+            self.assertEqual(len(stager.stop()), 2)
+        finally:
+            staging.copy_frame = original_copy_frame
+        self.assertTrue(os.path.exists(staged_path % 1 + staging.FAILED_FRAME_SUFFIX))
+
+    def test_read_ahead_waits_for_all_workers(self):
+        path_to_frames = self._write_frames("shot", 3, 10)
+        stager = staging.FrameStager(self.cache_root, 1024 * 1024, thread_count=3, read_ahead=3)
+        original_copy_frame = staging.copy_frame
+
+        def copy_frame(source_path, destination_path):
+            if source_path.endswith("3.exr"):
+                time.sleep(0.3)
+            original_copy_frame(source_path, destination_path)
+        staging.copy_frame = copy_frame
+        try:
+            staged_path = stager.stage(path_to_frames, 1, 3)
+            self.assertTrue(stager.wait_for_read_ahead(5))
+            self.assertTrue(os.path.isfile(staged_path % 3))
+            stager.stop()
+        finally:
+            staging.copy_frame = original_copy_frame
+
+
+if __name__ == "__main__":
+    unittest.main()
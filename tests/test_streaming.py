@@ -0,0 +1,216 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import multipart, streaming
+
+
+class FakeUploadServer(object):
+    """
+    Stands for Shotgun and its storage, keeping the parts it is sent.
+    """
+    def __init__(self):
+        self.parts = {}
+        self.completed = False
+        self.linked = []
+
+
+class FakeSession(object):
+    """
+    Multipart upload session sending its parts to a FakeUploadServer.
+    """
+    part_size = 4
+
+    def __init__(self, server):
+        self._server = server
+        self.aborted = False
+
+    def begin(self):
+        pass
+
+    def upload_part(self, part_number, data):
+        self._server.parts[part_number] = data
+
+    def complete(self):
+        self._server.completed = True
+
+    def link(self, entity_type, entity_id, field_name, display_name=None):
+        self._server.linked.append((entity_type, entity_id, field_name))
+        return 1
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeConnectionPool(object):
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        return object()
+
+    def release(self, sg):
+        self.acquired -= 1
+
+
+class StreamingUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.movie_path = os.path.join(self.folder, "movie.mov")
+        self.server = FakeUploadServer()
+        self.pool = FakeConnectionPool()
+        self.scheduler = fakes.FakeScheduler()
+
+        self._patched = {
+            "get_connection_pool": streaming.get_connection_pool,
+            "get_upload_scheduler": streaming.get_upload_scheduler,
+            "MultipartUploadSession": streaming.MultipartUploadSession,
+        }
+        server = self.server
+
+        class _Session(FakeSession):
+            def __init__(self, sg, filename):
+                FakeSession.__init__(self, server)
+
+            @staticmethod
+            def is_supported(sg, entity_type, field_name):
+                return True
+
+        streaming.get_connection_pool = lambda: self.pool
+        streaming.get_upload_scheduler = lambda: self.scheduler
+        streaming.MultipartUploadSession = _Session
+
+    def tearDown(self):
+        for name, value in self._patched.iteritems():
+            setattr(streaming, name, value)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _render(self, data, chunk_size=3):
+        """
+        Writes the movie a few bytes at a time, like an encoder would.
+        """
+        with open(self.movie_path, "wb") as movie_file:
+            for offset in range(0, len(data), chunk_size):
+                movie_file.write(data[offset:offset + chunk_size])
+                movie_file.flush()
+                time.sleep(0.005)
+
+    def test_follow_growing_file(self):
+        # a movie of an earlier render of the same version is still there
+        with open(self.movie_path, "wb") as movie_file:
+            movie_file.write("OLD!" * 10)
+
+        data = "header--" + "".join(chr(ord("a") + index % 26) for index in range(50))
+        upload = streaming.StreamingUpload(poll_interval=0.01)
+        upload.start(self.movie_path)
+
+        writer = threading.Thread(target=self._render, args=(data,))
+        writer.start()
+        writer.join()
+        upload.stop()
+
+        # parts after the first are streamed as soon as the encoder has written past them
+        self.assertTrue(len(self.server.parts) > 1)
+        self.assertNotIn(1, self.server.parts)
+        for part_number, part in self.server.parts.iteritems():
+            offset = (part_number - 1) * FakeSession.part_size
+            self.assertEqual(part, data[offset:offset + FakeSession.part_size])
+
+        self.assertTrue(upload.finish(self.movie_path))
+        self.assertEqual("".join(self.server.parts[part_number] for part_number in sorted(self.server.parts)),
+                         data)
+        self.assertTrue(self.server.completed)
+        # parts count against the host wide limit of concurrent uploads
+        self.assertTrue(self.scheduler.slots_taken > 0)
+        self.assertEqual(self.scheduler.bytes_sent_without_slot, 0)
+
+        upload.link(42)
+        self.assertEqual(self.server.linked, [("Version", 42, "sg_uploaded_movie")])
+        self.assertEqual(self.pool.acquired, 0)
+
+    def test_abort(self):
+        upload = streaming.StreamingUpload(poll_interval=0.01)
+        upload.start(self.movie_path)
+        self._render("some frames that failed to render")
+        session = upload._session
+        upload.abort()
+
+        self.assertTrue(session.aborted)
+        self.assertFalse(upload.finish(self.movie_path))
+        self.assertFalse(self.server.completed)
+        self.assertEqual(self.pool.acquired, 0)
+
+    def test_unsupported_site_releases_connection(self):
+        streaming.MultipartUploadSession.is_supported = staticmethod(lambda sg, entity_type, field_name: False)
+        upload = streaming.StreamingUpload(poll_interval=0.01)
+        upload.start(self.movie_path)
+
+        self.assertEqual(self.pool.acquired, 0)
+        self.assertFalse(upload.finish(self.movie_path))
+        upload.abort()
+        self.assertEqual(self.pool.acquired, 0)
+
+    def test_failed_finish_releases_connection(self):
+        upload = streaming.StreamingUpload(poll_interval=0.01)
+        upload.start(self.movie_path)
+        self._render("frames of a movie which is then moved away")
+        os.remove(self.movie_path)
+
+        self.assertRaises(IOError, upload.finish, self.movie_path)
+        self.assertEqual(self.pool.acquired, 0)
+
+
+class MultipartLinkTest(unittest.TestCase):
+
+    def _link(self, field_name):
+        sent = {}
+
+        class _Config(object):
+            scheme = "https"
+            server = "example.shotgunstudio.com"
+
+        class _Connection(object):
+            config = _Config()
+
+            def _auth_params(self):
+                return {}
+
+            def _send_form(self, url, params):
+                sent.update(params)
+                return "1:12\n"
+
+        session = multipart.MultipartUploadSession(_Connection(), "movie_left.mov")
+        session._upload_info = {"upload_info": {}}
+        self.assertEqual(session.link("Version", 42, field_name), 12)
+        return sent
+
+    def test_attachment_sends_no_field(self):
+        params = self._link(None)
+        self.assertNotIn("field_name", params)
+        self.assertNotIn("tag_list", params)
+
+    def test_field_is_sent(self):
+        self.assertEqual(self._link("sg_uploaded_movie")["field_name"], "sg_uploaded_movie")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import throughput
+
+app_module = fakes.load_app()
+
+
+class FakeClock(object):
+    """
+    Stands in for the time module of the throughput module.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class ThroughputModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "throughput.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_defaults_before_any_measurement(self):
+        model = throughput.ThroughputModel(self.path)
+        self.assertAlmostEqual(model.estimate_render(100, 1920, 1080, "balanced"),
+                               throughput._DEFAULT_STARTUP_SECONDS +
+                               100 * 1920 * 1080 / float(throughput._DEFAULT_PIXELS_PER_SECOND))
+        self.assertAlmostEqual(model.estimate_upload(throughput._DEFAULT_UPLOAD_BYTES_PER_SECOND * 3), 3.0)
+        self.assertAlmostEqual(model.estimate_movie_size(10, 100, 100, "balanced"),
+                               10 * 100 * 100 * throughput._DEFAULT_BYTES_PER_PIXEL)
+
+    def test_render_measurements(self):
+        model = throughput.ThroughputModel(self.path)
+        model.record_render(1920, 1080, "balanced", 100, 10.0, 5.0, movie_size=100 * 1920 * 1080)
+        # the first measurement is taken as it is
+        self.assertAlmostEqual(model.estimate_render(50, 1920, 1080, "balanced"), 5.0 + 5.0)
+        self.assertAlmostEqual(model.estimate_movie_size(50, 1920, 1080, "balanced"), 50 * 1920 * 1080)
+
+        # later ones are folded into the moving average
+        model.record_render(1920, 1080, "balanced", 100, 20.0, 5.0)
+        fps = 10.0 + throughput._SMOOTHING * (5.0 - 10.0)
+        self.assertAlmostEqual(model.estimate_render(100, 1920, 1080, "balanced"), 5.0 + 100 / fps)
+
+    def test_unmeasured_resolution_uses_pixel_rate(self):
+        model = throughput.ThroughputModel(self.path)
+        model.record_render(1000, 1000, "speed", 10, 1.0, 2.0)
+        self.assertAlmostEqual(model.estimate_render(10, 2000, 1000, "speed"), 2.0 + 2.0)
+        # other profiles aren't affected
+        self.assertAlmostEqual(model.estimate_render(10, 1000, 1000, "balanced"),
+                               2.0 + 10 * 1000 * 1000 / float(throughput._DEFAULT_PIXELS_PER_SECOND))
+
+    def test_empty_measurements_are_ignored(self):
+        model = throughput.ThroughputModel(self.path)
+        model.record_render(1920, 1080, "balanced", 0, 10.0, 5.0)
+        model.record_upload(100, 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_persisted(self):
+        throughput.ThroughputModel(self.path).record_upload(1000, 2.0)
+        self.assertAlmostEqual(throughput.ThroughputModel(self.path).estimate_upload(1000), 2.0)
+
+    def test_corrupt_file(self):
+        with open(self.path, "w") as stats_file:
+            stats_file.write("{")
+        self.assertAlmostEqual(throughput.ThroughputModel(self.path).estimate_upload(
+            throughput._DEFAULT_UPLOAD_BYTES_PER_SECOND), 1.0)
+
+
+class RenderEtaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = throughput.time
+        throughput.time = self.clock
+
+    def tearDown(self):
+        throughput.time = self._time
+
+    def test_model_estimate_before_frames(self):
+        eta = throughput.RenderEta(100, 60.0)
+        self.clock.now += 15
+        self.assertAlmostEqual(eta.get_seconds_left(), 45.0)
+        self.assertAlmostEqual(eta.get_percent_done(), 25.0)
+        # the estimate ran out but the render goes on
+        self.clock.now += 60
+        self.assertEqual(eta.get_seconds_left(), 0.0)
+
+    def test_measured_frame_rate(self):
+        eta = throughput.RenderEta(20, 1000.0)
+        self.clock.now += 10
+        for _ in range(throughput._MIN_OBSERVED_FRAMES + 2):
+            eta.frame_rendered()
+            self.clock.now += 0.5
+        frames_left = 20 - (throughput._MIN_OBSERVED_FRAMES + 2)
+        self.assertAlmostEqual(eta.get_seconds_left(), frames_left * 0.5)
+
+    def test_messages_are_rate_limited(self):
+        eta = throughput.RenderEta(10, 10.0)
+        eta.frame_rendered()
+        self.assertTrue(eta.get_message().startswith("Rendered 1 of 10 frames"))
+        self.assertEqual(eta.get_message(), None)
+        self.clock.now += throughput._REPORT_INTERVAL
+        self.assertNotEqual(eta.get_message(), None)
+
+
+class ProgressTest(unittest.TestCase):
+
+    def test_steps_follow_estimates(self):
+        self.assertEqual(throughput.get_progress_steps({"render": 30.0, "upload": 10.0}), (10, 74, 95))
+        self.assertEqual(throughput.get_progress_steps({"render": 30.0, "upload": 0.0}), (10, 95, 95))
+        self.assertEqual(throughput.get_progress_steps({"render": 0.0, "upload": 0.0}), (10, 95, 95))
+
+    def test_scaled_progress(self):
+        reports = []
+
+        def progress_cb(percent=None, msg=None, stage=None):
+            reports.append((percent, msg))
+
+        scaled = throughput.scale_progress(progress_cb, 20, 60)
+        scaled(0, "start")
+        scaled(percent=50.0, msg="half", stage={})
+        scaled(msg="no percentage")
+        self.assertEqual(reports, [(20, "start"), (40.0, "half"), (None, "no percentage")])
+
+
+class OrderSubmissionsTest(unittest.TestCase):
+
+    def test_longest_first(self):
+        app = app_module.MultiReviewSubmissionApp.__new__(app_module.MultiReviewSubmissionApp)
+        app.estimate_submission = lambda first_frame, last_frame: {"render": last_frame - first_frame,
+                                                                   "upload": 1.0}
+        submissions = [{"name": "short", "first_frame": 1, "last_frame": 10},
+                       {"name": "long", "first_frame": 1, "last_frame": 100},
+                       {"name": "medium", "first_frame": 1, "last_frame": 50}]
+        self.assertEqual([submission["name"] for submission in app.order_submissions(submissions)],
+                         ["long", "medium", "short"])
+        # the submissions given are left as they are
+        self.assertEqual(submissions[0]["name"], "short")
+
+
+if __name__ == "__main__":
+    unittest.main()
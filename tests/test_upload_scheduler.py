@@ -0,0 +1,225 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import fakes
+
+fakes.install()
+
+from tk_multi_reviewsubmission import multipart, upload_scheduler
+
+
+class FakeClock(object):
+    """
+    Stands in for the time module of the scheduler, sleeping only advances the clock.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ThrottledError(Exception):
+    code = 429
+
+
+class FakeClockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.slot_folder = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self._time = upload_scheduler.time
+        upload_scheduler.time = self.clock
+
+    def tearDown(self):
+        upload_scheduler.time = self._time
+        shutil.rmtree(self.slot_folder, ignore_errors=True)
+
+
+class TokenBucketTest(FakeClockTestCase):
+
+    def test_rate_is_enforced(self):
+        scheduler = upload_scheduler.UploadScheduler(1000, 1, self.slot_folder)
+        for _ in range(10):
+            scheduler.throttle(500)
+        self.assertAlmostEqual(self.clock.now - 1000.0, 5.0)
+
+    def test_burst_is_bounded(self):
+        scheduler = upload_scheduler.UploadScheduler(1000, 1, self.slot_folder)
+        # a long idle time only allows a second worth of data to go out at once
+        self.clock.now += 60
+        scheduler.throttle(1000)
+        self.assertEqual(self.clock.sleeps, [])
+        scheduler.throttle(1000)
+        self.assertAlmostEqual(sum(self.clock.sleeps), 1.0)
+
+    def test_no_limit(self):
+        scheduler = upload_scheduler.UploadScheduler(0, 1, self.slot_folder)
+        scheduler.throttle(10 ** 9)
+        self.assertEqual(self.clock.sleeps, [])
+
+
+class BackoffTest(FakeClockTestCase):
+
+    def setUp(self):
+        FakeClockTestCase.setUp(self)
+        self.scheduler = upload_scheduler.UploadScheduler(0, 1, self.slot_folder)
+        self.attempts = 0
+
+    def _request(self, failures, error=ThrottledError):
+        self.attempts += 1
+        if self.attempts <= failures:
+            raise error("throttled")
+        return "done"
+
+    def test_throttled_requests_are_retried(self):
+        self.assertEqual(self.scheduler.call(0, self._request, 2), "done")
+        self.assertEqual(self.attempts, 3)
+        self.assertEqual(self.clock.sleeps, [upload_scheduler._INITIAL_BACKOFF,
+                                             upload_scheduler._INITIAL_BACKOFF * 2])
+        # halved twice, then recovering by a step
+        self.assertAlmostEqual(self.scheduler._rate_factor, 0.35)
+
+    def test_service_unavailable_in_message(self):
+        def request():
+            self.attempts += 1
+            if self.attempts == 1:
+                raise IOError("HTTP Error 503: Service Unavailable")
+            return "done"
+        self.assertEqual(self.scheduler.call(0, request), "done")
+        self.assertEqual(self.attempts, 2)
+
+    def test_other_errors_are_raised(self):
+        self.assertRaises(ValueError, self.scheduler.call, 0, self._request, 1, ValueError)
+        self.assertEqual(self.attempts, 1)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_gives_up(self):
+        self.assertRaises(ThrottledError, self.scheduler.call, 0, self._request, upload_scheduler._MAX_RETRIES + 1)
+        self.assertEqual(self.attempts, upload_scheduler._MAX_RETRIES + 1)
+
+
+class PriorityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.slot_folder = tempfile.mkdtemp()
+        self.scheduler = upload_scheduler.UploadScheduler(0, 1, self.slot_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.slot_folder, ignore_errors=True)
+
+    def test_thumbnails_go_first(self):
+        order = []
+
+        def upload(name, priority):
+            with self.scheduler.upload_slot(priority):
+                order.append(name)
+
+        threads = []
+        with self.scheduler.upload_slot():
+            for name, priority in (("movie", upload_scheduler.PRIORITY_MOVIE),
+                                   ("thumbnail", upload_scheduler.PRIORITY_THUMBNAIL)):
+                thread = threading.Thread(target=upload, args=(name, priority))
+                thread.start()
+                threads.append(thread)
+                while len(self.scheduler._waiting) < len(threads):
+                    time.sleep(0.01)
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(order, ["thumbnail", "movie"])
+
+    @unittest.skipIf(upload_scheduler.fcntl is None, "no host wide upload slots on this platform")
+    def test_waiting_upload_of_another_process_goes_first(self):
+        # a thumbnail of another process is waiting for a slot
+        waiting_path = os.path.join(self.slot_folder, "waiting_%d_1_0.lock" % upload_scheduler.PRIORITY_THUMBNAIL)
+        waiting_file = open(waiting_path, "a")
+        upload_scheduler.fcntl.flock(waiting_file, upload_scheduler.fcntl.LOCK_EX)
+        self.assertTrue(self.scheduler._is_waiting_ahead(upload_scheduler.PRIORITY_MOVIE))
+        self.assertFalse(self.scheduler._is_waiting_ahead(upload_scheduler.PRIORITY_THUMBNAIL))
+
+        # the marker of a process which died is cleaned up
+        waiting_file.close()
+        self.assertFalse(self.scheduler._is_waiting_ahead(upload_scheduler.PRIORITY_MOVIE))
+        self.assertFalse(os.path.exists(waiting_path))
+
+    @unittest.skipIf(upload_scheduler.fcntl is None, "no host wide upload slots on this platform")
+    def test_waiting_marker_is_removed(self):
+        with self.scheduler.upload_slot(upload_scheduler.PRIORITY_THUMBNAIL):
+            pass
+        self.assertEqual([name for name in os.listdir(self.slot_folder) if name.startswith("waiting_")], [])
+
+
+class FormBodyTest(unittest.TestCase):
+
+    def test_body_is_metered_as_it_is_read(self):
+        file_handle, path = tempfile.mkstemp(suffix=".mov")
+        os.write(file_handle, "x" * 100000)
+        os.close(file_handle)
+        blocks = []
+        try:
+            body = multipart._FormBody({"entity_type": "Version", "entity_id": 12}, "file", path, blocks.append)
+            data = ""
+            while True:
+                block = body.read(8192)
+                if not block:
+                    break
+                data += block
+            body.close()
+        finally:
+            os.remove(path)
+
+        self.assertEqual(len(data), len(body))
+        self.assertEqual(sum(blocks), len(body))
+        self.assertTrue(max(blocks) <= 8192)
+        self.assertIn('name="entity_id"\r\n\r\n12\r\n', data)
+        self.assertIn('filename="%s"' % os.path.basename(path), data)
+        self.assertTrue(data.endswith("--\r\n"))
+
+
+@unittest.skipIf(upload_scheduler.fcntl is None, "no host wide upload slots on this platform")
+class HostSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.slot_folder = tempfile.mkdtemp()
+        self.scheduler = upload_scheduler.UploadScheduler(0, 1, self.slot_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.slot_folder, ignore_errors=True)
+
+    def test_slot_is_not_inherited(self):
+        with self.scheduler.upload_slot():
+            # a render started while the slot is held, which outlives the upload
+            render = subprocess.Popen([sys.executable, "-c", "import sys; sys.stdin.read()"],
+                                      stdin=subprocess.PIPE, close_fds=False)
+        try:
+            with open(self.scheduler._slot_paths()[0], "a") as slot_file:
+                # raises IOError if the render still holds the slot
+                upload_scheduler.fcntl.flock(slot_file, upload_scheduler.fcntl.LOCK_EX |
+                                             upload_scheduler.fcntl.LOCK_NB)
+        finally:
+            render.communicate()
+
+
+if __name__ == "__main__":
+    unittest.main()